@@ -1,7 +1,6 @@
 from dotenv import load_dotenv
 import os
 import discord
-import anthropic
 import json
 import datetime
 import time
@@ -10,11 +9,19 @@ import re
 import subprocess
 import importlib.util
 import sys
+import atexit
+import copy
+from collections import deque
+import vinalog
+import vinarules
+import vinallm
+import vinamemory
+import vinabudget
+import vinadispatch
 
 # ─────────────── 기본 설정 ────────────────
 load_dotenv()
 
-claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 DISCORD_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
 intents = discord.Intents.default()
@@ -25,9 +32,79 @@ JSONL_LOG_PATH = "vina_memory/logs/vina_history.jsonl"
 EXPLICIT_RULES_PATH = "vina_memory/explicit_rules.json"
 CONTEXTUAL_RULES_PATH = "vina_memory/contextual_rules.md"
 FACTS_PATH = "vina_memory/facts.md"
-
-# 마지막 메시지 시간 추적 (단순화)
-last_message_time = None
+RULE_STATE_PATH = "vina_memory/rule_state.json"
+ACTIVITY_PATH = "vina_memory/activity.json"
+
+# 메인 채팅 채널 (규칙에 channel이 없으면 이 채널로 보냄)
+MAIN_CHANNEL_ID = os.getenv("VINA_MAIN_CHANNEL_ID", "1355113753427054806")
+
+# 대화에 응답할 채널 목록 (쉼표로 구분, 기본값은 메인 채널)
+CHAT_CHANNEL_IDS = {channel_id.strip() for channel_id in os.getenv("VINA_CHAT_CHANNELS", MAIN_CHANNEL_ID).split(",") if channel_id.strip()}
+
+# 대화 기록 저장소 (VINA_HISTORY_BACKEND 환경 변수로 jsonl/sqlite 선택)
+history_store = vinalog.get_history_store()
+
+# 대화 기록을 모아서 이벤트 루프 밖에서 기록하는 로그 기록기 (종료 시 남은 기록 저장)
+history_writer = vinalog.BufferedHistoryWriter(history_store)
+atexit.register(history_writer.close)
+
+# 채널별로 메모리에 보관할 최근 메시지 수
+HISTORY_CACHE_SIZE = int(os.getenv("VINA_HISTORY_CACHE_SIZE", "50"))
+
+# 채널별/사용자별 마지막 메시지 시간 (경과 시간 조건과 대화 공백 구간의 기준, 종료 시 저장)
+activity = vinarules.ActivityTracker(ACTIVITY_PATH, MAIN_CHANNEL_ID)
+atexit.register(activity.save)
+
+# 채널별 최근 대화 캐시 (channel -> deque)
+recent_history_cache = {}
+history_cache_loaded = False
+
+# 규칙 스케줄러 (다음 실행 시각 힙) 및 재계산 요청 이벤트
+RULE_SCHEDULER_MAX_SLEEP = float(os.getenv("VINA_RULE_MAX_SLEEP", "600"))
+# 규칙 실행 상태(다음 실행 예정 포함)와 채널별 활동 기록을 파일에 저장하는 최소 간격 (초, 메시지마다 파일을 쓰지 않도록)
+STATE_SAVE_INTERVAL = float(os.getenv("VINA_STATE_SAVE_INTERVAL", "60"))
+# 규칙 메시지 생성/전송에 실패했을 때 다시 시도하기까지 대기 시간 (초)
+RULE_RETRY_DELAY = float(os.getenv("VINA_RULE_RETRY_DELAY", "60"))
+rule_state = vinarules.RuleStateStore(RULE_STATE_PATH)
+atexit.register(rule_state.save)
+rule_scheduler = vinarules.RuleScheduler(rule_state)
+rule_schedule_changed = asyncio.Event()
+rule_check_task = None
+
+# 스트리밍 응답 설정 (첫 조각을 바로 보내고 일정 간격으로 메시지 수정)
+STREAM_REPLIES = os.getenv("VINA_STREAM_REPLIES", "0") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("VINA_STREAM_EDIT_INTERVAL", "1.0"))
+DISCORD_MESSAGE_LIMIT = 1900
+
+# 디스코드 전송기 (긴 내용 나누기, 수정 합치기, 채널별/전체 속도 제한)
+outbound = vinadispatch.OutboundSender(message_limit=DISCORD_MESSAGE_LIMIT)
+
+# 연달아 보낸 메시지를 합쳐서 한 번에 응답 (마지막 메시지 이후 기다릴 시간, 0이면 메시지마다 바로 응답)
+COALESCE_WINDOW = float(os.getenv("VINA_COALESCE_WINDOW", "1.5"))
+
+# 채널별 작업 큐 (채널 안에서는 순서대로, 채널 간에는 최대 N개 동시 처리, 한가한 채널 작업자는 정리)
+channel_dispatcher = vinadispatch.ChannelDispatcher(
+    max_concurrency=int(os.getenv("VINA_CHANNEL_CONCURRENCY", "4")),
+    idle_timeout=float(os.getenv("VINA_CHANNEL_IDLE_TIMEOUT", "300"))
+)
+
+# 메모리 분석 작업 큐 (응답 생성과 분리해서 백그라운드에서 순서대로 처리)
+memory_job_queue = asyncio.Queue()
+memory_worker_task = None
+memory_job_stats = {"queued": 0, "done": 0, "failed": 0}
+
+# 메모리 분석 묶음 처리 (메시지를 모았다가 한 번에 분석, VINA_MEMORY_BATCH=1일 때)
+MEMORY_BATCH_ENABLED = os.getenv("VINA_MEMORY_BATCH", "0") == "1"
+memory_batcher = vinamemory.MemoryBatcher(
+    max_messages=int(os.getenv("VINA_MEMORY_BATCH_SIZE", "10")),
+    idle_seconds=float(os.getenv("VINA_MEMORY_BATCH_IDLE", "120"))
+) if MEMORY_BATCH_ENABLED else None
+
+# 메모리 분석 사전 필터 (기억할 정보가 있을 수 없는 메시지는 분석 생략)
+memory_prefilter = vinamemory.MemoryPrefilter(enabled=os.getenv("VINA_MEMORY_PREFILTER", "1") != "0")
+
+# 메모리 파일 캐시 ((path, parser) -> {"mtime": ..., "size": ..., "value": ...})
+memory_file_cache = {}
 
 # ───── 시스템 프롬프트 불러오기 ─────
 def load_prompt(path):
@@ -54,7 +131,6 @@ context_prompt = load_prompt("vina_config/system_prompt_context.txt")
 # ───── 로그 저장 함수 (한 줄씩) ─────
 def save_conversation_to_jsonl(channel, name, msg, is_ai=False):
     now = datetime.datetime.now().isoformat(timespec="seconds")
-    os.makedirs(os.path.dirname(JSONL_LOG_PATH), exist_ok=True)
 
     role = "assistant" if is_ai else "user"
     data = {
@@ -65,43 +141,81 @@ def save_conversation_to_jsonl(channel, name, msg, is_ai=False):
         "time": now
     }
 
-    with open(JSONL_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(data, ensure_ascii=False) + "\n")
+    history_writer.submit(data)
     
-    # 마지막 메시지 시간 업데이트 (단순화)
-    global last_message_time
-    last_message_time = now
-    print(f"🔄 마지막 메시지 시간 업데이트: {now}")
-
-# ───── 최근 대화 불러오기 ─────
-def load_recent_messages(channel, user_name=None, limit=5):
-    messages = []
-    if not os.path.exists(JSONL_LOG_PATH):
-        return []
+    # 최근 대화 캐시에 추가 (캐시 준비 전이면 시작 시 파일에서 함께 로드됨)
+    if history_cache_loaded:
+        remember_recent_message(data)
+    
+    # 채널별 마지막 메시지 시간 업데이트
+    activity.record(channel, now, None if is_ai else name)
+    print(f"🔄 마지막 메시지 시간 업데이트: {channel} {now}")
+    
+    # 경과 시간 조건의 실행 시각이 바뀌므로 스케줄 재계산
+    request_rule_reschedule()
 
+# ───── 최근 대화 캐시 ─────
+def remember_recent_message(msg):
+    """메시지를 채널별 최근 대화 캐시에 추가 (오래된 메시지는 자동으로 밀려남)"""
+    if msg.get("role") not in ["user", "assistant"]:
+        return
+    channel = msg.get("channel")
+    history = recent_history_cache.get(channel)
+    if history is None:
+        history = deque(maxlen=HISTORY_CACHE_SIZE)
+        recent_history_cache[channel] = history
+    history.append(msg)
+
+def seed_history_cache():
+    """시작 시 한 번 로그 파일 끝부분을 읽어 채널별 최근 대화 캐시를 채움"""
+    global history_cache_loaded
+    if history_cache_loaded:
+        return
+    history_cache_loaded = True
+    
     try:
-        # 파일에서 모든 관련 메시지 읽기
-        with open(JSONL_LOG_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    msg = json.loads(line)
-                    if msg.get("channel") == channel and msg.get("role") in ["user", "assistant"]:
-                        # 사용자 이름이 지정된 경우, 해당 사용자나 AI만 포함
-                        if user_name is None or msg["role"] == "assistant" or msg.get("name") == user_name:
-                            messages.append(msg)
-                except json.JSONDecodeError:
-                    continue
-        
-        # 디버깅 정보
-        print(f"📄 채널 '{channel}'에서 {len(messages)}개 메시지 로드됨")
-        
-        # 가장 최근 메시지 limit개를 반환
-        return messages[-limit:] if messages else []
+        tail = history_store.load_tail(HISTORY_CACHE_SIZE, roles=["user", "assistant"])
+        for records in tail.values():
+            for msg in records:
+                remember_recent_message(msg)
+        
+        total = sum(len(history) for history in recent_history_cache.values())
+        print(f"📄 최근 대화 캐시 로드 완료: {len(recent_history_cache)}개 채널, {total}개 메시지")
+        
+        # 캐시에서 채널별 마지막 메시지 시간 복원 (저장된 활동 기록보다 새로운 경우만 반영)
+        # 채널 이름으로 저장된 예전 기록은 현재 보이는 채널의 ID로 변환
+        channel_names = {channel.name: str(channel.id) for channel in discord_client.get_all_channels()}
+        skipped = activity.seed([m for history in recent_history_cache.values() for m in history], channel_names)
+        if skipped:
+            print(f"⚠️ 채널 ID를 알 수 없는 예전 기록 {skipped}개는 활동 시간 복원에서 제외")
     except Exception as e:
-        print(f"❌ 메시지 로드 중 오류: {e}")
+        print(f"❌ 최근 대화 캐시 로드 중 오류: {e}")
         import traceback
         traceback.print_exc()
-        return []
+
+# ───── 최근 대화 불러오기 ─────
+def load_recent_messages(channel, user_name=None, limit=5):
+    seed_history_cache()
+    
+    history = recent_history_cache.get(channel)
+    if not history:
+        # 캐시에 없는 채널은 저장소에서 직접 조회
+        messages = history_store.load_recent(channel, user_name, limit)
+        print(f"📄 채널 '{channel}'에서 {len(messages)}개 메시지 로드됨 (저장소)")
+        return messages
+    
+    # 캐시의 최신 메시지부터 거꾸로 훑으며 limit개까지만 수집
+    messages = []
+    for msg in reversed(history):
+        # 사용자 이름이 지정된 경우, 해당 사용자나 AI만 포함
+        if user_name is None or msg["role"] == "assistant" or msg.get("name") == user_name:
+            messages.append(msg)
+            if len(messages) >= limit:
+                break
+    
+    messages.reverse()
+    print(f"📄 채널 '{channel}'에서 {len(messages)}개 메시지 로드됨 (캐시)")
+    return messages
 
 # ───── Claude용 포맷 압축 ─────
 def format_history_for_prompt(messages):
@@ -111,27 +225,71 @@ def format_history_for_prompt(messages):
         lines.append(f"- {speaker}: {m['content']}")
     return "\n".join(lines)
 
+# ───── 메모리 파일 캐시 ─────
+def load_cached_file(path, parser):
+    """
+    파일을 읽어 parser로 변환한 결과를 캐시하고, 파일의 수정 시각과 크기가
+    바뀌었을 때만 다시 읽습니다.
+    
+    Args:
+        path: 파일 경로 (없으면 FileNotFoundError)
+        parser: 파일 내용(str)을 받아 캐시할 값을 반환하는 함수
+    
+    Returns:
+        (값, 새로 읽었는지 여부) 튜플
+    """
+    stat = os.stat(path)
+    key = (path, parser)
+    entry = memory_file_cache.get(key)
+    if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["value"], False
+    
+    with open(path, "r", encoding="utf-8") as f:
+        value = parser(f.read())
+    
+    memory_file_cache[key] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "value": value}
+    return value, True
+
+def invalidate_memory_file(path=None):
+    """메모리 파일 캐시 무효화 (path가 없으면 전체)"""
+    if path is None:
+        memory_file_cache.clear()
+        return
+    for key in [key for key in memory_file_cache if key[0] == path]:
+        del memory_file_cache[key]
+
+def write_memory_file(path, content):
+    """메모리 파일을 저장하고 캐시를 무효화"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    invalidate_memory_file(path)
+
+def save_explicit_rules(rules):
+    """명시적 규칙 목록을 explicit_rules.json에 저장"""
+    write_memory_file(EXPLICIT_RULES_PATH, json.dumps(rules, ensure_ascii=False, indent=2))
+    request_rule_reschedule()
+
 # ───── 명시적 규칙 로딩 ─────
 def load_explicit_rules():
     try:
-        print(f"📝 명시적 규칙 파일 로딩: {EXPLICIT_RULES_PATH}")
-        
         if not os.path.exists(EXPLICIT_RULES_PATH):
             print(f"❌ 규칙 파일이 존재하지 않음: {EXPLICIT_RULES_PATH}")
             return []
-            
-        with open(EXPLICIT_RULES_PATH, "r", encoding="utf-8") as f:
-            rules = json.load(f)
-            print(f"✅ 규칙 파일 로딩 성공: {len(rules)}개 규칙 로드됨")
-            
-            # 규칙 요약 출력
+        
+        rules, reloaded = load_cached_file(EXPLICIT_RULES_PATH, json.loads)
+        
+        # 파일이 바뀌어 새로 읽었을 때만 규칙 요약 출력
+        if reloaded:
+            print(f"✅ 규칙 파일 로딩 성공: {EXPLICIT_RULES_PATH} ({len(rules)}개 규칙 로드됨)")
             for idx, rule in enumerate(rules):
                 rule_id = rule.get("id", "알 수 없음")
                 active = "활성" if rule.get("active", False) else "비활성"
                 conditions = ", ".join(rule.get("condition_tags", []))
                 print(f"  [{idx+1}] {rule_id} ({active}): {conditions}")
-                
-            return rules
+        
+        # 호출하는 쪽에서 규칙을 수정해도 캐시가 바뀌지 않도록 복사본 반환
+        return copy.deepcopy(rules)
     except json.JSONDecodeError as e:
         print(f"❌ 규칙 파일 JSON 파싱 오류: {e}")
         print(f"📄 파일 내용 확인:")
@@ -148,11 +306,32 @@ def load_explicit_rules():
         traceback.print_exc()
         return []
 
+# ───── 컴파일된 규칙 로딩 ─────
+def compile_explicit_rules(content):
+    """explicit_rules.json 내용을 컴파일된 규칙 목록으로 변환"""
+    compiled = vinarules.compile_rules(json.loads(content))
+    print(f"🧩 규칙 컴파일 완료: {len(compiled)}개 규칙")
+    for compiled_rule in compiled:
+        if compiled_rule.unknown_tags:
+            print(f"  ❗ 규칙 '{compiled_rule.id}'의 알 수 없는 조건 태그: {', '.join(compiled_rule.unknown_tags)}")
+    return compiled
+
+def load_compiled_rules():
+    """컴파일된 명시적 규칙 목록 반환 (규칙 파일이 바뀔 때만 다시 컴파일)"""
+    try:
+        if not os.path.exists(EXPLICIT_RULES_PATH):
+            return []
+        compiled, _ = load_cached_file(EXPLICIT_RULES_PATH, compile_explicit_rules)
+        return compiled
+    except Exception as e:
+        print(f"❌ 규칙 컴파일 오류: {e}")
+        return []
+
 # ───── 마크다운 파일 로딩 ─────
 def load_markdown_file(path):
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
+        content, _ = load_cached_file(path, str)
+        return content
     except Exception as e:
         print(f"마크다운 로딩 오류: {path} - {e}")
         return ""
@@ -174,10 +353,17 @@ def get_explicit_rule_format_guide():
   ],
   "condition_description": "조건 설명",  // 조건에 대한 설명
   "action_description": "행동 설명",    // 실행할 행동 설명
-  "active": true         // 활성화 여부 (true/false)
+  "active": true,        // 활성화 여부 (true/false)
+  "cooldown": 3600,      // (선택) 다시 실행되기까지 최소 대기 시간 (초)
+  "once_per_idle": true, // (선택) 마지막 사용자 메시지 이후 한 번만 실행
+  "channel": "채널 ID",   // (선택) 메시지를 보낼 채널 (없으면 메인 채널)
+  "scope": "channel"     // (선택) 경과 시간 기준: channel, global, user:이름
 }}
 ```
 
+`last_message_elapsed` 조건이 있는 규칙은 `once_per_idle`의 기본값이 true라서, 사용자가 다시 말할 때까지 한 번만 실행됩니다.
+경과 시간은 기본적으로 규칙의 대상 채널 기준으로 계산하며, `scope`가 `global`이면 모든 채널, `user:이름`이면 해당 사용자의 마지막 메시지 기준입니다.
+
 **유효한 조건 태그 형식:**
 1. `time==HH:MM` - 특정 시간에 실행 (예: 08:00)
    - 24시간 형식으로 표기 (00:00 ~ 23:59)
@@ -226,120 +412,54 @@ def get_explicit_rule_format_guide():
 """
 
 # ───── 규칙 조건 평가 ─────
-def evaluate_rule_condition(condition_tag):
-    global last_message_time
+def evaluate_rule_condition(condition_tag, channel_id=None):
+    """조건 태그 하나를 컴파일해서 현재 시점에 평가 (진단/시뮬레이션용, 기본은 메인 채널 기준)"""
     now = datetime.datetime.now()
-    
-    # 디버깅: 조건 태그 출력
-    print(f"🔍 조건 평가: {condition_tag}")
-    
-    # 시간 조건 (time==HH:MM)
-    time_match = re.match(r"time==(\d{2}):(\d{2})", condition_tag)
-    if time_match:
-        hour, minute = map(int, time_match.groups())
-        current_hour, current_minute = now.hour, now.minute
-        result = current_hour == hour and current_minute == minute
-        print(f"  ⏰ 시간 조건: 현재={current_hour}:{current_minute}, 목표={hour}:{minute}, 결과={result}")
-        return result
-    
-    # 마지막 메시지로부터 경과 시간 (last_message_elapsed>초)
-    elapsed_match = re.match(r"last_message_elapsed>(\d+)", condition_tag)
-    if elapsed_match:
-        seconds = int(elapsed_match.group(1))
-        print(f"  ⏱️ 경과 시간 조건: 목표 경과 시간 > {seconds}초")
-        
-        if not last_message_time:
-            print(f"  ⚠️ 마지막 메시지 시간이 없습니다.")
-            return False
-        
-        try:
-            last_dt = datetime.datetime.fromisoformat(last_message_time)
-            elapsed = (now - last_dt).total_seconds()
-            elapsed_mins = elapsed / 60
-            elapsed_hours = elapsed_mins / 60
-            
-            result = elapsed > seconds
-            print(f"  ⏱️ 마지막 메시지 시간: {last_message_time}")
-            print(f"     ├─ 현재 시간: {now.isoformat()}")
-            print(f"     ├─ 경과: {elapsed:.1f}초 ({elapsed_mins:.1f}분, {elapsed_hours:.2f}시간)")
-            print(f"     ├─ 목표: {seconds}초")
-            print(f"     └─ 결과: {'✅ 충족' if result else '❌ 불충족'}")
-            
-            return result
-        except Exception as e:
-            print(f"  ❌ 경과 시간 계산 오류: {e}")
-            return False
-    
-    # 요일 조건 (weekday==1-5) : 1(월요일)~7(일요일)
-    weekday_match = re.match(r"weekday==(\d)-(\d)", condition_tag)
-    if weekday_match:
-        start_day, end_day = map(int, weekday_match.groups())
-        current_weekday = now.isoweekday()  # 1(월요일)~7(일요일)
-        result = start_day <= current_weekday <= end_day
-        print(f"  📅 요일 조건: 현재={current_weekday}, 범위={start_day}-{end_day}, 결과={result}")
-        return result
-    
-    print(f"  ❗ 알 수 없는 조건 태그: {condition_tag}")
-    return False
+    condition = vinarules.compile_condition(condition_tag)
+    last_dt = activity.last_message(channel_id or MAIN_CHANNEL_ID)
+    result = condition.evaluate(now, last_dt)
+    print(f"🔍 조건 평가: {condition_tag} → {condition.describe(now, last_dt)}, 결과={result}")
+    return result
 
 # ───── 규칙 조건 확인 ─────
 def check_rule_conditions():
-    global last_message_time
-    rules = load_explicit_rules()
+    now = datetime.datetime.now()
     triggered_rules = []
     
-    print(f"\n📋 규칙 점검 시작: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"📊 규칙 수: {len(rules)}")
-    if last_message_time:
-        print(f"⏱️ 마지막 메시지 시간: {last_message_time}")
-    else:
-        print(f"⚠️ 마지막 메시지 시간이 없습니다.")
-    
-    for rule in rules:
-        rule_id = rule.get("id", "알 수 없음")
-        rule_active = rule.get("active", False)
-        print(f"\n🔖 규칙 '{rule_id}' 검사 (활성화: {rule_active})")
-        
-        if not rule_active:
-            print(f"  ⏭️ 규칙 '{rule_id}'는 비활성화 상태")
-            continue
-        
-        all_conditions_met = True
-        
-        for condition in rule.get("condition_tags", []):
-            print(f"  🔎 조건 '{condition}' 검사 중")
-            result = evaluate_rule_condition(condition)
-            
-            if not result:
-                all_conditions_met = False
-                print(f"  🚫 규칙 '{rule_id}'의 조건 중 하나라도 불충족")
-                break
-            else:
-                print(f"  ✅ 조건 충족")
-        
-        if all_conditions_met:
-            print(f"  🎯 규칙 '{rule_id}' 트리거됨!")
-            triggered_rules.append((rule, None))
-        else:
-            print(f"  ⛔ 규칙 '{rule_id}' 트리거되지 않음")
+    for compiled_rule in load_compiled_rules():
+        last_dt, _ = activity.resolve(compiled_rule)
+        if compiled_rule.evaluate(now, last_dt):
+            print(f"🎯 규칙 '{compiled_rule.id}' 트리거됨 ({now.strftime('%Y-%m-%d %H:%M:%S')})")
+            triggered_rules.append((compiled_rule.rule, None))
     
-    print(f"\n📑 점검 완료: {len(triggered_rules)}개 규칙 트리거됨\n")
     return triggered_rules
 
 # ───── 규칙 기반 자동 메시지 생성 ─────
-async def process_triggered_rules():
-    print(f"\n⚡ 규칙 트리거 처리 시작: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    triggered_rules = check_rule_conditions()
+async def process_triggered_rules(triggered_rules=None):
+    """
+    트리거된 규칙 실행 (triggered_rules가 없으면 모든 규칙을 지금 점검)
+    
+    Returns:
+        메시지 전송까지 성공한 규칙 ID 집합 (실패한 규칙은 실행 기록을 남기지 않고 다시 시도)
+    """
+    handled = set()
+    if triggered_rules is None:
+        triggered_rules = check_rule_conditions()
+    if not triggered_rules:
+        return handled
+    
+    print(f"\n⚡ 규칙 트리거 처리 시작: {len(triggered_rules)}개 규칙")
     
     for rule, _ in triggered_rules:
         try:
-            # 메인 채팅 채널 찾기 (현재 고정된 채널)
-            channel_id = 1355113753427054806  # 메인 채팅 채널 ID
-            channel_obj = discord_client.get_channel(channel_id)
+            # 규칙의 대상 채널 찾기 (지정하지 않았으면 메인 채널)
+            channel_id = str(rule.get("channel") or MAIN_CHANNEL_ID)
+            channel_obj = discord_client.get_channel(int(channel_id))
             
             if channel_obj:
                 print(f"📣 채널 '{channel_obj.name}' (ID: {channel_id})에 규칙 '{rule.get('id')}' 적용")
                 await auto_llm_response(rule, channel_obj)
+                handled.add(rule.get("id"))
             else:
                 print(f"❌ 채널 ID {channel_id}를 찾을 수 없음")
         except Exception as e:
@@ -347,19 +467,56 @@ async def process_triggered_rules():
             import traceback
             traceback.print_exc()
     
-    print(f"⚡ 규칙 트리거 처리 완료\n")
+    print(f"⚡ 규칙 트리거 처리 완료 ({len(handled)}/{len(triggered_rules)}개 성공)\n")
+    return handled
+
+# ───── 고정 프롬프트 앞부분 (캐시 대상) ─────
+def create_memory_prompt_prefix(facts, contextual_rules):
+    """
+    사용자 정보와 행동 규칙으로 이루어진 프롬프트 앞부분.
+    메모리 파일이 바뀌지 않는 한 매번 같은 문자열이므로 프롬프트 캐시가 적중합니다.
+    """
+    return f"""
+# 1. 사용자 기억 정보
+{facts}
+
+# 2. VINA의 행동 규칙
+{contextual_rules}
+"""
+
+def create_prompt_blocks(prefix, body):
+    """고정 앞부분(캐시 지점 표시)과 매번 바뀌는 뒷부분으로 메시지 블록 구성"""
+    return [vinallm.cached_text_block(prefix), vinallm.text_block(body)]
+
+# ───── 프롬프트 토큰 예산 ─────
+# 맥락적 규칙이 예산을 넘을 때 먼저 남길 섹션 (나머지는 파일 순서)
+CONTEXTUAL_RULE_PRIORITY = ("금지 사항", "감정 대응", "상황별 대응 규칙")
+
+def load_budgeted_memory():
+    """토큰 예산에 맞게 줄인 사용자 정보와 맥락적 규칙 (결과는 파일 내용이 같으면 항상 같음)"""
+    facts, dropped_facts = vinabudget.trim_markdown(
+        load_markdown_file(FACTS_PATH), vinabudget.PROMPT_BUDGETS["facts"])
+    contextual_rules, dropped_rules = vinabudget.trim_markdown(
+        load_markdown_file(CONTEXTUAL_RULES_PATH), vinabudget.PROMPT_BUDGETS["rules"], CONTEXTUAL_RULE_PRIORITY)
+    if dropped_facts or dropped_rules:
+        print(f"✂️ 토큰 예산 초과로 제외: 사용자 정보 {dropped_facts}개, 맥락적 규칙 {dropped_rules}개")
+    return facts, contextual_rules
+
+def budget_history(messages):
+    """토큰 예산에 맞게 최근 대화를 최신 메시지 위주로 줄임"""
+    kept = vinabudget.trim_history(messages, vinabudget.PROMPT_BUDGETS["history"], format_history_for_prompt)
+    if len(kept) < len(messages):
+        print(f"✂️ 토큰 예산 초과로 이전 대화 {len(messages) - len(kept)}개 제외")
+    if kept and kept[-1] is not messages[-1]:
+        print(f"✂️ 토큰 예산 초과로 가장 최근 메시지 내용을 잘라서 사용")
+    return kept
 
 # ───── 규칙 트리거 프롬프트 생성 ─────
-def create_rule_trigger_prompt(rule, channel):
-    global last_message_time
-    contextual_rules = load_markdown_file(CONTEXTUAL_RULES_PATH)
-    facts = load_markdown_file(FACTS_PATH)
-    
-    # 채널 ID 가져오기 (규칙 트리거에는 고정된 채널 사용)
-    channel_id = "1355113753427054806"  # 메인 채널 ID
+def create_rule_trigger_prompt(rule, channel_id):
+    facts, contextual_rules = load_budgeted_memory()
     
     # 최근 대화 불러오기 (user_name 지정하지 않고 모든 메시지 로드)
-    recent_messages = load_recent_messages(channel_id, limit=5)
+    recent_messages = budget_history(load_recent_messages(channel_id, limit=5))
     formatted_history = format_history_for_prompt(recent_messages)
     
     now = datetime.datetime.now()
@@ -378,10 +535,10 @@ def create_rule_trigger_prompt(rule, channel):
     else:
         time_of_day = "밤"
     
-    # 마지막 메시지 경과 시간 계산
+    # 규칙을 보낼 채널의 마지막 메시지 경과 시간 계산
     last_elapsed = "없음"
-    if last_message_time:
-        last_dt = datetime.datetime.fromisoformat(last_message_time)
+    last_dt = activity.last_message(channel_id)
+    if last_dt:
         elapsed_seconds = (now - last_dt).total_seconds()
         elapsed_hours = elapsed_seconds / 3600
         last_elapsed = f"{elapsed_hours:.1f}시간"
@@ -389,13 +546,8 @@ def create_rule_trigger_prompt(rule, channel):
     condition = rule.get("condition_description", "")
     action = rule.get("action_description", "")
     
-    return f"""
-# 1. 사용자 기억 정보
-{facts}
-
-# 2. VINA의 행동 규칙
-{contextual_rules}
-
+    prefix = create_memory_prompt_prefix(facts, contextual_rules)
+    body = f"""
 # 3. 상황 맥락
 - 현재 시각: {current_time_str} ({weekday}, {time_of_day})
 - 마지막 대화 이후 경과: {last_elapsed}
@@ -417,12 +569,19 @@ def create_rule_trigger_prompt(rule, channel):
 7. 대화가 어색하지 않게 자연스럽고 친근한 말투로 말하세요.
 8. 메시지를 보내지 않아야 하는 상황(늦은 시간, 대화 필요 없음 등)에는 "/None"만 응답하세요.
 """
+    vinabudget.record_prompt("rule", {"facts": facts, "rules": contextual_rules, "history": formatted_history, "total": prefix + body})
+
+    return {
+        "최근 대화": formatted_history,
+        "트리거 조건": condition,
+        "수행할 행동": action,
+        "프롬프트 블록": create_prompt_blocks(prefix, body),
+        "전체 프롬프트": prefix + body
+    }
 
 # ───── 일반 채팅 프롬프트 생성 ─────
 def create_chat_prompt(channel, user_name, user_msg, recent_messages):
-    global last_message_time
-    contextual_rules = load_markdown_file(CONTEXTUAL_RULES_PATH)
-    facts = load_markdown_file(FACTS_PATH)
+    facts, contextual_rules = load_budgeted_memory()
     
     now = datetime.datetime.now()
     current_time_str = now.strftime("%Y-%m-%d %H:%M:%S")
@@ -442,8 +601,8 @@ def create_chat_prompt(channel, user_name, user_msg, recent_messages):
     
     # 마지막 메시지 경과 시간 계산
     last_elapsed = "없음"
-    if last_message_time:
-        last_dt = datetime.datetime.fromisoformat(last_message_time)
+    last_dt = activity.last_message(channel)
+    if last_dt:
         elapsed_seconds = (now - last_dt).total_seconds()
         elapsed_minutes = elapsed_seconds / 60
         
@@ -454,15 +613,10 @@ def create_chat_prompt(channel, user_name, user_msg, recent_messages):
             last_elapsed = f"{elapsed_hours:.1f}시간"
 
     # 최근 대화 포맷
-    formatted_history = format_history_for_prompt(recent_messages)
+    formatted_history = format_history_for_prompt(budget_history(recent_messages))
     
-    prompt_text = f"""
-# 1. 사용자 기억 정보
-{facts}
-
-# 2. VINA의 행동 규칙
-{contextual_rules}
-
+    prefix = create_memory_prompt_prefix(facts, contextual_rules)
+    body = f"""
 # 3. 상황 맥락
 - 현재 시각: {current_time_str} ({weekday}, {time_of_day})
 - 마지막 대화 이후 경과: {last_elapsed}
@@ -482,6 +636,7 @@ def create_chat_prompt(channel, user_name, user_msg, recent_messages):
 6. 장황한 설명보다는 핵심에 집중한 간결한 답변을 제공하세요.
 7. 친근하고 자연스러운 말투로 대화하세요.
 """
+    vinabudget.record_prompt("chat", {"facts": facts, "rules": contextual_rules, "history": formatted_history, "total": prefix + body})
 
     return {
         "최근 대화": formatted_history,
@@ -489,17 +644,21 @@ def create_chat_prompt(channel, user_name, user_msg, recent_messages):
         "맥락적 규칙": contextual_rules,
         "사용자 정보": facts,
         "상황 정보": f"현재 시간: {current_time_str} ({weekday}, {time_of_day})\n마지막 메시지 경과: {last_elapsed}",
-        "전체 프롬프트": prompt_text
+        "프롬프트 블록": create_prompt_blocks(prefix, body),
+        "전체 프롬프트": prefix + body
     }
 
 # ───── 자동 LLM 호출 응답 ─────
 async def auto_llm_response(rule, channel_obj):
+    # 대화 기록과 활동 시간은 채널 이름이 아닌 채널 ID로 저장
+    channel_id = str(channel_obj.id)
+    
     # 특수 명령어 처리 확인
     if rule.get("id") == "daily_report_generator" and ("/run_report" in rule.get("action_description", "") or rule.get("action_description") == "/run_report"):
         print(f"\n🔔 [규칙 트리거 - {rule.get('name')}] - 리포트 생성 명령 감지됨\n")
         
         # 사용자에게 리포트 생성 시작 메시지 전송
-        await channel_obj.send("📊 오늘의 대화를 기반으로 일일 리포트를 생성하고 있어요. 잠시만 기다려주세요...")
+        outbound.post(channel_obj, "📊 오늘의 대화를 기반으로 일일 리포트를 생성하고 있어요. 잠시만 기다려주세요...")
         
         try:
             # 어제 날짜 (기본값) 대신 오늘 날짜로 리포트 생성 
@@ -519,41 +678,40 @@ async def auto_llm_response(rule, channel_obj):
                 os.system("start run_report.bat")
                 
                 # 성공 메시지
-                await channel_obj.send(f"✅ 일일 리포트 생성이 시작되었습니다. 완료되면 'vina-리포트' 채널에서 확인할 수 있습니다.")
+                outbound.post(channel_obj, f"✅ 일일 리포트 생성이 시작되었습니다. 완료되면 'vina-리포트' 채널에서 확인할 수 있습니다.")
                 
             except Exception as e:
                 print(f"❌ 리포트 실행 오류: {e}")
                 import traceback
                 traceback.print_exc()
-                await channel_obj.send(f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
+                outbound.post(channel_obj, f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
                 
             # 대화 기록에 저장
-            save_conversation_to_jsonl(channel_obj.name, "VINA", "일일 리포트 생성 명령 실행", is_ai=True)
+            save_conversation_to_jsonl(channel_id, "VINA", "일일 리포트 생성 명령 실행", is_ai=True)
             return
         except Exception as e:
             print(f"❌ 리포트 생성 명령 처리 중 오류 발생: {e}")
             import traceback
             traceback.print_exc()
-            await channel_obj.send(f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
+            outbound.post(channel_obj, f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
             return
     
     # 일반 LLM 호출 처리
-    prompt = create_rule_trigger_prompt(rule, channel_obj.name)
+    prompt_data = create_rule_trigger_prompt(rule, channel_id)
     
     print(f"\n🔔 [규칙 트리거 - {rule.get('name')}]\n")
-    print(f"[SYSTEM 프롬프트]\n{prompt[:200]}...\n")
+    print(f"[SYSTEM 프롬프트]\n{prompt_data['전체 프롬프트'][:200]}...\n")
     
-    response = claude_client.messages.create(
+    response = await vinallm.create_message(
+        label="rule",
         model="claude-3-5-haiku-20241022",
         max_tokens=500,
         temperature=1,
-        system=response_prompt,
+        system=vinallm.cached_system(response_prompt),
         messages=[
             {
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt}
-                ]
+                "content": prompt_data["프롬프트 블록"]
             }
         ]
     )
@@ -561,20 +719,85 @@ async def auto_llm_response(rule, channel_obj):
     full_answer = response.content[0].text.strip()
     print(f"[# {channel_obj.name}] 🤖 VINA → {full_answer}")
     
-    # 로그에는 저장하지만 '/None'인 경우 메시지 전송하지 않음
-    save_conversation_to_jsonl(channel_obj.name, "VINA", full_answer, is_ai=True)
-    
-    # '/None' 응답 확인
-    if full_answer == "/None" or full_answer.startswith("/None "):
+    # '/None' 응답은 로그에만 저장하고 메시지 전송하지 않음
+    if vinallm.is_none_reply(full_answer):
         print(f"🚫 '/None' 응답 감지: 메시지를 보내지 않습니다.")
+        save_conversation_to_jsonl(channel_id, "VINA", full_answer, is_ai=True)
         return
     
-    await channel_obj.send(full_answer)
+    # 전송이 끝날 때까지 기다림 (실패하면 예외가 올라가 규칙 실행 기록을 남기지 않음)
+    await outbound.send(channel_obj, full_answer)
+    save_conversation_to_jsonl(channel_id, "VINA", full_answer, is_ai=True)
+
+# ───── 메모리 분석 백그라운드 작업 ─────
+def start_memory_worker():
+    """메모리 분석 작업자 시작 (이미 실행 중이면 유지)"""
+    global memory_worker_task
+    if memory_worker_task is None or memory_worker_task.done():
+        memory_worker_task = asyncio.create_task(memory_analysis_worker())
+
+def enqueue_memory_analysis(user_name, user_msg, channel_id):
+    """메모리 분석을 작업 큐에 넣고 바로 반환 (응답 생성을 기다리게 하지 않음)"""
+    memory_job_queue.put_nowait((user_name, user_msg, channel_id))
+    memory_job_stats["queued"] += 1
+    start_memory_worker()
+
+async def run_memory_analysis(user_name, user_msg, channel_id, batch_messages=None):
+    """메모리 분석 한 건 실행 (오류는 기록만 하고 작업자는 계속 동작)"""
+    try:
+        await analyze_message_for_memory(user_name, user_msg, channel_id, batch_messages=batch_messages)
+        memory_job_stats["done"] += 1
+    except Exception as e:
+        memory_job_stats["failed"] += 1
+        print(f"❌ 백그라운드 메모리 분석 오류: {e}")
+        import traceback
+        traceback.print_exc()
+
+async def run_memory_batch(batch):
+    """모인 메시지 묶음을 한 번의 호출로 분석"""
+    messages = batch["messages"]
+    print(f"📦 메모리 묶음 분석: {batch['user_name']}의 메시지 {len(messages)}개")
+    await run_memory_analysis(batch["user_name"], messages[-1]["content"], batch["channel_id"], batch_messages=messages)
+
+async def memory_analysis_worker():
+    """
+    작업 큐의 메모리 분석을 도착 순서대로 하나씩 처리 (메모리 파일 갱신 순서 보장).
+    묶음 처리 모드에서는 메시지를 모아 두었다가 N개가 모이거나 대화가 잠잠해지면 한 번에 분석합니다.
+    """
+    while True:
+        timeout = memory_batcher.seconds_until_due(datetime.datetime.now()) if memory_batcher else None
+        try:
+            job = await asyncio.wait_for(memory_job_queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            for batch in memory_batcher.pop_due(datetime.datetime.now()):
+                await run_memory_batch(batch)
+            continue
+        
+        try:
+            user_name, user_msg, channel_id = job
+            if memory_batcher:
+                batch = memory_batcher.add(user_name, user_msg, channel_id, datetime.datetime.now())
+                if batch:
+                    await run_memory_batch(batch)
+            else:
+                await run_memory_analysis(user_name, user_msg, channel_id)
+        finally:
+            memory_job_queue.task_done()
 
 # ───── 중요정보 감지 및 메모리 업데이트 ─────
-def analyze_message_for_memory(user_name, user_msg, channel_id):
-    """사용자 메시지에서 중요한 정보를 감지하고 적절한 메모리 파일에 저장"""
-    print(f"\n🔍 메시지 분석 시작: '{user_msg[:30]}...'")
+async def analyze_message_for_memory(user_name, user_msg, channel_id, batch_messages=None):
+    """
+    사용자 메시지에서 중요한 정보를 감지하고 적절한 메모리 파일에 저장
+    (batch_messages가 있으면 여러 메시지를 한 번에 분석해서 합친 결과를 저장)
+    """
+    if batch_messages:
+        print(f"\n🔍 메시지 묶음 분석 시작: {len(batch_messages)}개 메시지")
+        message_section = vinamemory.format_batch_for_analysis(batch_messages)
+        batch_instruction = "\n- 여러 메시지에 걸친 정보는 하나로 합쳐서 중복 없이 정리하세요. 나중 메시지가 앞 메시지와 모순되면 나중 메시지를 따르세요."
+    else:
+        print(f"\n🔍 메시지 분석 시작: '{user_msg[:30]}...'")
+        message_section = f'"{user_msg}"'
+        batch_instruction = ""
     
     # 유효한 조건 태그 패턴 (정규식) 정의
     valid_condition_patterns = [
@@ -630,7 +853,7 @@ def analyze_message_for_memory(user_name, user_msg, channel_id):
 분석 지침: 다음 사용자 메시지에서 기억할 가치가 있는 정보를 식별하여 분류해주세요.
 
 사용자 메시지:
-"{user_msg}"
+{message_section}
 
 다음 카테고리로 분류하세요:
 1. 사용자 사실 정보 (facts.md에 저장): 사용자의 취향, 선호도, 개인 정보, 일상 루틴, 계획 등
@@ -643,7 +866,7 @@ def analyze_message_for_memory(user_name, user_msg, channel_id):
 - 기존 정보와 중복되거나 모순되는 내용은 표시하세요.
 - 정보가 없는 카테고리는 "없음"으로 표시하세요.
 - 확실하지 않은 정보는 포함하지 마세요.
-- 각 추출 항목에 대해 0~100 사이의 자신감 점수(confidence)를 부여하세요.
+- 각 추출 항목에 대해 0~100 사이의 자신감 점수(confidence)를 부여하세요.{batch_instruction}
 
 명시적 규칙 (explicit_rules.json) 생성/수정 시 중요 사항:
 {explicit_rule_format}
@@ -687,9 +910,10 @@ def analyze_message_for_memory(user_name, user_msg, channel_id):
 """
 
     try:
-        response = claude_client.messages.create(
+        response = await vinallm.create_message(
+            label="memory",
             model="claude-3-5-haiku-20241022",
-            max_tokens=500,
+            max_tokens=1000 if batch_messages else 500,
             temperature=0.2,
             system="당신은 텍스트에서 중요한 정보를 식별하고 분류하는 전문가입니다. 사용자가 제공한 텍스트에서 사실 정보, 선호도, 규칙 등을 식별하여 JSON 형식으로 반환하세요. 특히 명시적 규칙을 작성할 때는 지정된 형식만 사용하세요.",
             messages=[
@@ -892,9 +1116,7 @@ def update_facts_file(new_facts):
                 new_content += "\n".join(items) + "\n\n"
         
         # 파일 저장
-        os.makedirs(os.path.dirname(FACTS_PATH), exist_ok=True)
-        with open(FACTS_PATH, "w", encoding="utf-8") as f:
-            f.write(new_content)
+        write_memory_file(FACTS_PATH, new_content)
         
         return 1  # 업데이트 성공
     except Exception as e:
@@ -961,9 +1183,7 @@ def update_contextual_rules_file(new_rules):
                 new_content += "\n".join(items) + "\n\n"
         
         # 파일 저장
-        os.makedirs(os.path.dirname(CONTEXTUAL_RULES_PATH), exist_ok=True)
-        with open(CONTEXTUAL_RULES_PATH, "w", encoding="utf-8") as f:
-            f.write(new_content)
+        write_memory_file(CONTEXTUAL_RULES_PATH, new_content)
         
         return 1  # 업데이트 성공
     except Exception as e:
@@ -1049,9 +1269,7 @@ def update_explicit_rules_file(new_rules):
             current_rules = new_current_rules
         
         # 파일 저장
-        os.makedirs(os.path.dirname(EXPLICIT_RULES_PATH), exist_ok=True)
-        with open(EXPLICIT_RULES_PATH, "w", encoding="utf-8") as f:
-            json.dump(current_rules, f, ensure_ascii=False, indent=2)
+        save_explicit_rules(current_rules)
         
         return 1  # 업데이트 성공
     except Exception as e:
@@ -1084,9 +1302,7 @@ def delete_explicit_rules(rule_ids):
         
         # 변경된 경우에만 파일 업데이트
         if deleted_count > 0:
-            os.makedirs(os.path.dirname(EXPLICIT_RULES_PATH), exist_ok=True)
-            with open(EXPLICIT_RULES_PATH, "w", encoding="utf-8") as f:
-                json.dump(new_rules, f, ensure_ascii=False, indent=2)
+            save_explicit_rules(new_rules)
             
             print(f"✅ {deleted_count}개 규칙 삭제 완료")
             return 1  # 성공적으로 업데이트됨
@@ -1100,24 +1316,56 @@ def delete_explicit_rules(rule_ids):
         return 0
 
 # ───── 메시지 처리 메인 함수 ─────
-async def message_response(input_message):
+async def receive_chat_message(input_message):
+    """대화 메시지를 바로 기록하고, 연달아 오는 메시지는 모아서 한 번에 응답"""
     author = input_message.author.name
     channel = input_message.channel.name
     channel_id = str(input_message.channel.id)  # 채널 ID를 문자열로 저장
-    user_msg = input_message.content
 
-    GREEN = "\033[92m"
     BLUE = "\033[94m"
     RESET = "\033[0m"
 
-    print(f"\n[# {channel} (ID: {channel_id})] {BLUE}{author}{RESET} → {user_msg}")
-    save_conversation_to_jsonl(channel_id, author, user_msg, is_ai=False)  # 채널 ID로 저장
+    # 원래 메시지는 합치지 않고 하나씩 기록
+    print(f"\n[# {channel} (ID: {channel_id})] {BLUE}{author}{RESET} → {input_message.content}")
+    save_conversation_to_jsonl(channel_id, author, input_message.content, is_ai=False)  # 채널 ID로 저장
+
+    if COALESCE_WINDOW > 0:
+        message_coalescer.add(channel_id, input_message)
+    else:
+        await message_response([input_message])
+
+def merge_user_messages(input_messages):
+    """연달아 온 메시지들을 하나의 요청 텍스트로 합침 (여러 사용자가 섞이면 이름 표시)"""
+    if len({m.author.name for m in input_messages}) > 1:
+        return "\n".join(f"{m.author.name}: {m.content}" for m in input_messages)
+    return "\n".join(m.content for m in input_messages)
 
-    # 메시지에서 중요 정보 분석 및 메모리 업데이트
-    memory_analysis = analyze_message_for_memory(author, user_msg, channel_id)
+async def message_response(input_messages):
+    input_message = input_messages[-1]
+    author = input_message.author.name
+    channel = input_message.channel.name
+    channel_id = str(input_message.channel.id)  # 채널 ID를 문자열로 저장
+    user_msg = merge_user_messages(input_messages)
+
+    GREEN = "\033[92m"
+    RESET = "\033[0m"
+
+    if len(input_messages) > 1:
+        print(f"🧩 [# {channel}] 연달아 온 메시지 {len(input_messages)}개를 하나의 요청으로 합침")
+
+    # 메시지에서 중요 정보 분석 및 메모리 업데이트 (백그라운드에서 처리, 사소한 메시지는 생략)
+    # 여러 사용자가 섞인 묶음은 사용자별로 자기 메시지만 모아서 분석 (다른 사람의 말이 잘못 기억되지 않도록)
+    messages_by_author = {}
+    for m in input_messages:
+        messages_by_author.setdefault(m.author.name, []).append(m)
+    for author_name, author_messages in messages_by_author.items():
+        author_msg = "\n".join(m.content for m in author_messages)
+        if memory_prefilter.should_analyze(author_msg):
+            enqueue_memory_analysis(author_name, author_msg, channel_id)
     
-    # 최근 대화 불러오기 (개선된 함수 사용)
-    recent_messages = load_recent_messages(channel_id, author, limit=5)
+    # 최근 대화 불러오기 (여러 사용자가 섞였으면 모든 사용자의 메시지 포함)
+    recent_user = author if len(messages_by_author) == 1 else None
+    recent_messages = load_recent_messages(channel_id, recent_user, limit=5)
     
     # 프롬프트 생성
     prompt_data = create_chat_prompt(channel_id, author, user_msg, recent_messages)
@@ -1127,71 +1375,186 @@ async def message_response(input_message):
     print(f"[최근 대화 메시지 수]: {len(recent_messages)}개")
     print(f"[현재 입력]\n{user_msg}")
 
-    response = claude_client.messages.create(
+    request = dict(
+        label="chat",
         model="claude-3-5-haiku-20241022",
         max_tokens=500,
         temperature=1,
-        system=response_prompt,
+        system=vinallm.cached_system(response_prompt),
         messages=[
             {
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt_data['전체 프롬프트']}
-                ]
+                "content": prompt_data["프롬프트 블록"]
             }
         ]
     )
 
-    full_answer = response.content[0].text.strip()
+    if STREAM_REPLIES:
+        # 생성되는 대로 전송 ('/None' 여부가 확실해질 때까지는 보류)
+        full_answer = await stream_reply(input_message.channel, request)
+    else:
+        response = await vinallm.create_message(**request)
+        full_answer = response.content[0].text.strip()
     print(f"[# {channel}] {GREEN}VINA{RESET} → {full_answer}")
     
     # 로그에는 저장하지만 '/None'인 경우 메시지 전송하지 않음
     save_conversation_to_jsonl(channel_id, "VINA", full_answer, is_ai=True)
     
     # '/None' 응답 확인
-    if full_answer == "/None" or full_answer.startswith("/None "):
+    if vinallm.is_none_reply(full_answer):
         print(f"🚫 '/None' 응답 감지: 메시지를 보내지 않습니다.")
         return
     
-    await input_message.channel.send(full_answer)
+    if not STREAM_REPLIES:
+        outbound.post(input_message.channel, full_answer)
+
+async def respond_to_coalesced(channel_id, input_messages):
+    """조용해질 때까지 모인 채널 메시지에 한 번 응답 (채널 작업 큐에서 순서대로 처리)"""
+    channel_dispatcher.submit(channel_id, message_response, input_messages)
+
+message_coalescer = vinadispatch.MessageCoalescer(COALESCE_WINDOW, respond_to_coalesced)
+
+# ───── 스트리밍 응답 전송 ─────
+async def stream_reply(channel, request):
+    """
+    Claude 응답을 스트리밍으로 받아 디스코드에 점진적으로 표시합니다.
+    
+    - '/None' 응답이 아님이 확실해지면 첫 조각을 바로 전송
+    - 이후에는 STREAM_EDIT_INTERVAL초 간격으로만 메시지를 수정 (디스코드 수정 속도 제한 대응)
+    - 메시지 길이 제한을 넘으면 문단/코드 블록 경계에서 나눠 새 메시지로 이어서 표시
+    - '/None' 응답이면 아무것도 보내지 않음
+    
+    Returns:
+        완성된 응답 텍스트 (앞뒤 공백 제거)
+    """
+    loop = asyncio.get_running_loop()
+    parts = []
+    sent_messages = []  # 지금까지 보낸 메시지 (나눠진 조각 순서)
+    shown = []          # 각 메시지에 표시된 내용
+    last_edit = 0.0
+    
+    async def show(text, force=False):
+        nonlocal last_edit
+        now = loop.time()
+        throttled = not force and now - last_edit < STREAM_EDIT_INTERVAL
+        for index, chunk in enumerate(vinadispatch.split_message(text.strip(), DISCORD_MESSAGE_LIMIT)):
+            if index >= len(sent_messages):
+                # 새 조각은 바로 전송 (첫 조각 또는 길이 제한을 넘어 이어지는 메시지)
+                message, = await outbound.send(channel, chunk)
+                sent_messages.append(message)
+                shown.append(chunk)
+                last_edit = now
+            elif chunk != shown[index] and not throttled:
+                # 수정은 전송기가 같은 메시지에 대한 연속 수정을 합쳐서 처리
+                outbound.edit(sent_messages[index], chunk)
+                shown[index] = chunk
+                last_edit = now
+    
+    state = "undecided"
+    async for delta in vinallm.stream_text(**request):
+        parts.append(delta)
+        if state == "undecided":
+            state = vinallm.none_reply_state("".join(parts))
+        if state == "send":
+            await show("".join(parts))
+    
+    full_answer = "".join(parts).strip()
+    if state != "suppress" and not vinallm.is_none_reply(full_answer):
+        await show(full_answer, force=True)
+    return full_answer
+
+# ───── 규칙 스케줄 재계산 요청 ─────
+def request_rule_reschedule():
+    """새 메시지나 규칙 변경 시 스케줄러를 깨워 다음 실행 시각을 다시 계산"""
+    rule_schedule_changed.set()
 
 # ───── 규칙 체크 주기적 실행 ─────
 async def periodic_rule_check():
-    print(f"\n🔄 주기적 규칙 체크 작업 시작됨: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    check_count = 0
+    """
+    규칙별 다음 실행 시각을 힙으로 관리하며, 가장 이른 시각까지 잠들었다가
+    정확히 그 시각에 규칙을 실행합니다. 새 메시지나 규칙 변경이 있으면
+    즉시 깨어나 다시 계산하고, 외부에서 규칙 파일을 고친 경우를 위해
+    최대 RULE_SCHEDULER_MAX_SLEEP초마다 한 번은 다시 계산합니다.
+    """
+    print(f"\n🔄 규칙 스케줄러 시작됨: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    last_announced = None
+    last_state_save = datetime.datetime.now()
     
     while True:
         try:
-            check_count += 1
-            print(f"\n🔄 규칙 체크 #{check_count} - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            await process_triggered_rules()
+            now = datetime.datetime.now()
+            if (activity.dirty or rule_state.dirty) and (now - last_state_save).total_seconds() >= STATE_SAVE_INTERVAL:
+                activity.save()
+                rule_state.save()
+                last_state_save = now
+            
+            # 규칙마다 대상 채널(또는 사용자)의 마지막 메시지 시간 기준으로 계산
+            rule_scheduler.rebuild(load_compiled_rules(), now, activity=activity)
+            
+            # 실행 기록은 전송에 성공한 규칙만 남김 (실패한 규칙은 잠시 후 다시 시도)
+            due_rules = rule_scheduler.pop_due(now, record=False)
+            if due_rules:
+                handled = await process_triggered_rules([(compiled_rule.rule, None) for compiled_rule in due_rules])
+                for compiled_rule in due_rules:
+                    if compiled_rule.id in handled:
+                        rule_scheduler.record_fire(compiled_rule, now)
+                    else:
+                        retry_at = datetime.datetime.now() + datetime.timedelta(seconds=RULE_RETRY_DELAY)
+                        rule_scheduler.defer(compiled_rule, retry_at)
+                        print(f"🔁 규칙 '{compiled_rule.id}' 실행 실패, {retry_at.strftime('%H:%M:%S')} 이후 다시 시도")
+                
+                # 실행 기록과 활동 기록을 바로 저장해서 재시작 후에도 같은 구간에 다시 실행되지 않도록 함
+                rule_state.save()
+                activity.save()
+                continue
+            
+            # 다음 예정이 바뀌었을 때만 출력
+            upcoming = rule_scheduler.peek()
+            announced = (upcoming[1].id, upcoming[0]) if upcoming else None
+            if announced != last_announced:
+                if upcoming:
+                    print(f"⏰ 다음 규칙 실행 예정: '{upcoming[1].id}' {upcoming[0].strftime('%Y-%m-%d %H:%M:%S')}")
+                else:
+                    print("⏰ 예약된 규칙 없음 (새 메시지나 규칙 변경 시 다시 계산)")
+                last_announced = announced
+            
+            timeout = rule_scheduler.seconds_until_next(now, RULE_SCHEDULER_MAX_SLEEP)
         except Exception as e:
             print(f"❌ 규칙 처리 오류: {e}")
             import traceback
             traceback.print_exc()
+            timeout = 60
         
-        next_check = datetime.datetime.now() + datetime.timedelta(minutes=1)
-        print(f"⏰ 다음 규칙 체크: {next_check.strftime('%Y-%m-%d %H:%M:%S')}")
-        await asyncio.sleep(60)  # 1분마다 체크
+        try:
+            await asyncio.wait_for(rule_schedule_changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        rule_schedule_changed.clear()
+
+def start_rule_scheduler():
+    """규칙 스케줄러 작업 시작 (이미 실행 중이면 유지)"""
+    global rule_check_task
+    if rule_check_task is not None and not rule_check_task.done():
+        print("⏱️ 규칙 스케줄러가 이미 실행 중입니다 (재연결)")
+        return
+    
+    # 저장된 실행 상태 복원 결과 (이미 실행한 규칙은 같은 분/공백 구간에 다시 실행되지 않음)
+    now = datetime.datetime.now()
+    print(f"\n⏱️ 규칙 스케줄러 작업 시작... (저장된 규칙 상태 {len(rule_state.states)}개)")
+    for rule_id, fire_time in rule_scheduler.missed_rules(load_compiled_rules(), now, activity=activity):
+        print(f"⚠️ 꺼져 있는 동안 놓친 규칙 예약: '{rule_id}' {fire_time.strftime('%Y-%m-%d %H:%M:%S')} (다시 실행하지 않음)")
+    rule_check_task = asyncio.create_task(periodic_rule_check())
 
 # ───── 시작 시 메시지 기록 로드 ─────
 def load_initial_message_time():
-    print(f"\n📂 메시지 기록 파일에서 마지막 메시지 시간 로드 중...")
-    if not os.path.exists(JSONL_LOG_PATH):
-        print(f"❌ 메시지 기록 파일이 존재하지 않습니다: {JSONL_LOG_PATH}")
+    print(f"\n📂 메시지 기록({history_store.backend})에서 마지막 메시지 시간 로드 중...")
+    if not history_store.exists():
+        print(f"❌ 메시지 기록 파일이 존재하지 않습니다: {history_store.path}")
         return None
 
-    last_time = None
     try:
-        with open(JSONL_LOG_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    msg = json.loads(line)
-                    time_str = msg.get("time")
-                    if time_str and (last_time is None or time_str > last_time):
-                        last_time = time_str
-                except json.JSONDecodeError:
-                    continue
+        # 파일 끝(또는 시간 인덱스)에서 가장 최근 메시지 시간만 확인
+        last_time = history_store.load_last_message_time()
         
         if last_time:
             print(f"✅ 마지막 메시지 시간 로드 완료: {last_time}")
@@ -1219,30 +1582,40 @@ async def on_ready():
     print(f"🕒 현재 시간: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"📂 설정 파일 경로: \n - 규칙: {EXPLICIT_RULES_PATH}\n - 맥락: {CONTEXTUAL_RULES_PATH}\n - 정보: {FACTS_PATH}")
     
-    # 메시지 기록에서 마지막 메시지 시간 로드
-    global last_message_time
-    last_message_time = load_initial_message_time()
+    # 대화 기록 배치 기록 작업 시작 (재연결 시에는 기존 작업 유지)
+    await history_writer.start()
+    
+    # 메모리 분석 백그라운드 작업자 시작
+    start_memory_worker()
     
-    # 시작 시 한 번 규칙 체크
-    print("\n🚀 최초 규칙 체크 실행...")
-    await process_triggered_rules()
+    # 메시지 기록에서 마지막 메시지 시간 확인 (로그 확인용)
+    load_initial_message_time()
     
-    # 주기적 규칙 체크 시작
-    print("\n⏱️ 주기적 규칙 체크 작업 시작...")
-    asyncio.create_task(periodic_rule_check())
+    # 채널별 최근 대화 캐시 준비 (최초 1회, 채널별 마지막 메시지 시간도 함께 복원)
+    seed_history_cache()
+    print(f"📍 채널별 활동 기록: {len(activity.channels)}개 채널, {len(activity.users)}명 (메인 채널 {MAIN_CHANNEL_ID})")
+    
+    # 규칙 스케줄러 시작 (재연결로 on_ready가 다시 호출되면 기존 작업 유지)
+    start_rule_scheduler()
 
 @discord_client.event
 async def on_message(message):
     if message.author == discord_client.user:
         return
         
-    # 진단 명령 (디버깅용)
+    # 진단 명령 (디버깅용) - 채널 큐가 밀려 있어도 상태를 볼 수 있도록 바로 처리
     if message.content.startswith("!진단"):
         await diagnose_command(message)
         return
     
+    # 나머지는 채널별 작업 큐에서 순서대로 처리 (느린 채널이 다른 채널을 막지 않음)
+    if message.content.startswith(("!메모리", "!리포트")) or str(message.channel.id) in CHAT_CHANNEL_IDS:
+        channel_dispatcher.submit(str(message.channel.id), handle_message, message)
+
+async def handle_message(message):
+    """채널 작업 큐에서 꺼낸 메시지 처리"""
     # 메모리 관리 명령
-    elif message.content.startswith("!메모리"):
+    if message.content.startswith("!메모리"):
         await memory_command(message)
         return
     
@@ -1251,8 +1624,8 @@ async def on_message(message):
         await report_command(message)
         return
         
-    if message.channel.id == 1355113753427054806:
-        await message_response(message)
+    if str(message.channel.id) in CHAT_CHANNEL_IDS:
+        await receive_chat_message(message)
 
 # ───── 메모리 명령 처리 ─────
 async def memory_command(message):
@@ -1278,7 +1651,7 @@ async def memory_command(message):
 
 또한 일반 대화 중에 '아침 인사 규칙 삭제해줘', '저녁 알림을 9시로 변경해줘'와 같은 
 자연어 요청으로도 규칙을 관리할 수 있습니다."""
-        await message.channel.send(help_text)
+        outbound.post(message.channel, help_text)
         return
     
     # 메모리 상태 확인
@@ -1294,15 +1667,15 @@ async def memory_command(message):
 📄 facts.md: {facts_lines}줄
 📄 contextual_rules.md: {rules_lines}줄
 📄 explicit_rules.json: {len(explicit_rules)}개 규칙"""
-        await message.channel.send(status_text)
+        outbound.post(message.channel, status_text)
         return
     
     # 새 메시지에서 메모리 추출
     elif cmd_parts[1] == "추출" and len(cmd_parts) >= 3:
         user_msg = cmd_parts[2]
-        await message.channel.send(f"🔍 메시지 분석 중...")
+        outbound.post(message.channel, f"🔍 메시지 분석 중...")
         
-        analysis_data = analyze_message_for_memory(message.author.name, user_msg, str(message.channel.id))
+        analysis_data = await analyze_message_for_memory(message.author.name, user_msg, str(message.channel.id))
         if analysis_data:
             facts = analysis_data.get("facts", [])
             ctx_rules = analysis_data.get("contextual_rules", [])
@@ -1344,9 +1717,9 @@ async def memory_command(message):
             else:
                 reply += "\n**명시적 규칙:** 없음\n"
                 
-            await message.channel.send(reply)
+            outbound.post(message.channel, reply)
         else:
-            await message.channel.send("❌ 메시지 분석 중 오류가 발생했습니다.")
+            outbound.post(message.channel, "❌ 메시지 분석 중 오류가 발생했습니다.")
         return
     
     # 메모리 설정 보기/변경
@@ -1360,14 +1733,14 @@ async def memory_command(message):
 - 저장 경로: `{os.path.dirname(FACTS_PATH)}`
 
 향후 업데이트에서 위 설정들을 사용자가 변경할 수 있도록 할 예정입니다."""
-        await message.channel.send(settings_text)
+        outbound.post(message.channel, settings_text)
         return
     
     # 메모리 직접 추가 (사실)
     elif cmd_parts[1] == "추가" and len(cmd_parts) >= 3:
         parts = cmd_parts[2].split(maxsplit=1)
         if len(parts) < 2:
-            await message.channel.send("❌ 형식이 잘못되었습니다. `!메모리 추가 [유형] [내용]` 형식으로 입력해주세요.")
+            outbound.post(message.channel, "❌ 형식이 잘못되었습니다. `!메모리 추가 [유형] [내용]` 형식으로 입력해주세요.")
             return
             
         mem_type, content = parts
@@ -1375,15 +1748,15 @@ async def memory_command(message):
         if mem_type == "사실":
             # facts.md에 추가
             update_facts_file([content])
-            await message.channel.send(f"✅ 사용자 정보에 추가되었습니다: `{content}`")
+            outbound.post(message.channel, f"✅ 사용자 정보에 추가되었습니다: `{content}`")
             
         elif mem_type == "규칙":
             # contextual_rules.md에 추가
             update_contextual_rules_file([content])
-            await message.channel.send(f"✅ 맥락적 규칙에 추가되었습니다: `{content}`")
+            outbound.post(message.channel, f"✅ 맥락적 규칙에 추가되었습니다: `{content}`")
             
         else:
-            await message.channel.send(f"❌ 알 수 없는 메모리 유형: `{mem_type}`. 사용 가능한 유형: `사실`, `규칙`")
+            outbound.post(message.channel, f"❌ 알 수 없는 메모리 유형: `{mem_type}`. 사용 가능한 유형: `사실`, `규칙`")
         return
     
     # 메모리 파일 내용 보기
@@ -1393,19 +1766,19 @@ async def memory_command(message):
             
             if mem_type == "사실":
                 content = load_markdown_file(FACTS_PATH)
-                await message.channel.send(f"📄 **사용자 정보 (facts.md)**\n```md\n{content[:1900]}```")
+                outbound.post(message.channel, f"📄 **사용자 정보 (facts.md)**\n```md\n{content}```")
                 
             elif mem_type == "규칙":
                 content = load_markdown_file(CONTEXTUAL_RULES_PATH)
-                await message.channel.send(f"📄 **맥락적 규칙 (contextual_rules.md)**\n```md\n{content[:1900]}```")
+                outbound.post(message.channel, f"📄 **맥락적 규칙 (contextual_rules.md)**\n```md\n{content}```")
                 
             elif mem_type == "명시적":
                 rules = load_explicit_rules()
                 content = json.dumps(rules, ensure_ascii=False, indent=2)
-                await message.channel.send(f"📄 **명시적 규칙 (explicit_rules.json)**\n```json\n{content[:1900]}```")
+                outbound.post(message.channel, f"📄 **명시적 규칙 (explicit_rules.json)**\n```json\n{content}```")
                 
             else:
-                await message.channel.send(f"❌ 알 수 없는 메모리 유형: `{mem_type}`. 사용 가능한 유형: `사실`, `규칙`, `명시적`")
+                outbound.post(message.channel, f"❌ 알 수 없는 메모리 유형: `{mem_type}`. 사용 가능한 유형: `사실`, `규칙`, `명시적`")
                 
         else:
             # 모든 메모리 파일 내용을 요약해서 보여줌
@@ -1449,13 +1822,13 @@ async def memory_command(message):
             reply += f"\n**명시적 규칙 (explicit_rules.json)**\n"
             reply += f"- 총 {len(explicit_rules)}개 규칙 (활성: {active_rules}개, 비활성: {len(explicit_rules) - active_rules}개)\n"
             
-            await message.channel.send(reply)
+            outbound.post(message.channel, reply)
         return
     
     # 명시적 규칙 형식 설명
     elif cmd_parts[1] == "형식" and len(cmd_parts) >= 3 and cmd_parts[2] == "명시적":
         guide_text = get_explicit_rule_format_guide()
-        await message.channel.send(guide_text)
+        outbound.post(message.channel, guide_text)
         return
     
     # 명시적 규칙 추가 가이드
@@ -1492,7 +1865,7 @@ async def memory_command(message):
   "active": true
 }}`
 """
-        await message.channel.send(guide_text)
+        outbound.post(message.channel, guide_text)
         
         # 규칙 직접 추가 (가이드 다음에 JSON이 있는 경우)
         if len(cmd_parts) >= 4:
@@ -1502,11 +1875,11 @@ async def memory_command(message):
                 
                 # 규칙 추가
                 update_explicit_rules_file([new_rule])
-                await message.channel.send(f"✅ 명시적 규칙 '{new_rule.get('id', '알 수 없음')}'이(가) 추가되었습니다.")
+                outbound.post(message.channel, f"✅ 명시적 규칙 '{new_rule.get('id', '알 수 없음')}'이(가) 추가되었습니다.")
             except json.JSONDecodeError:
-                await message.channel.send("❌ JSON 형식이 잘못되었습니다. 위 가이드를 참고하여 올바른 형식으로 작성해주세요.")
+                outbound.post(message.channel, "❌ JSON 형식이 잘못되었습니다. 위 가이드를 참고하여 올바른 형식으로 작성해주세요.")
             except Exception as e:
-                await message.channel.send(f"❌ 규칙 추가 중 오류가 발생했습니다: {str(e)}")
+                outbound.post(message.channel, f"❌ 규칙 추가 중 오류가 발생했습니다: {str(e)}")
         
         return
     
@@ -1517,16 +1890,16 @@ async def memory_command(message):
         rule_id = parts[1] if len(parts) > 1 else ""
         
         if not rule_id:
-            await message.channel.send("❌ 삭제할 규칙의 ID를 입력해주세요. 예: `!메모리 삭제 명시적 morning_greeting`")
+            outbound.post(message.channel, "❌ 삭제할 규칙의 ID를 입력해주세요. 예: `!메모리 삭제 명시적 morning_greeting`")
             return
             
         # 실제 삭제 처리
         result = delete_explicit_rules([rule_id])
         
         if result > 0:
-            await message.channel.send(f"✅ 규칙 '{rule_id}'이(가) 삭제되었습니다.")
+            outbound.post(message.channel, f"✅ 규칙 '{rule_id}'이(가) 삭제되었습니다.")
         else:
-            await message.channel.send(f"❌ 규칙 '{rule_id}'을(를) 찾을 수 없거나 삭제할 수 없습니다.")
+            outbound.post(message.channel, f"❌ 규칙 '{rule_id}'을(를) 찾을 수 없거나 삭제할 수 없습니다.")
         
         return
 
@@ -1535,7 +1908,7 @@ async def memory_command(message):
         rules = load_explicit_rules()
         
         if not rules:
-            await message.channel.send("ℹ️ 현재 등록된 명시적 규칙이 없습니다.")
+            outbound.post(message.channel, "ℹ️ 현재 등록된 명시적 규칙이 없습니다.")
             return
         
         reply = "📋 **등록된 명시적 규칙 목록**\n\n"
@@ -1553,7 +1926,7 @@ async def memory_command(message):
             reply += f"  - 설명: {rule_desc}\n\n"
         
         reply += "규칙을 삭제하려면 `!메모리 삭제 명시적 [ID]` 명령을 사용하세요."
-        await message.channel.send(reply)
+        outbound.post(message.channel, reply)
         return
     
     # 명시적 규칙 수정
@@ -1561,7 +1934,7 @@ async def memory_command(message):
         parts = cmd_parts[2].split(maxsplit=1)
         
         if len(parts) < 2:
-            await message.channel.send("❌ 수정할 규칙의 JSON 데이터를 입력해주세요.")
+            outbound.post(message.channel, "❌ 수정할 규칙의 JSON 데이터를 입력해주세요.")
             return
             
         try:
@@ -1570,21 +1943,21 @@ async def memory_command(message):
             
             # 규칙 업데이트
             if "id" not in new_rule:
-                await message.channel.send("❌ 규칙에 ID가 없습니다. 수정할 규칙의 ID를 반드시 포함해주세요.")
+                outbound.post(message.channel, "❌ 규칙에 ID가 없습니다. 수정할 규칙의 ID를 반드시 포함해주세요.")
                 return
                 
             update_explicit_rules_file([new_rule])
-            await message.channel.send(f"✅ 명시적 규칙 '{new_rule.get('id')}'이(가) 수정되었습니다.")
+            outbound.post(message.channel, f"✅ 명시적 규칙 '{new_rule.get('id')}'이(가) 수정되었습니다.")
         except json.JSONDecodeError:
-            await message.channel.send("❌ JSON 형식이 잘못되었습니다. 올바른 형식으로 작성해주세요.")
+            outbound.post(message.channel, "❌ JSON 형식이 잘못되었습니다. 올바른 형식으로 작성해주세요.")
         except Exception as e:
-            await message.channel.send(f"❌ 규칙 수정 중 오류가 발생했습니다: {str(e)}")
+            outbound.post(message.channel, f"❌ 규칙 수정 중 오류가 발생했습니다: {str(e)}")
         
         return
     
     # 메모리 파일 검증 및 수정
     elif cmd_parts[1] == "검증":
-        await message.channel.send("🔍 메모리 파일 검증 및 수정 중...")
+        outbound.post(message.channel, "🔍 메모리 파일 검증 및 수정 중...")
         
         try:
             # explicit_rules.json 검증
@@ -1624,9 +1997,9 @@ async def memory_command(message):
                     reply += f"- 규칙 `{rule_id}`: {issue}\n"
                 
                 reply += "\n자동 수정을 원하시면 `!메모리 검증 수정`을 입력하세요."
-                await message.channel.send(reply)
+                outbound.post(message.channel, reply)
             else:
-                await message.channel.send("✅ 모든 규칙이 유효합니다.")
+                outbound.post(message.channel, "✅ 모든 규칙이 유효합니다.")
             
             # 자동 수정 요청 확인
             if len(cmd_parts) >= 3 and cmd_parts[2] == "수정":
@@ -1664,23 +2037,21 @@ async def memory_command(message):
                         fixed_rules.append(rule)
                     
                     # 파일 저장
-                    with open(EXPLICIT_RULES_PATH, "w", encoding="utf-8") as f:
-                        json.dump(fixed_rules, f, ensure_ascii=False, indent=2)
+                    save_explicit_rules(fixed_rules)
                     
-                    await message.channel.send(f"✅ {len(invalid_rules)}개의 규칙이 수정되었습니다.")
+                    outbound.post(message.channel, f"✅ {len(invalid_rules)}개의 규칙이 수정되었습니다.")
                 else:
-                    await message.channel.send("ℹ️ 수정할 규칙이 없습니다.")
+                    outbound.post(message.channel, "ℹ️ 수정할 규칙이 없습니다.")
         except Exception as e:
-            await message.channel.send(f"❌ 파일 검증 중 오류가 발생했습니다: {str(e)}")
+            outbound.post(message.channel, f"❌ 파일 검증 중 오류가 발생했습니다: {str(e)}")
         
         return
 
     else:
-        await message.channel.send("❓ 알 수 없는 메모리 명령어입니다. `!메모리`를 입력하면 도움말을 볼 수 있습니다.")
+        outbound.post(message.channel, "❓ 알 수 없는 메모리 명령어입니다. `!메모리`를 입력하면 도움말을 볼 수 있습니다.")
 
 # ───── 진단 명령 ─────
 async def diagnose_command(message):
-    global last_message_time
     cmd_parts = message.content.split()
     
     if len(cmd_parts) == 1:
@@ -1689,54 +2060,96 @@ async def diagnose_command(message):
         reply = f"🔍 **시스템 진단 보고서**\n"
         reply += f"⏰ 현재 시간: {now.strftime('%Y-%m-%d %H:%M:%S')}\n"
         
-        if last_message_time:
-            try:
-                last_dt = datetime.datetime.fromisoformat(last_message_time)
+        if activity.channels:
+            reply += f"📌 채널별 마지막 메시지:\n"
+            for channel_id, state in sorted(activity.channels.items(), key=lambda item: item[1].get("last_message", ""), reverse=True):
+                last_dt = vinarules.parse_message_time(state.get("last_message"))
+                if last_dt is None:
+                    continue
                 elapsed = (now - last_dt).total_seconds()
-                reply += f"📌 마지막 메시지:\n"
-                reply += f"  - 시간: {last_message_time}\n"
-                reply += f"  - 경과: {elapsed:.1f}초 ({elapsed/60:.1f}분)\n"
-            except Exception as e:
-                reply += f"❌ 마지막 메시지 시간 처리 오류: {e}\n"
+                main_mark = " (메인)" if channel_id == MAIN_CHANNEL_ID else ""
+                reply += f"  - `{channel_id}`{main_mark}: {state['last_message']} (경과 {elapsed/60:.1f}분, 사용자 {state.get('last_user_message') or '없음'})\n"
         else:
             reply += f"⚠️ 마지막 메시지 기록이 없습니다.\n"
         
-        await message.channel.send(reply)
+        reply += f"📊 토큰 사용량 (프롬프트 캐시):\n```\n{vinallm.format_usage_stats()}\n```\n"
+        reply += f"📬 채널 작업 큐:\n```\n{channel_dispatcher.format_stats()}\n```\n"
+        reply += f"📤 디스코드 전송: {outbound.format_stats()}\n"
+        reply += f"🧩 메시지 합치기: {message_coalescer.format_stats()}\n"
+        reply += f"🚦 Claude 호출: {vinallm.gateway.format_stats()}\n"
+        reply += f"🧮 프롬프트 크기 (예상 토큰):\n```\n{vinabudget.format_prompt_stats()}\n```\n"
+        reply += f"🧠 메모리 분석 대기: {memory_job_queue.qsize()}개 (완료 {memory_job_stats['done']}, 실패 {memory_job_stats['failed']})\n"
+        if memory_batcher:
+            reply += f"📦 메모리 묶음 대기: {memory_batcher.pending_count}개 메시지 (최대 {memory_batcher.max_messages}개 / {memory_batcher.idle_seconds:.0f}초)\n"
+        reply += f"⏭️ 메모리 분석 사전 필터: {memory_prefilter.format_stats()}\n"
+        
+        upcoming = rule_scheduler.peek()
+        if upcoming:
+            reply += f"⏭️ 다음 규칙 실행 예정: `{upcoming[1].id}` ({upcoming[0].strftime('%Y-%m-%d %H:%M:%S')})\n"
+        else:
+            reply += f"⏭️ 예약된 규칙 없음\n"
+        
+        outbound.post(message.channel, reply)
         
     elif cmd_parts[1] == "규칙":
-        # 규칙 진단
-        rules = load_explicit_rules()
+        # 규칙 진단 (규칙 점검과 같은 컴파일된 규칙 사용)
+        compiled_rules = load_compiled_rules()
+        now = datetime.datetime.now()
         reply = f"📜 **규칙 진단 보고서**\n"
-        reply += f"📊 총 규칙 수: {len(rules)}개\n\n"
+        reply += f"📊 총 규칙 수: {len(compiled_rules)}개\n\n"
         
-        for rule in rules:
-            rule_id = rule.get("id", "알 수 없음")
-            active = "✅ 활성" if rule.get("active", False) else "❌ 비활성"
+        for compiled_rule in compiled_rules:
+            rule = compiled_rule.rule
+            rule_id = compiled_rule.id
+            active = "✅ 활성" if compiled_rule.active else "❌ 비활성"
             conditions = ", ".join(rule.get("condition_tags", []))
             
             reply += f"📌 규칙 `{rule_id}`\n"
             reply += f"  - 상태: {active}\n"
             reply += f"  - 조건: {conditions}\n"
+            reply += f"  - 대상 채널: `{activity.rule_channel(compiled_rule)}` (경과 기준: {compiled_rule.scope})\n"
             
-            # 개별 조건 평가
+            # 개별 조건 평가 (규칙의 대상 채널/사용자 기준)
+            last_dt, idle_anchor = activity.resolve(compiled_rule)
             reply += f"  - 조건 평가:\n"
             all_true = True
             
-            for condition in rule.get("condition_tags", []):
-                result = evaluate_rule_condition(condition)
+            for condition, result in compiled_rule.evaluate_conditions(now, last_dt):
                 cond_result = f"{'✅ 충족' if result else '❌ 불충족'}"
                 if not result:
                     all_true = False
-                reply += f"    - `{condition}`: {cond_result}\n"
+                reply += f"    - `{condition.tag}`: {cond_result} ({condition.describe(now, last_dt)})\n"
             
-            if rule.get("active", False):
+            if compiled_rule.active:
                 final_status = "✅ 트리거 가능" if all_true else "❌ 트리거 불가"
             else:
                 final_status = "❌ 비활성화 상태"
                 
-            reply += f"  - 최종 상태: {final_status}\n\n"
+            reply += f"  - 최종 상태: {final_status}\n"
+            
+            # 실행 상태 (마지막 실행, 실행 제한, 다음 실행 예정)
+            state = rule_state.get(rule_id)
+            if state.get("last_fired"):
+                reply += f"  - 마지막 실행: {state['last_fired']} (총 {state.get('fire_count', 0)}회)\n"
+            else:
+                reply += f"  - 마지막 실행: 기록 없음\n"
+            
+            limits = []
+            if compiled_rule.cooldown:
+                limits.append(f"쿨다운 {compiled_rule.cooldown}초")
+            if compiled_rule.once_per_idle:
+                limits.append("대화 공백 구간당 1회")
+            if limits:
+                reply += f"  - 실행 제한: {', '.join(limits)}\n"
             
-        await message.channel.send(reply)
+            if rule_state.waiting_for_message(compiled_rule, idle_anchor):
+                reply += f"  - 다음 실행: 💤 새 사용자 메시지 대기 중\n\n"
+            elif rule_id in rule_scheduler.next_fire:
+                reply += f"  - 다음 실행: {rule_scheduler.next_fire[rule_id].strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            else:
+                reply += f"  - 다음 실행: 예약 없음\n\n"
+            
+        outbound.post(message.channel, reply)
     
     elif cmd_parts[1] == "강제실행" and len(cmd_parts) >= 3:
         # 특정 규칙 강제 실행
@@ -1747,27 +2160,33 @@ async def diagnose_command(message):
         for rule in rules:
             if rule.get("id") == rule_id:
                 found = True
-                await message.channel.send(f"⚠️ 규칙 `{rule_id}` 강제 실행 중...")
-                await auto_llm_response(rule, message.channel)
+                outbound.post(message.channel, f"⚠️ 규칙 `{rule_id}` 강제 실행 중...")
+                try:
+                    await auto_llm_response(rule, message.channel)
+                except Exception as e:
+                    print(f"❌ 규칙 '{rule_id}' 강제 실행 중 오류 발생: {e}")
+                    outbound.post(message.channel, f"❌ 규칙 `{rule_id}` 실행 중 오류가 발생했습니다: {str(e)}")
                 break
                 
         if not found:
-            await message.channel.send(f"❌ 규칙 `{rule_id}`를 찾을 수 없습니다.")
+            outbound.post(message.channel, f"❌ 규칙 `{rule_id}`를 찾을 수 없습니다.")
     
     elif cmd_parts[1] == "메시지추가":
         # 현재 채널에 메시지 기록 추가 (테스트용)
-        last_message_time = datetime.datetime.now().isoformat(timespec="seconds")
-        await message.channel.send(f"✅ 마지막 메시지 시간 업데이트: {last_message_time}")
+        message_time = datetime.datetime.now().isoformat(timespec="seconds")
+        activity.record(str(message.channel.id), message_time, message.author.name)
+        request_rule_reschedule()
+        outbound.post(message.channel, f"✅ 마지막 메시지 시간 업데이트: {message_time} (채널 `{message.channel.id}`)")
         
     elif cmd_parts[1] == "시뮬레이션" and len(cmd_parts) >= 3:
         # 특정 조건 시뮬레이션
         test_condition = " ".join(cmd_parts[2:])
         reply = f"🧪 **조건 시뮬레이션**: `{test_condition}`\n\n"
         
-        result = evaluate_rule_condition(test_condition)
+        result = evaluate_rule_condition(test_condition, str(message.channel.id))
         reply += f"{'✅ 조건 충족!' if result else '❌ 조건 불충족'}\n"
             
-        await message.channel.send(reply)
+        outbound.post(message.channel, reply)
         
     else:
         help_text = f"""🔍 **진단 명령어 도움말**
@@ -1777,7 +2196,7 @@ async def diagnose_command(message):
 !진단 메시지추가 - 마지막 메시지 시간 업데이트 (테스트용)
 !진단 시뮬레이션 [조건] - 특정 조건 시뮬레이션 (예: !진단 시뮬레이션 last_message_elapsed>60)
 """
-        await message.channel.send(help_text)
+        outbound.post(message.channel, help_text)
 
 # ───── 리포트 명령 처리 ─────
 async def report_command(message):
@@ -1797,7 +2216,7 @@ async def report_command(message):
         date_str = datetime.datetime.now().strftime("%Y-%m-%d")
     
     # 진행 상황 메시지 전송
-    status_msg = await message.channel.send(f"📊 {date_str} 날짜의 대화를 기반으로 일일 리포트를 생성하고 있어요. 잠시만 기다려주세요...")
+    status_msg, = await outbound.send(message.channel, f"📊 {date_str} 날짜의 대화를 기반으로 일일 리포트를 생성하고 있어요. 잠시만 기다려주세요...")
     
     try:
         # 직접 vinareport.py 실행
@@ -1815,19 +2234,19 @@ async def report_command(message):
             os.system(f"start {batch_filename}")
             
             # 성공 메시지
-            await status_msg.edit(content=f"✅ {date_str} 일일 리포트 생성이 시작되었습니다. 완료되면 'vina-리포트' 채널에서 확인할 수 있습니다.")
+            outbound.edit(status_msg, f"✅ {date_str} 일일 리포트 생성이 시작되었습니다. 완료되면 'vina-리포트' 채널에서 확인할 수 있습니다.")
             
         except Exception as e:
             print(f"❌ 리포트 실행 오류: {e}")
             import traceback
             traceback.print_exc()
-            await status_msg.edit(content=f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
+            outbound.edit(status_msg, f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
         
     except Exception as e:
         print(f"❌ 리포트 생성 명령 처리 중 오류 발생: {e}")
         import traceback
         traceback.print_exc()
-        await status_msg.edit(content=f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
+        outbound.edit(status_msg, f"❌ 리포트 생성 중 오류가 발생했습니다: {str(e)}")
 
 # ───── 실행 ─────
 discord_client.run(DISCORD_TOKEN)
@@ -0,0 +1,88 @@
+"""
+VINA 프롬프트 토큰 예산 관리 테스트
+
+토큰 추정, 메모리 파일/최근 대화 줄이기, 프롬프트 크기 기록을 테스트합니다.
+"""
+
+import vinabudget
+from vinabudget import estimate_tokens, trim_markdown, trim_history
+
+RULES = """# 비나의 맥락적 규칙
+
+## 기타 규칙
+- 오래된 기타 규칙입니다
+- 새로 추가된 기타 규칙입니다
+
+## 금지 사항
+- 반말 금지
+"""
+
+def format_messages(messages):
+    return "\n".join(f"- {m['name']}: {m['content']}" for m in messages)
+
+def test_estimate_tokens():
+    """한글은 글자당, ASCII는 4글자당 1토큰으로 추정하는지 테스트"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("안녕하세요") == 5, "한글 토큰 추정이 올바르지 않습니다."
+    assert estimate_tokens("abcdefgh") == 2, "ASCII 토큰 추정이 올바르지 않습니다."
+
+def test_trim_markdown_by_priority_and_recency():
+    """우선순위 섹션과 최근 항목을 먼저 남기는지 테스트"""
+    assert trim_markdown(RULES, 0) == (RULES, 0), "예산이 0이면 줄이지 않아야 합니다."
+    assert trim_markdown(RULES, 10000) == (RULES, 0), "예산 안이면 그대로여야 합니다."
+    
+    # 줄 단위 비용(줄바꿈 포함)으로 계산하므로 전체 추정치보다 약간 크게 잡힘
+    line_cost = sum(estimate_tokens(line) + 1 for line in RULES.splitlines())
+    budget = line_cost - (estimate_tokens("- 오래된 기타 규칙입니다") + 1)
+    trimmed, dropped = trim_markdown(RULES, budget, ("금지 사항",))
+    assert dropped == 1, "한 항목만 제외되어야 합니다."
+    assert "오래된 기타 규칙" not in trimmed, "오래된 항목이 먼저 제외되어야 합니다."
+    assert "새로 추가된 기타 규칙" in trimmed and "반말 금지" in trimmed
+    assert estimate_tokens(trimmed) <= budget, "예산을 넘으면 안 됩니다."
+    
+    # 예산이 빠듯하면 우선순위 섹션만 남고 빈 섹션 제목은 제거
+    header_cost = sum(estimate_tokens(line) + 1 for line in RULES.splitlines() if not line.startswith("- "))
+    trimmed, dropped = trim_markdown(RULES, header_cost + estimate_tokens("- 반말 금지") + 1, ("금지 사항",))
+    assert "반말 금지" in trimmed and "## 기타 규칙" not in trimmed, f"우선순위 섹션만 남아야 합니다: {trimmed}"
+    assert dropped == 2
+
+def test_trim_markdown_without_items():
+    """항목이 없는 설명문/제목만으로 예산을 넘어도 결과가 예산 이하인지 테스트"""
+    prose = "# 비나의 정보\n\n" + "\n".join(f"{i}번째 긴 설명 문장입니다. 항목 형식이 아닙니다." for i in range(20))
+    budget = estimate_tokens(prose) // 3
+    trimmed, dropped = trim_markdown(prose, budget)
+    assert estimate_tokens(trimmed) <= budget, "설명문만 있는 파일도 예산을 넘으면 안 됩니다."
+    assert trimmed.startswith("# 비나의 정보\n\n0번째") and dropped > 0, "앞부분부터 남기고 제외 수를 알려야 합니다."
+    
+    # 제목과 설명만 있는 섹션은 우선순위가 낮은 섹션부터 통째로 제외
+    sections = "## 기타 규칙\n" + "기타 설명 " * 40 + "\n## 금지 사항\n반말 금지 설명"
+    trimmed, dropped = trim_markdown(sections, 30, ("금지 사항",))
+    assert trimmed == "## 금지 사항\n반말 금지 설명", f"우선순위 섹션만 남아야 합니다: {trimmed}"
+    assert dropped == 1
+    assert estimate_tokens(trimmed) <= 30
+
+def test_trim_history_keeps_latest():
+    """최근 대화는 최신 메시지부터 남기는지 테스트"""
+    messages = [{"name": "민수", "content": f"메시지 {i}" * 10} for i in range(5)]
+    one_cost = estimate_tokens(format_messages([messages[0]])) + 1
+    
+    kept = trim_history(messages, one_cost * 2, format_messages)
+    assert kept == messages[-2:], "최신 메시지 2개만 남아야 합니다."
+    
+    # 가장 최근 메시지만으로 넘치면 내용을 잘라서 예산 안에 맞춤
+    kept = trim_history(messages, one_cost // 2, format_messages)
+    assert len(kept) == 1 and kept[0]["content"].endswith("…"), "가장 최근 메시지는 잘라서 남겨야 합니다."
+    assert messages[-1]["content"].startswith(kept[0]["content"][:-1]), "가장 최근 메시지의 앞부분이 남아야 합니다."
+    assert estimate_tokens(format_messages(kept)) + 1 <= one_cost // 2, "예산을 넘으면 안 됩니다."
+    assert trim_history(messages, 1, format_messages) == [], "형식만으로 넘치는 예산이면 아무것도 남기지 않아야 합니다."
+    assert trim_history(messages, 0, format_messages) == messages, "예산이 0이면 줄이지 않아야 합니다."
+
+def test_record_prompt():
+    """호출별 프롬프트 크기 기록 테스트"""
+    vinabudget.prompt_stats.clear()
+    vinabudget.record_prompt("chat", {"facts": "가나다", "total": "가나다라마"})
+    vinabudget.record_prompt("chat", {"facts": "가", "total": "가나다"})
+    
+    stats = vinabudget.prompt_stats["chat"]
+    assert stats["calls"] == 2 and stats["facts"] == 4 and stats["max_total"] == 5, f"기록이 올바르지 않습니다: {stats}"
+    assert "chat: 2회" in vinabudget.format_prompt_stats()
@@ -0,0 +1,195 @@
+"""
+VINA 메시지 처리 순서 관리 테스트
+
+연달아 온 메시지 합치기, 채널별 작업 큐의 순서/동시성/정리,
+긴 메시지 나누기와 디스코드 전송기를 테스트합니다.
+"""
+
+import asyncio
+import discord
+from vinadispatch import MessageCoalescer, ChannelDispatcher, OutboundSender, split_message, split_embed
+
+def test_coalescer_merges_rapid_messages():
+    """대기 시간 안에 연달아 온 메시지는 한 번에 처리하는지 테스트"""
+    async def run():
+        batches = []
+        async def handler(key, items):
+            batches.append((key, list(items)))
+        
+        coalescer = MessageCoalescer(0.05, handler)
+        for text in ["아", "오늘", "뭐 먹지"]:
+            coalescer.add("1", text)
+            await asyncio.sleep(0.02)
+        coalescer.add("2", "다른 채널")
+        assert coalescer.pending_count() == 4, "처리 전에는 모두 대기해야 합니다."
+        
+        await asyncio.sleep(0.15)
+        coalescer.add("1", "아니다 배불러")
+        await asyncio.sleep(0.1)
+        return batches, coalescer
+    
+    batches, coalescer = asyncio.run(run())
+    assert batches == [("1", ["아", "오늘", "뭐 먹지"]), ("2", ["다른 채널"]), ("1", ["아니다 배불러"])], f"묶음이 올바르지 않습니다: {batches}"
+    assert coalescer.pending_count() == 0
+    assert "메시지 5개 → 응답 3회 (절약 2회" in coalescer.format_stats()
+
+def test_coalescer_keeps_channel_order():
+    """처리 중에 들어온 메시지는 앞 묶음 처리가 끝난 뒤 처리하는지 테스트"""
+    async def run():
+        events = []
+        async def handler(key, items):
+            events.append(f"시작 {items}")
+            await asyncio.sleep(0.1)
+            events.append(f"끝 {items}")
+        
+        coalescer = MessageCoalescer(0.01, handler)
+        coalescer.add("1", "첫째")
+        await asyncio.sleep(0.03)
+        coalescer.add("1", "둘째")
+        await asyncio.sleep(0.05)
+        assert "1" in coalescer.locks, "처리 중인 채널의 잠금은 유지되어야 합니다."
+        await asyncio.sleep(0.25)
+        return events, coalescer
+    
+    events, coalescer = asyncio.run(run())
+    assert events == ["시작 ['첫째']", "끝 ['첫째']", "시작 ['둘째']", "끝 ['둘째']"], f"처리 순서가 올바르지 않습니다: {events}"
+    assert coalescer.locks == {}, "처리가 끝난 채널의 잠금은 정리되어야 합니다."
+
+def test_dispatcher_order_and_concurrency():
+    """채널 안에서는 순서대로, 채널 간에는 제한된 수만큼 동시에 처리하는지 테스트"""
+    async def run():
+        dispatcher = ChannelDispatcher(max_concurrency=2, idle_timeout=5)
+        events = []
+        running = {"now": 0, "max": 0}
+        
+        async def job(name, delay):
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            events.append(f"시작 {name}")
+            await asyncio.sleep(delay)
+            events.append(f"끝 {name}")
+            running["now"] -= 1
+        
+        dispatcher.submit("느린채널", job, "A1", 0.2)
+        dispatcher.submit("느린채널", job, "A2", 0.01)
+        dispatcher.submit("빠른채널", job, "B1", 0.01)
+        dispatcher.submit("세번째채널", job, "C1", 0.01)
+        await asyncio.sleep(0.05)
+        depths = dispatcher.queue_depths()
+        await asyncio.sleep(0.3)
+        return dispatcher, events, running, depths
+    
+    dispatcher, events, running, depths = asyncio.run(run())
+    assert events.index("끝 A1") < events.index("시작 A2"), "같은 채널은 순서대로 처리해야 합니다."
+    assert events.index("끝 B1") < events.index("끝 A1"), "느린 채널이 다른 채널을 막으면 안 됩니다."
+    assert running["max"] == 2, "동시 처리 수 제한을 지켜야 합니다."
+    assert depths["느린채널"] == 1, "처리 중이 아닌 대기 작업 수가 표시되어야 합니다."
+    assert dispatcher.stats["done"] == 4 and dispatcher.stats["max_wait"] >= 0.01
+    assert "대기 시간: 평균" in dispatcher.format_stats()
+
+def test_dispatcher_reaps_idle_workers():
+    """한가한 채널 작업자를 정리하고, 오류가 나도 다음 작업을 처리하는지 테스트"""
+    async def run():
+        dispatcher = ChannelDispatcher(max_concurrency=1, idle_timeout=0.05)
+        results = []
+        
+        async def fail():
+            raise RuntimeError("실패")
+        async def ok():
+            results.append("성공")
+        
+        dispatcher.submit("1", fail)
+        dispatcher.submit("1", ok)
+        await asyncio.sleep(0.02)
+        active = len(dispatcher.workers)
+        await asyncio.sleep(0.1)
+        
+        # 정리된 뒤에도 새 작업은 다시 처리
+        dispatcher.submit("1", ok)
+        await asyncio.sleep(0.02)
+        return dispatcher, results, active
+    
+    dispatcher, results, active = asyncio.run(run())
+    assert active == 1 and results == ["성공", "성공"], "오류 뒤에도 다음 작업을 처리해야 합니다."
+    assert dispatcher.stats["failed"] == 1 and dispatcher.stats["reaped"] >= 1, "한가한 작업자는 정리되어야 합니다."
+
+class FakeMessage:
+    """edit 호출을 기록하는 가짜 디스코드 메시지"""
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+        self.edits = []
+    
+    async def edit(self, content):
+        self.edits.append(content)
+        self.content = content
+        return self
+
+class FakeChannel:
+    """send 호출을 기록하는 가짜 디스코드 채널"""
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.sent = []
+    
+    async def send(self, content=None, embed=None):
+        await asyncio.sleep(0)
+        self.sent.append(content if embed is None else embed)
+        return FakeMessage(self, content)
+
+def test_split_message_boundaries():
+    """문단과 코드 블록 경계에서 나누는지 테스트"""
+    assert split_message("짧은 메시지") == ["짧은 메시지"]
+    assert split_message("   ") == []
+    
+    text = "첫 문단\n\n" + "가" * 30 + "\n\n```md\n" + "\n".join(f"줄{i}" for i in range(20)) + "```\n끝"
+    chunks = split_message(text, 40)
+    assert all(len(chunk) <= 40 for chunk in chunks), "길이 제한을 넘으면 안 됩니다."
+    assert chunks[0] == "첫 문단\n\n" + "가" * 30, "문단 경계에서 나눠야 합니다."
+    for chunk in chunks[1:]:
+        assert chunk.startswith("```md\n") and chunk.count("```") == 2, f"코드 블록 조각은 닫힌 코드 블록이어야 합니다: {chunk!r}"
+    
+    # 나눈 조각들에 원래 줄이 순서대로 모두 들어 있어야 함
+    lines = [line for chunk in chunks for line in chunk.split("\n") if line.startswith("줄")]
+    assert lines == [f"줄{i}" for i in range(20)]
+    
+    # 줄바꿈이 없는 긴 텍스트도 나눔
+    assert split_message("나" * 95, 40) == ["나" * 40, "나" * 40, "나" * 15]
+
+def test_split_embed():
+    """설명이 긴 임베드를 나누는지 테스트"""
+    embed = discord.Embed(title="리포트", description="문단\n\n" * 1500, color=0x3498db)
+    parts = split_embed(embed)
+    assert len(parts) == 2 and parts[0].title == "리포트" and parts[1].title is None
+    assert all(len(part.description) <= 4096 for part in parts)
+
+def test_outbound_sender():
+    """긴 내용 나눠 보내기, 연속 수정 합치기, 전송 순서 테스트"""
+    async def run():
+        sender = OutboundSender(message_limit=40, channel_rate=6000, channel_burst=1)
+        channel = FakeChannel(1)
+        
+        sender.post(channel, "첫 메시지")
+        messages = await sender.send(channel, "가" * 50)
+        
+        # 실행 전에 들어온 같은 메시지의 수정은 마지막 내용 한 번으로 합침
+        target = messages[0]
+        futures = [sender.edit(target, f"수정 {i}") for i in range(5)]
+        await asyncio.gather(*futures)
+        return sender, channel, target
+    
+    sender, channel, target = asyncio.run(run())
+    assert channel.sent == ["첫 메시지", "가" * 40, "가" * 10], "순서대로 나눠 보내야 합니다."
+    assert target.edits == ["수정 4"], f"연속 수정은 합쳐져야 합니다: {target.edits}"
+    assert sender.stats["merged_edits"] == 4 and sender.stats["split"] == 1
+
+def test_outbound_sender_rate_limit():
+    """채널별 속도 제한 버킷을 지키는지 테스트"""
+    async def run():
+        sender = OutboundSender(channel_rate=600, channel_burst=1)  # 채널당 0.1초에 1개
+        channel = FakeChannel(1)
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(*(sender.send(channel, f"메시지 {i}") for i in range(3)))
+        return asyncio.get_running_loop().time() - start
+    
+    elapsed = asyncio.run(run())
+    assert elapsed >= 0.18, f"속도 제한 버킷을 지켜야 합니다: {elapsed:.3f}초"
@@ -0,0 +1,146 @@
+"""
+VINA LLM 호출 계층 테스트
+
+프롬프트 캐시 블록 구성, 토큰 사용량 집계, 호출 게이트웨이를 테스트합니다.
+"""
+
+import types
+import asyncio
+import httpx
+import anthropic
+import vinallm
+
+def make_response(**usage):
+    """토큰 사용량만 가진 가짜 응답 객체"""
+    return types.SimpleNamespace(usage=types.SimpleNamespace(**usage))
+
+def test_cached_text_block():
+    """캐시 지점 표시 블록 테스트"""
+    block = vinallm.cached_text_block("고정 프롬프트")
+    
+    assert block["type"] == "text" and block["text"] == "고정 프롬프트", "텍스트 블록 형식이 올바르지 않습니다."
+    if vinallm.PROMPT_CACHE_ENABLED:
+        assert block["cache_control"] == {"type": "ephemeral"}, "캐시 지점이 표시되지 않았습니다."
+    assert "cache_control" not in vinallm.text_block("변하는 프롬프트"), "일반 블록에는 캐시 지점이 없어야 합니다."
+
+def test_record_usage():
+    """토큰 사용량 누적 테스트 (캐시 필드가 없는 응답 포함)"""
+    vinallm.usage_stats.clear()
+    
+    vinallm.record_usage("chat", make_response(input_tokens=20, output_tokens=5, cache_creation_input_tokens=1800, cache_read_input_tokens=0))
+    vinallm.record_usage("chat", make_response(input_tokens=30, output_tokens=7, cache_creation_input_tokens=0, cache_read_input_tokens=1800))
+    current = vinallm.record_usage("report", make_response(input_tokens=100, output_tokens=50))
+    
+    assert current["cache_read_input_tokens"] == 0, "캐시 필드가 없으면 0이어야 합니다."
+    assert vinallm.usage_stats["chat"] == {
+        "calls": 2,
+        "input_tokens": 50,
+        "cache_creation_input_tokens": 1800,
+        "cache_read_input_tokens": 1800,
+        "output_tokens": 12
+    }, "누적 토큰 수가 올바르지 않습니다."
+    assert "적중률 50%" in vinallm.format_usage_stats(), "캐시 적중률이 올바르지 않습니다."
+    
+    vinallm.usage_stats.clear()
+
+def test_none_reply_state():
+    """스트리밍 중 '/None' 응답 판별 테스트"""
+    # '/None'의 앞부분이면 아직 판단할 수 없음
+    for partial in ["", " ", "/", "/No", "/None", "/None\n"]:
+        assert vinallm.none_reply_state(partial) == "undecided", f"'{partial}'은 판단 보류여야 합니다."
+    
+    # '/None ' 뒤에 무엇이 오든 메시지를 보내지 않음
+    assert vinallm.none_reply_state("/None ") == "suppress", "'/None '은 전송 안 함이어야 합니다."
+    assert vinallm.none_reply_state("/None 늦은 시간") == "suppress", "'/None 설명'은 전송 안 함이어야 합니다."
+    
+    # '/None'과 다르게 시작하면 바로 보낼 수 있음
+    for partial in ["안녕", "/Nonsense", "/N하", "/None\n안녕"]:
+        assert vinallm.none_reply_state(partial) == "send", f"'{partial}'은 전송 가능이어야 합니다."
+    
+    # 완성된 응답 판별은 기존 규칙과 같음
+    assert vinallm.is_none_reply(" /None \n"), "'/None'은 전송 안 함이어야 합니다."
+    assert vinallm.is_none_reply("/None 지금은 안 보냄"), "'/None 설명'은 전송 안 함이어야 합니다."
+    assert not vinallm.is_none_reply("/Nonsense"), "'/Nonsense'는 전송해야 합니다."
+
+def make_status_error(status_code):
+    """지정한 HTTP 상태 코드의 Claude API 오류"""
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status_code, request=request, headers={"retry-after": "0"})
+    return anthropic.APIStatusError("오류", response=response, body=None)
+
+def test_gateway_priority_order():
+    """빈자리가 우선순위 순서로 배정되는지 테스트 (사용자 응답 > 규칙 > 메모리 > 리포트)"""
+    async def run():
+        gateway = vinallm.LLMGateway(concurrency=1, rate_per_minute=0, timeout=5, max_retries=0)
+        order = []
+        release_first = asyncio.Event()
+        
+        async def job(name):
+            order.append(name)
+            if name == "first":
+                await release_first.wait()
+            return name
+        
+        first = asyncio.create_task(gateway.call("memory", job, "first"))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(gateway.call(label, job, label)) for label in ["report", "memory", "chat", "rule"]]
+        await asyncio.sleep(0)
+        assert gateway.slots.waiting == 4, "자리가 없으면 대기해야 합니다."
+        
+        release_first.set()
+        await asyncio.gather(first, *waiting)
+        return order
+    
+    order = asyncio.run(run())
+    assert order == ["first", "chat", "rule", "memory", "report"], f"우선순위 순서가 올바르지 않습니다: {order}"
+
+def test_gateway_retries_and_timeout():
+    """429/529는 재시도하고, 400은 바로 실패하고, 시간 초과도 재시도하는지 테스트"""
+    async def run():
+        gateway = vinallm.LLMGateway(concurrency=2, rate_per_minute=0, timeout=0.05, max_retries=2)
+        
+        errors = [make_status_error(429), make_status_error(529)]
+        async def flaky():
+            if errors:
+                raise errors.pop(0)
+            return "성공"
+        assert await gateway.call("chat", flaky) == "성공", "재시도 후 성공해야 합니다."
+        assert gateway.stats["retries"] == 2
+        
+        async def bad_request():
+            raise make_status_error(400)
+        try:
+            await gateway.call("chat", bad_request)
+            assert False, "400 오류는 재시도 없이 실패해야 합니다."
+        except anthropic.APIStatusError as e:
+            assert e.status_code == 400
+        assert gateway.stats["retries"] == 2 and gateway.stats["failures"] == 1
+        
+        async def slow():
+            await asyncio.sleep(1)
+        try:
+            await gateway.call("chat", slow)
+            assert False, "시간 초과는 재시도 후 실패해야 합니다."
+        except asyncio.TimeoutError:
+            pass
+        assert gateway.stats["timeouts"] == 3 and gateway.stats["failures"] == 2
+        assert gateway.slots.active == 0, "실패 후에도 자리가 반환되어야 합니다."
+    
+    original_delay = vinallm.RETRY_BASE_DELAY
+    vinallm.RETRY_BASE_DELAY = 0.001
+    try:
+        asyncio.run(run())
+    finally:
+        vinallm.RETRY_BASE_DELAY = original_delay
+
+def test_token_bucket():
+    """분당 호출 수 제한 테스트"""
+    async def run():
+        bucket = vinallm.TokenBucket(rate_per_minute=600, capacity=2)  # 초당 10개
+        start = asyncio.get_running_loop().time()
+        for _ in range(3):
+            await bucket.take()
+        return asyncio.get_running_loop().time() - start
+    
+    elapsed = asyncio.run(run())
+    assert 0.05 <= elapsed < 0.5, f"용량을 넘는 호출은 토큰이 찰 때까지 기다려야 합니다: {elapsed:.3f}초"
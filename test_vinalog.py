@@ -0,0 +1,285 @@
+"""
+VINA 대화 기록 저장소 테스트
+
+임시 jsonl 파일로 vinalog의 읽기 함수를 검증합니다.
+"""
+
+import json
+import os
+import asyncio
+from vinalog import (
+    iter_jsonl_reverse,
+    load_last_message_time,
+    load_tail_records,
+    update_day_index,
+    load_day_records,
+    get_day_index_path,
+    JsonlHistoryStore,
+    SqliteHistoryStore,
+    BufferedHistoryWriter,
+    list_archive_segments
+)
+
+def write_records(path, records):
+    """테스트용 jsonl 파일 작성"""
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def make_records(count, channels=("c1",)):
+    """채널을 번갈아 가며 테스트용 기록 생성"""
+    records = []
+    for i in range(count):
+        records.append({
+            "role": "user" if i % 2 == 0 else "assistant",
+            "name": "사용자" if i % 2 == 0 else "VINA",
+            "channel": channels[i % len(channels)],
+            "content": f"메시지 {i} 안녕하세요",
+            "time": f"2025-04-24T10:{i // 60:02d}:{i % 60:02d}"
+        })
+    return records
+
+def test_iter_jsonl_reverse(tmp_path):
+    """작은 블록으로 나눠 읽어도 모든 기록이 역순으로 반환되는지 확인"""
+    path = tmp_path / "history.jsonl"
+    records = make_records(50)
+    write_records(path, records)
+
+    # 블록 경계가 한글 멀티바이트 문자 중간에 걸리도록 작은 블록 사용
+    result = list(iter_jsonl_reverse(str(path), block_size=7))
+
+    assert result == list(reversed(records)), "역순 읽기 결과가 원본과 다릅니다."
+
+def test_iter_jsonl_reverse_skips_broken_lines(tmp_path):
+    """깨진 줄과 빈 줄은 건너뛰는지 확인"""
+    path = tmp_path / "history.jsonl"
+    records = make_records(3)
+    write_records(path, records)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n{깨진 줄\n")
+
+    result = list(iter_jsonl_reverse(str(path), block_size=16))
+
+    assert result == list(reversed(records)), "깨진 줄이 결과에 포함되었습니다."
+
+def test_load_last_message_time(tmp_path):
+    """마지막 메시지 시간 로드 확인"""
+    path = tmp_path / "history.jsonl"
+    records = make_records(10)
+    write_records(path, records)
+
+    assert load_last_message_time(str(path)) == records[-1]["time"], "마지막 메시지 시간이 다릅니다."
+    assert load_last_message_time(str(tmp_path / "missing.jsonl")) is None, "없는 파일은 None이어야 합니다."
+
+def test_load_tail_records(tmp_path):
+    """채널별 최근 기록을 시간 순서로 반환하는지 확인"""
+    path = tmp_path / "history.jsonl"
+    records = make_records(40, channels=("c1", "c2"))
+    write_records(path, records)
+
+    tail = load_tail_records(str(path), per_channel=3)
+
+    assert set(tail.keys()) == {"c1", "c2"}, "채널 목록이 다릅니다."
+    for channel in ("c1", "c2"):
+        expected = [r for r in records if r["channel"] == channel][-3:]
+        assert tail[channel] == expected, f"채널 {channel}의 최근 기록이 다릅니다."
+
+def make_day_records(date_str, count):
+    """지정된 날짜의 테스트용 기록 생성"""
+    return [
+        {"role": "user", "name": "사용자", "channel": "c1", "content": f"{date_str} 메시지 {i}", "time": f"{date_str}T1{i % 10}:00:00"}
+        for i in range(count)
+    ]
+
+def test_day_index_ranges(tmp_path):
+    """날짜 인덱스로 해당 날짜의 기록만 읽는지 확인"""
+    path = tmp_path / "history.jsonl"
+    day1 = make_day_records("2025-04-23", 5)
+    day2 = make_day_records("2025-04-24", 7)
+    write_records(path, day1 + day2)
+
+    index = update_day_index(str(path))
+
+    assert set(index["days"].keys()) == {"2025-04-23", "2025-04-24"}, "인덱스 날짜 목록이 다릅니다."
+    assert index["indexed_size"] == os.path.getsize(path), "인덱싱된 크기가 파일 크기와 다릅니다."
+    assert os.path.exists(get_day_index_path(str(path))), "인덱스 파일이 저장되지 않았습니다."
+    assert load_day_records(str(path), "2025-04-24") == day2, "해당 날짜의 기록이 다릅니다."
+    assert load_day_records(str(path), "2025-04-25") == [], "없는 날짜는 빈 리스트여야 합니다."
+
+def test_day_index_incremental_update(tmp_path):
+    """로그가 추가되면 새로 추가된 부분만 인덱싱되는지 확인"""
+    path = tmp_path / "history.jsonl"
+    day1 = make_day_records("2025-04-23", 3)
+    write_records(path, day1)
+    update_day_index(str(path))
+
+    day2 = make_day_records("2025-04-24", 4)
+    with open(path, "a", encoding="utf-8") as f:
+        for record in day2:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # 아직 기록 중인 (줄바꿈 없는) 마지막 줄은 인덱싱하지 않음
+        f.write('{"role": "user"')
+
+    assert load_day_records(str(path), "2025-04-24") == day2, "추가된 기록이 인덱싱되지 않았습니다."
+    assert load_day_records(str(path), "2025-04-23") == day1, "기존 기록이 손상되었습니다."
+
+def test_day_index_rebuilds_after_truncate(tmp_path):
+    """로그 파일이 교체되어 작아지면 인덱스를 다시 생성하는지 확인"""
+    path = tmp_path / "history.jsonl"
+    write_records(path, make_day_records("2025-04-23", 10))
+    update_day_index(str(path))
+
+    replaced = make_day_records("2025-04-24", 2)
+    write_records(path, replaced)
+
+    assert load_day_records(str(path), "2025-04-24") == replaced, "교체된 파일의 기록이 다릅니다."
+    assert load_day_records(str(path), "2025-04-23") == [], "교체 전 기록이 남아 있습니다."
+
+def make_stores(tmp_path, records):
+    """같은 기록을 담은 jsonl 저장소와 SQLite 저장소 생성"""
+    jsonl_store = JsonlHistoryStore(str(tmp_path / "history.jsonl"))
+    sqlite_store = SqliteHistoryStore(str(tmp_path / "history.db"))
+    for store in (jsonl_store, sqlite_store):
+        store.append_many(records[:-1])
+        store.append(records[-1])
+    return jsonl_store, sqlite_store
+
+def test_history_stores_match(tmp_path):
+    """jsonl 저장소와 SQLite 저장소가 같은 조회 결과를 반환하는지 확인"""
+    records = make_day_records("2025-04-23", 4) + make_records(30, channels=("c1", "c2"))
+    jsonl_store, sqlite_store = make_stores(tmp_path, records)
+
+    for store in (jsonl_store, sqlite_store):
+        assert store.load_recent("c1", limit=3) == [r for r in records if r["channel"] == "c1"][-3:], \
+            f"{store.backend} 저장소의 최근 대화가 다릅니다."
+        assert store.load_recent("c1", user_name="없는 사용자", limit=3) == [], \
+            f"{store.backend} 저장소의 사용자 필터가 잘못되었습니다."
+        assert store.load_last_message_time() == records[-1]["time"], \
+            f"{store.backend} 저장소의 마지막 메시지 시간이 다릅니다."
+        assert store.load_day("2025-04-23") == records[:4], \
+            f"{store.backend} 저장소의 날짜 필터가 잘못되었습니다."
+        assert store.load_tail(2) == load_tail_records(jsonl_store.path, 2), \
+            f"{store.backend} 저장소의 채널별 최근 기록이 다릅니다."
+        assert sorted(store.load_tail(2)) == sorted(jsonl_store.load_tail(2)) == ["c1", "c2"], \
+            f"{store.backend} 저장소의 채널 키가 다릅니다."
+
+    sqlite_store.close()
+
+def test_history_store_channel_keys(tmp_path):
+    """숫자 채널 ID로 저장해도 두 저장소가 같은 문자열 키로 조회되는지 확인"""
+    records = make_records(6, channels=(1355113753427054806, 42))
+    jsonl_store, sqlite_store = make_stores(tmp_path, records)
+
+    tails = [store.load_tail(3) for store in (jsonl_store, sqlite_store)]
+    assert set(tails[0]) == set(tails[1]) == {"1355113753427054806", "42"}, "저장소마다 채널 키가 다릅니다."
+    assert tails[0] == tails[1], "저장소마다 채널별 최근 기록이 다릅니다."
+
+    for store in (jsonl_store, sqlite_store):
+        for channel in (42, "42"):
+            recent = store.load_recent(channel, limit=5)
+            assert [r["content"] for r in recent] == [r["content"] for r in records if r["channel"] == 42], \
+                f"{store.backend} 저장소가 채널 {channel!r}의 기록을 찾지 못했습니다."
+            assert all(r["channel"] == "42" for r in recent), f"{store.backend} 저장소의 채널 키가 문자열이 아닙니다."
+
+    sqlite_store.close()
+
+def test_sqlite_export_import(tmp_path):
+    """SQLite 저장소를 jsonl로 내보내고 다시 가져올 수 있는지 확인"""
+    records = make_records(10)
+    _, sqlite_store = make_stores(tmp_path, records)
+
+    export_path = str(tmp_path / "export.jsonl")
+    assert sqlite_store.export_jsonl(export_path) == len(records), "내보낸 기록 수가 다릅니다."
+    assert list(JsonlHistoryStore(export_path).iter_all()) == records, "내보낸 jsonl 내용이 다릅니다."
+
+    imported_store = SqliteHistoryStore(str(tmp_path / "imported.db"))
+    assert imported_store.import_jsonl(export_path) == len(records), "가져온 기록 수가 다릅니다."
+    assert list(imported_store.iter_all()) == records, "가져온 기록이 다릅니다."
+
+    sqlite_store.close()
+    imported_store.close()
+
+def test_buffered_writer_batches(tmp_path):
+    """로그 기록기가 기록을 모아 배치로 쓰고 종료 시 남은 기록을 저장하는지 확인"""
+    store = JsonlHistoryStore(str(tmp_path / "history.jsonl"), durability="none")
+    writer = BufferedHistoryWriter(store, max_batch=4, flush_interval=60)
+    records = make_records(10)
+
+    async def run():
+        await writer.start()
+        for record in records:
+            writer.submit(record)
+        # 배치 기준(4개)을 넘긴 기록은 시간 기준을 기다리지 않고 기록됨
+        for _ in range(100):
+            if writer.written_count >= 8:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+
+    assert writer.written_count >= 8, "배치 기준에 도달한 기록이 기록되지 않았습니다."
+    assert writer.flush_count < len(records), "기록이 배치로 묶이지 않았습니다."
+
+    writer.close()
+    assert writer.pending_count == 0, "종료 후에도 남은 기록이 있습니다."
+    assert list(store.iter_all()) == records, "기록된 내용이나 순서가 다릅니다."
+
+def test_buffered_writer_without_loop(tmp_path):
+    """이벤트 루프 없이 사용하면 즉시 기록되는지 확인"""
+    store = JsonlHistoryStore(str(tmp_path / "history.jsonl"), durability="fsync")
+    writer = BufferedHistoryWriter(store)
+    records = make_records(3)
+
+    for record in records:
+        writer.submit(record)
+
+    assert list(store.iter_all()) == records, "즉시 기록되지 않았습니다."
+    writer.close()
+
+def test_daily_rotation_with_transparent_reads(tmp_path):
+    """날짜가 바뀌면 로그가 압축 보관되고, 읽기 함수는 보관 구간도 함께 읽는지 확인"""
+    path = str(tmp_path / "history.jsonl")
+    store = JsonlHistoryStore(path, rotate="daily", compression="gzip")
+    day1 = make_day_records("2025-04-23", 5)
+    day2 = make_day_records("2025-04-24", 3)
+    day3 = make_day_records("2025-04-25", 2)
+
+    store.append_many(day1 + day2[:1])
+    store.append_many(day2[1:])
+    store.append_many(day3)
+
+    segments = list_archive_segments(path)
+    assert [(seg["first_date"], seg["last_date"]) for seg in segments] == [("2025-04-23", "2025-04-23"), ("2025-04-24", "2025-04-24")], \
+        "날짜별로 보관 구간이 만들어지지 않았습니다."
+    assert all(seg["path"].endswith(".gz") for seg in segments), "보관 구간이 압축되지 않았습니다."
+
+    # 현재 로그에는 마지막 날짜의 기록만 남음
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == len(day3), "현재 로그에 이전 날짜 기록이 남아 있습니다."
+
+    assert store.load_day("2025-04-23") == day1, "보관 구간의 날짜 기록을 읽지 못했습니다."
+    assert store.load_day("2025-04-24") == day2, "보관 구간의 날짜 기록을 읽지 못했습니다."
+    assert store.load_day("2025-04-25") == day3, "현재 로그의 날짜 기록을 읽지 못했습니다."
+    assert store.load_recent("c1", limit=4) == (day2 + day3)[-4:], "보관 구간을 넘어서는 최근 대화를 읽지 못했습니다."
+    assert list(store.iter_all()) == day1 + day2 + day3, "전체 기록 순서가 다릅니다."
+    store.close()
+
+def test_size_rotation_lzma(tmp_path):
+    """크기 기준 회전과 lzma 압축 확인"""
+    path = str(tmp_path / "history.jsonl")
+    store = JsonlHistoryStore(path, rotate="size", rotate_max_bytes=200, compression="lzma")
+    records = make_day_records("2025-04-24", 6)
+
+    for record in records:
+        store.append(record)
+
+    segments = list_archive_segments(path)
+    assert len(segments) >= 2, "크기 기준으로 회전되지 않았습니다."
+    assert all(seg["path"].endswith(".xz") for seg in segments), "lzma로 압축되지 않았습니다."
+    assert store.load_day("2025-04-24") == records, "회전된 기록을 모두 읽지 못했습니다."
+    assert store.load_last_message_time() == records[-1]["time"], "마지막 메시지 시간이 다릅니다."
+
+    # 현재 로그가 비어 있어도 보관 구간에서 마지막 시간을 찾음
+    store.rotate()
+    assert store.load_last_message_time() == records[-1]["time"], "보관 구간에서 마지막 메시지 시간을 찾지 못했습니다."
+    store.close()
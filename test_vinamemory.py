@@ -0,0 +1,75 @@
+"""
+VINA 메모리 분석 보조 도구 테스트
+
+메모리 분석 사전 필터의 판단 결과와 집계, 메시지 묶음 처리를 테스트합니다.
+"""
+
+import datetime
+
+from vinamemory import classify_memory_candidate, MemoryPrefilter, MemoryBatcher, format_batch_for_analysis
+
+def test_trivial_messages_skipped():
+    """기억할 정보가 있을 수 없는 메시지는 건너뛰는지 테스트"""
+    for text in ["ㅋㅋㅋㅋ", "응", "ㅇㅋ!", "😂😂", "고마워~", "   ", "오늘 날씨 어때?"]:
+        analyze, reason = classify_memory_candidate(text)
+        assert not analyze, f"'{text}'는 건너뛰어야 합니다. ({reason})"
+
+def test_memory_candidates_analyzed():
+    """사실 정보, 맥락적 규칙, 규칙 추가/삭제 요청은 분석하는지 테스트"""
+    for text in [
+        "매일 아침 8시에 깨워줘",
+        "morning_greeting 규칙 삭제해줘",
+        "앞으로 존댓말 하지 마",
+        "나 고양이 키워",
+        "난 민트초코 좋아",
+        "내일 시험이라 걱정돼",
+        "7:30에 운동 가자고 해줘"
+    ]:
+        analyze, reason = classify_memory_candidate(text)
+        assert analyze, f"'{text}'는 분석해야 합니다. ({reason})"
+
+def test_prefilter_stats():
+    """건너뛴 비율 집계 테스트"""
+    prefilter = MemoryPrefilter()
+    results = [prefilter.should_analyze(text) for text in ["ㅋㅋ", "응", "나는 개발자야", "ㅠㅠ"]]
+    
+    assert results == [False, False, True, False], "필터 판단 결과가 올바르지 않습니다."
+    assert prefilter.skip_rate == 75, "건너뛴 비율이 올바르지 않습니다."
+    assert "3/4개 건너뜀 (75%)" in prefilter.format_stats(), "진단 요약이 올바르지 않습니다."
+    
+    # 필터를 끄면 항상 분석
+    assert MemoryPrefilter(enabled=False).should_analyze("ㅋㅋ"), "필터가 꺼지면 항상 분석해야 합니다."
+
+def test_batcher_flushes_on_size():
+    """N개가 모이면 바로 묶음을 내보내는지 테스트"""
+    batcher = MemoryBatcher(max_messages=3, idle_seconds=60)
+    now = datetime.datetime(2025, 4, 1, 9, 0)
+    
+    assert batcher.add("민수", "나 고양이 키워", "1", now) is None
+    assert batcher.add("지은", "난 민트초코 좋아", "2", now) is None
+    assert batcher.add("민수", "이름은 나비야", "1", now) is None
+    batch = batcher.add("민수", "아 나비 말고 보리야", "1", now + datetime.timedelta(seconds=5))
+    
+    assert batch is not None, "3개가 모이면 묶음을 내보내야 합니다."
+    assert batch["user_name"] == "민수" and len(batch["messages"]) == 3, "묶음 내용이 올바르지 않습니다."
+    assert batcher.pending_count == 1, "다른 사용자의 메시지는 계속 대기해야 합니다."
+    
+    text = format_batch_for_analysis(batch["messages"])
+    assert text.splitlines()[2] == '3. [09:00] "아 나비 말고 보리야"', "묶음 텍스트 형식이 올바르지 않습니다."
+
+def test_batcher_flushes_on_idle():
+    """대화가 잠잠해지면 묶음을 내보내는지 테스트"""
+    batcher = MemoryBatcher(max_messages=10, idle_seconds=60)
+    start = datetime.datetime(2025, 4, 1, 9, 0)
+    assert batcher.seconds_until_due(start) is None, "대기 중인 묶음이 없으면 None이어야 합니다."
+    
+    batcher.add("민수", "나 고양이 키워", "1", start)
+    batcher.add("지은", "내일 시험이야", "2", start + datetime.timedelta(seconds=30))
+    
+    assert batcher.seconds_until_due(start + datetime.timedelta(seconds=20)) == 40, "남은 시간이 올바르지 않습니다."
+    assert batcher.pop_due(start + datetime.timedelta(seconds=59)) == [], "대기 시간 전에는 내보내면 안 됩니다."
+    
+    due = batcher.pop_due(start + datetime.timedelta(seconds=60))
+    assert [batch["user_name"] for batch in due] == ["민수"], "대기 시간이 지난 묶음만 내보내야 합니다."
+    assert [batch["user_name"] for batch in batcher.pop_all()] == ["지은"], "남은 묶음을 모두 꺼내야 합니다."
+    assert batcher.pending_count == 0
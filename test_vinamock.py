@@ -0,0 +1,78 @@
+"""
+VINA 오프라인 모의 LLM 백엔드 테스트
+
+지연 분포, 요청 종류별 응답, 스트리밍, '/None'/오류 주입, 캐시 토큰 흉내를 테스트합니다.
+"""
+
+import json
+import random
+import asyncio
+import anthropic
+import vinamock
+from vinamock import MockAsyncClient, parse_latency
+
+def user_message(*blocks):
+    return [{"role": "user", "content": list(blocks)}]
+
+def test_parse_latency():
+    """지연 분포 설정 해석 테스트"""
+    rng = random.Random(0)
+    assert parse_latency("0.5")(rng) == 0.5
+    assert parse_latency("fixed:0.2")(rng) == 0.2
+    assert all(0.1 <= parse_latency("uniform:0.1,0.3")(rng) <= 0.3 for _ in range(20))
+    assert all(parse_latency("normal:0,1")(rng) >= 0 for _ in range(20)), "지연은 음수가 될 수 없습니다."
+    try:
+        parse_latency("poisson:1")
+        assert False, "지원하지 않는 분포는 오류여야 합니다."
+    except ValueError:
+        pass
+
+def test_mock_replies_by_kind():
+    """메모리 분석은 JSON, 리포트는 리포트 형식, 대화는 요청을 담은 응답인지 테스트"""
+    async def run():
+        client = MockAsyncClient(latency="0")
+        memory = await client.messages.create(messages=user_message({"type": "text", "text": '응답 형식: {"has_valuable_info": true}'}))
+        report = await client.messages.create(messages=[{"role": "user", "content": "# 2025년 4월 24일 리포트\n**🧠 핵심 키워드**: [...]"}])
+        chat = await client.messages.create(messages=user_message({"type": "text", "text": "# 5. 현재 요청\n점심 뭐 먹지\n\n# 응답 가이드\n..."}))
+        return memory, report, chat
+    
+    memory, report, chat = asyncio.run(run())
+    assert json.loads(memory.content[0].text)["has_valuable_info"] is False, "메모리 분석은 정해진 JSON이어야 합니다."
+    assert report.content[0].text.startswith("# 2025년 4월 24일 리포트") and "**🧠 핵심 키워드**" in report.content[0].text
+    assert "점심 뭐 먹지" in chat.content[0].text, "대화 응답에 현재 요청이 담겨야 합니다."
+
+def test_mock_stream_and_cache_usage():
+    """스트리밍 조각과 캐시 생성/읽기 토큰 흉내 테스트"""
+    async def run():
+        client = MockAsyncClient(latency="0", chunk_delay=0)
+        blocks = ({"type": "text", "text": "고정 앞부분", "cache_control": {"type": "ephemeral"}},
+                  {"type": "text", "text": "# 5. 현재 요청\n안녕하세요 반가워요 오늘 날씨가 좋네요"})
+        first = await client.messages.create(messages=user_message(*blocks))
+        async with client.messages.stream(messages=user_message(*blocks)) as stream:
+            chunks = [text async for text in stream.text_stream]
+            final = await stream.get_final_message()
+        return first, chunks, final
+    
+    first, chunks, final = asyncio.run(run())
+    assert len(chunks) > 1 and "".join(chunks) == final.content[0].text, "스트리밍 조각을 이으면 전체 응답이어야 합니다."
+    assert first.usage.cache_creation_input_tokens == vinamock.vinabudget.estimate_tokens("고정 앞부분"), "첫 호출은 캐시 생성이어야 합니다."
+    assert final.usage.cache_read_input_tokens == first.usage.cache_creation_input_tokens, "같은 앞부분은 캐시 읽기여야 합니다."
+    assert final.usage.cache_creation_input_tokens == 0 and final.usage.input_tokens > 0
+
+def test_mock_none_and_error_injection():
+    """'/None' 응답과 API 오류 주입 테스트"""
+    async def run():
+        none_client = MockAsyncClient(latency="0", none_rate=1.0)
+        reply = await none_client.messages.create(messages=user_message({"type": "text", "text": "# 5. 현재 요청\n안녕"}))
+        
+        error_client = MockAsyncClient(latency="0", error_rate=1.0, error_status=429)
+        try:
+            await error_client.messages.create(messages=user_message({"type": "text", "text": "안녕"}))
+            assert False, "오류가 발생해야 합니다."
+        except anthropic.RateLimitError as e:
+            assert e.status_code == 429
+        return reply, error_client
+    
+    reply, error_client = asyncio.run(run())
+    assert reply.content[0].text == "/None", "'/None' 비율이 1이면 항상 '/None'이어야 합니다."
+    assert error_client.messages.stats["errors"] == 1
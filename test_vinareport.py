@@ -13,7 +13,10 @@ from vinareport import (
     clean_messages,
     convert_to_document,
     generate_report_prompt,
-    extract_stats_from_report
+    extract_stats_from_report,
+    extract_stats_from_document,
+    iter_clean_messages,
+    build_document
 )
 
 def test_load_conversation_data():
@@ -128,6 +131,32 @@ def test_stats_extraction():
     print(f"✅ 테스트 성공: 통계 정보 추출 성공 - {stats}")
     return stats
 
+def test_streaming_pipeline():
+    """스트리밍 단계가 리스트 단계와 같은 결과를 내는지 테스트"""
+    sample_messages = [
+        {"role": "user", "name": "민수", "content": "오늘 시험 봤어", "time": "2025-04-24T10:00:00"},
+        {"role": "assistant", "content": "/None", "time": "2025-04-24T10:00:05"},
+        {"role": "system", "content": "시스템 메시지", "time": "2025-04-24T10:01:00"},
+        {"role": "user", "name": "민수", "content": "오늘 시험 봤어", "time": "2025-04-24T10:02:00"},
+        {"role": "assistant", "content": "수고했어요!", "time": "2025-04-24T13:30:00"}
+    ]
+    
+    cleaned = clean_messages(sample_messages)
+    list_document = convert_to_document(cleaned)
+    
+    # 제너레이터를 그대로 연결해도 결과가 같아야 함
+    stream_document = build_document(iter_clean_messages(iter(sample_messages)))
+    
+    assert len(cleaned) == 2, "정제 결과가 올바르지 않습니다."
+    assert stream_document.text == list_document.text, "스트리밍 문서 내용이 일치하지 않습니다."
+    assert stream_document.metadata["message_count"] == 2, "스트리밍 문서의 메시지 수가 올바르지 않습니다."
+    assert stream_document.metadata["date"] == "2025-04-24", "스트리밍 문서의 날짜가 올바르지 않습니다."
+    
+    # 문서 메타데이터 기반 통계가 메시지 기반 통계와 같아야 함
+    assert extract_stats_from_document("", stream_document) == extract_stats_from_report("", cleaned), "통계 정보가 일치하지 않습니다."
+    
+    print(f"✅ 테스트 성공: 스트리밍 파이프라인 결과 일치 - {stream_document.metadata}")
+
 def run_tests():
     """모든 테스트 실행"""
     try:
@@ -136,6 +165,7 @@ def run_tests():
         document = test_document_conversion(cleaned_msgs)
         prompt = test_prompt_generation(document)
         stats = test_stats_extraction()
+        test_streaming_pipeline()
         
         print("\n🎉 모든 테스트가 성공적으로 완료되었습니다!")
         return True
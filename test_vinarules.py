@@ -0,0 +1,327 @@
+"""
+VINA 규칙 엔진 테스트
+
+조건 태그 컴파일과 컴파일된 규칙 평가를 테스트합니다.
+"""
+
+import os
+import datetime
+import tempfile
+from vinarules import (
+    compile_condition,
+    compile_rules,
+    parse_message_time,
+    ActivityTracker,
+    RuleScheduler,
+    RuleStateStore,
+    TimeCondition,
+    ElapsedCondition,
+    WeekdayCondition,
+    UnknownCondition
+)
+
+def test_compile_condition():
+    """조건 태그가 올바른 조건 객체로 컴파일되는지 테스트"""
+    time_cond = compile_condition("time==08:30")
+    elapsed_cond = compile_condition("last_message_elapsed>1200")
+    weekday_cond = compile_condition("weekday==1-5")
+    unknown_cond = compile_condition("sunny==true")
+    
+    assert isinstance(time_cond, TimeCondition), "시간 조건으로 컴파일되지 않았습니다."
+    assert (time_cond.hour, time_cond.minute) == (8, 30), "시간 값이 올바르지 않습니다."
+    assert isinstance(elapsed_cond, ElapsedCondition), "경과 시간 조건으로 컴파일되지 않았습니다."
+    assert elapsed_cond.seconds == 1200, "경과 시간 값이 올바르지 않습니다."
+    assert isinstance(weekday_cond, WeekdayCondition), "요일 조건으로 컴파일되지 않았습니다."
+    assert (weekday_cond.start_day, weekday_cond.end_day) == (1, 5), "요일 범위가 올바르지 않습니다."
+    assert isinstance(unknown_cond, UnknownCondition), "알 수 없는 태그가 구분되지 않았습니다."
+    
+    # 같은 태그는 한 번만 컴파일됨
+    assert compile_condition("time==08:30") is time_cond, "같은 태그가 다시 컴파일되었습니다."
+
+def test_condition_evaluation():
+    """컴파일된 조건의 평가 결과 테스트"""
+    now = datetime.datetime(2025, 4, 24, 8, 30, 15)  # 목요일
+    last_dt = now - datetime.timedelta(minutes=30)
+    
+    assert compile_condition("time==08:30").evaluate(now, last_dt), "시간 조건이 충족되어야 합니다."
+    assert not compile_condition("time==08:31").evaluate(now, last_dt), "시간 조건이 충족되면 안 됩니다."
+    assert compile_condition("last_message_elapsed>1200").evaluate(now, last_dt), "경과 시간 조건이 충족되어야 합니다."
+    assert not compile_condition("last_message_elapsed>3600").evaluate(now, last_dt), "경과 시간 조건이 충족되면 안 됩니다."
+    assert not compile_condition("last_message_elapsed>10").evaluate(now, None), "마지막 메시지가 없으면 불충족이어야 합니다."
+    assert compile_condition("weekday==1-5").evaluate(now, last_dt), "평일 조건이 충족되어야 합니다."
+    assert not compile_condition("weekday==6-7").evaluate(now, last_dt), "주말 조건이 충족되면 안 됩니다."
+    assert not compile_condition("sunny==true").evaluate(now, last_dt), "알 수 없는 태그는 항상 불충족이어야 합니다."
+
+def test_compiled_rules():
+    """규칙 전체 평가 테스트 (모든 조건 충족 + 활성 상태)"""
+    rules = [
+        {"id": "morning", "active": True, "condition_tags": ["time==08:30", "weekday==1-5"]},
+        {"id": "weekend", "active": True, "condition_tags": ["time==08:30", "weekday==6-7"]},
+        {"id": "disabled", "active": False, "condition_tags": ["time==08:30"]},
+        "잘못된 규칙"
+    ]
+    compiled = compile_rules(rules)
+    now = datetime.datetime(2025, 4, 24, 8, 30)
+    
+    assert [rule.id for rule in compiled] == ["morning", "weekend", "disabled"], "규칙 목록이 올바르지 않습니다."
+    assert [rule.evaluate(now, None) for rule in compiled] == [True, False, False], "규칙 평가 결과가 올바르지 않습니다."
+    assert [result for _, result in compiled[1].evaluate_conditions(now, None)] == [True, False], "조건별 평가 결과가 올바르지 않습니다."
+
+def test_parse_message_time():
+    """메시지 시간 문자열 변환 테스트"""
+    assert parse_message_time("2025-04-24T08:30:00") == datetime.datetime(2025, 4, 24, 8, 30), "시간 변환이 올바르지 않습니다."
+    assert parse_message_time(None) is None, "빈 값은 None이어야 합니다."
+    assert parse_message_time("잘못된 시간") is None, "잘못된 값은 None이어야 합니다."
+
+def test_next_fire_time():
+    """규칙별 다음 실행 시각 계산 테스트"""
+    after = datetime.datetime(2025, 4, 25, 9, 0, 30)  # 금요일
+    last_dt = datetime.datetime(2025, 4, 25, 8, 50)
+    
+    def next_time(tags):
+        return compile_rules([{"id": "r", "active": True, "condition_tags": tags}])[0].next_fire_time(after, last_dt)
+    
+    assert next_time(["time==09:00"]) == after, "현재 분에 해당하는 시간 조건은 바로 실행되어야 합니다."
+    assert next_time(["time==08:00"]) == datetime.datetime(2025, 4, 26, 8, 0), "지난 시간은 다음 날로 예약되어야 합니다."
+    assert next_time(["time==08:00", "weekday==1-5"]) == datetime.datetime(2025, 4, 28, 8, 0), "주말을 건너뛰고 월요일로 예약되어야 합니다."
+    assert next_time(["last_message_elapsed>1200"]) == datetime.datetime(2025, 4, 25, 9, 10, 0, 1), "경과 시간 조건 예약이 올바르지 않습니다."
+    assert next_time(["last_message_elapsed>60", "weekday==6-7"]) == datetime.datetime(2025, 4, 26), "요일 조건 예약이 올바르지 않습니다."
+    assert next_time(["time==08:00", "time==09:30"]) is None, "동시에 충족될 수 없는 조건은 예약되면 안 됩니다."
+    assert next_time(["sunny==true"]) is None, "알 수 없는 조건은 예약되면 안 됩니다."
+
+def test_rule_scheduler():
+    """스케줄러가 가장 이른 규칙부터 한 번씩 꺼내는지 테스트"""
+    rules = compile_rules([
+        {"id": "noon", "active": True, "condition_tags": ["time==12:00"]},
+        {"id": "morning", "active": True, "condition_tags": ["time==08:00"]},
+        {"id": "disabled", "active": False, "condition_tags": ["time==07:00"]}
+    ])
+    scheduler = RuleScheduler()
+    now = datetime.datetime(2025, 4, 24, 7, 59, 30)
+    
+    scheduler.rebuild(rules, now, None)
+    assert scheduler.peek()[1].id == "morning", "가장 이른 규칙이 먼저 와야 합니다."
+    assert scheduler.seconds_until_next(now, 600) == 30, "다음 실행까지 남은 시간이 올바르지 않습니다."
+    assert scheduler.pop_due(now) == [], "아직 실행할 규칙이 없어야 합니다."
+    
+    # 정확히 예약 시각에 실행
+    fire_time = datetime.datetime(2025, 4, 24, 8, 0)
+    assert [rule.id for rule in scheduler.pop_due(fire_time)] == ["morning"], "예약된 규칙이 실행되어야 합니다."
+    
+    # 같은 분 안에서 다시 계산해도 중복 실행되지 않음
+    scheduler.rebuild(rules, fire_time + datetime.timedelta(seconds=5), None)
+    assert scheduler.peek()[1].id == "noon", "실행된 규칙이 같은 분에 다시 예약되면 안 됩니다."
+    assert scheduler.seconds_until_next(fire_time, 600) == 600, "최대 대기 시간이 적용되어야 합니다."
+
+def test_once_per_idle_period():
+    """경과 시간 규칙이 대화 공백 구간마다 한 번만 실행되는지 테스트"""
+    rules = compile_rules([{"id": "idle", "active": True, "condition_tags": ["last_message_elapsed>1200"]}])
+    scheduler = RuleScheduler()
+    user_dt = datetime.datetime(2025, 4, 24, 10, 0)
+    now = user_dt + datetime.timedelta(minutes=30)
+    
+    scheduler.rebuild(rules, now, user_dt, user_dt)
+    assert [rule.id for rule in scheduler.pop_due(now, user_dt)] == ["idle"], "경과 시간 규칙이 실행되어야 합니다."
+    
+    # 사용자가 말하기 전까지는 다시 예약되지 않음
+    later = now + datetime.timedelta(hours=3)
+    scheduler.rebuild(rules, later, user_dt, user_dt)
+    assert scheduler.peek() is None, "같은 공백 구간에 다시 예약되면 안 됩니다."
+    assert scheduler.state.waiting_for_message(rules[0], user_dt), "새 메시지 대기 상태여야 합니다."
+    
+    # 새 사용자 메시지 이후 다시 경과 시간이 지나면 실행
+    new_user_dt = later
+    scheduler.rebuild(rules, later, new_user_dt, new_user_dt)
+    assert scheduler.peek()[0] == new_user_dt + datetime.timedelta(seconds=1200, microseconds=1), "새 공백 구간에 다시 예약되어야 합니다."
+
+def test_rule_cooldown():
+    """쿨다운 동안 규칙이 다시 예약되지 않는지 테스트"""
+    rules = compile_rules([{"id": "weekday", "active": True, "cooldown": 3600, "condition_tags": ["weekday==1-7"]}])
+    scheduler = RuleScheduler()
+    now = datetime.datetime(2025, 4, 24, 10, 0, 30)
+    
+    scheduler.rebuild(rules, now, None)
+    assert len(scheduler.pop_due(now)) == 1, "규칙이 실행되어야 합니다."
+    
+    scheduler.rebuild(rules, now + datetime.timedelta(minutes=5), None)
+    assert scheduler.peek()[0] == now + datetime.timedelta(seconds=3600), "쿨다운 이후로 예약되어야 합니다."
+
+def test_rule_state_persistence():
+    """규칙 실행 상태가 파일에 저장되고 다시 로드되는지 테스트"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rule_state.json")
+        store = RuleStateStore(path)
+        fired_at = datetime.datetime(2025, 4, 24, 10, 30)
+        store.record_fire("idle", fired_at, datetime.datetime(2025, 4, 24, 10, 0))
+        store.record_fire("idle", fired_at, datetime.datetime(2025, 4, 24, 10, 0))
+        store.save()
+        
+        loaded = RuleStateStore(path)
+        assert loaded.last_fired("idle") == fired_at, "마지막 실행 시간이 저장되지 않았습니다."
+        assert loaded.get("idle")["fire_count"] == 2, "실행 횟수가 저장되지 않았습니다."
+        assert loaded.get("idle")["idle_anchor"] == "2025-04-24T10:00:00", "공백 구간 기준 시간이 저장되지 않았습니다."
+        
+        # 깨진 파일은 빈 상태로 시작
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{broken")
+        assert RuleStateStore(path).states == {}, "깨진 상태 파일은 무시되어야 합니다."
+
+def test_activity_tracker():
+    """채널별/사용자별 마지막 메시지 시간이 기록되고 저장되는지 테스트"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "activity.json")
+        tracker = ActivityTracker(path, default_channel="main")
+        tracker.record("main", "2025-04-24T10:00:00", "민수")
+        tracker.record("main", "2025-04-24T10:00:05")
+        tracker.record("game", "2025-04-24T11:00:00", "지연")
+        
+        # 오래된 기록으로는 덮어쓰지 않음 (시작 시 로그에서 복원하는 경우)
+        tracker.record("game", "2025-04-24T09:00:00", "지연")
+        
+        assert tracker.last_message_time("main") == "2025-04-24T10:00:05", "VINA 메시지도 채널 활동으로 기록되어야 합니다."
+        assert tracker.last_message_time("main", user_only=True) == "2025-04-24T10:00:00", "사용자 메시지 시간이 따로 기록되어야 합니다."
+        assert tracker.last_message_time() == "2025-04-24T11:00:00", "전체 기준은 가장 최근 채널 활동이어야 합니다."
+        assert tracker.user_last_message("지연") == datetime.datetime(2025, 4, 24, 11, 0), "오래된 기록이 최근 기록을 덮어쓰면 안 됩니다."
+        assert tracker.users["지연"]["channel"] == "game", "사용자의 마지막 채널이 기록되어야 합니다."
+        
+        tracker.save()
+        assert not tracker.dirty, "저장 후에는 변경 표시가 지워져야 합니다."
+        loaded = ActivityTracker(path, default_channel="main")
+        assert loaded.channels == tracker.channels and loaded.users == tracker.users, "활동 기록이 저장되지 않았습니다."
+        
+        # 깨진 파일은 빈 상태로 시작
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{broken")
+        assert ActivityTracker(path).channels == {}, "깨진 활동 기록 파일은 무시되어야 합니다."
+
+def test_rule_channel_scope():
+    """경과 시간 규칙이 대상 채널/전체/사용자 기준으로 따로 예약되는지 테스트"""
+    tracker = ActivityTracker(default_channel="main")
+    tracker.record("main", "2025-04-24T10:00:00", "민수")
+    tracker.record("game", "2025-04-24T10:30:00", "지연")
+    rules = compile_rules([
+        {"id": "main_idle", "active": True, "condition_tags": ["last_message_elapsed>1200"]},
+        {"id": "game_idle", "active": True, "channel": "game", "condition_tags": ["last_message_elapsed>1200"]},
+        {"id": "global_idle", "active": True, "scope": "global", "condition_tags": ["last_message_elapsed>1200"]},
+        {"id": "minsu_idle", "active": True, "channel": "game", "scope": "user:민수", "condition_tags": ["last_message_elapsed>1200"]}
+    ])
+    assert tracker.rule_channel(rules[0]) == "main", "채널이 없는 규칙은 기본 채널로 보내야 합니다."
+    assert tracker.rule_channel(rules[1]) == "game", "규칙에 지정한 채널로 보내야 합니다."
+    
+    scheduler = RuleScheduler()
+    now = datetime.datetime(2025, 4, 24, 10, 25)
+    scheduler.rebuild(rules, now, activity=tracker)
+    game_fire = datetime.datetime(2025, 4, 24, 10, 50, 0, 1)
+    assert scheduler.next_fire["main_idle"] == now, "메인 채널 기준으로 이미 경과했으므로 지금 실행되어야 합니다."
+    assert scheduler.next_fire["game_idle"] == game_fire, "다른 채널 메시지는 해당 채널 규칙만 미뤄야 합니다."
+    assert scheduler.next_fire["global_idle"] == game_fire, "전체 기준 규칙은 가장 최근 채널 활동을 따라야 합니다."
+    assert scheduler.next_fire["minsu_idle"] == now, "사용자 기준 규칙은 해당 사용자의 마지막 메시지를 따라야 합니다."
+    
+    # 실행 기록의 공백 구간 기준도 규칙의 채널 기준
+    due = scheduler.pop_due(now)
+    assert {rule.id for rule in due} == {"main_idle", "minsu_idle"}, "기준 시간이 지난 규칙만 실행되어야 합니다."
+    assert scheduler.state.get("main_idle")["idle_anchor"] == "2025-04-24T10:00:00", "공백 구간 기준이 대상 채널의 사용자 메시지여야 합니다."
+    
+    # 다른 채널에서 말해도 메인 채널 규칙은 새 메시지 대기 상태 유지
+    tracker.record("game", "2025-04-24T10:40:00", "지연")
+    scheduler.rebuild(rules, now + datetime.timedelta(hours=1), activity=tracker)
+    assert "main_idle" not in scheduler.next_fire, "다른 채널 메시지로 메인 채널 규칙이 다시 예약되면 안 됩니다."
+
+def test_next_fire_snapshot():
+    """다음 실행 예정 시각이 저장되고 재시작 후 놓친 예약을 찾는지 테스트"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rule_state.json")
+        rules = compile_rules([
+            {"id": "morning", "active": True, "condition_tags": ["time==08:00"]},
+            {"id": "noon", "active": True, "condition_tags": ["time==12:00"]}
+        ])
+        scheduler = RuleScheduler(RuleStateStore(path))
+        now = datetime.datetime(2025, 4, 24, 7, 0)
+        scheduler.rebuild(rules, now, None)
+        assert scheduler.state.dirty, "예약이 바뀌면 저장할 상태가 있어야 합니다."
+        scheduler.state.save()
+        
+        # 같은 예약이면 다시 저장할 필요 없음
+        scheduler.rebuild(rules, now + datetime.timedelta(minutes=1), None)
+        assert not scheduler.state.dirty, "예약이 그대로면 상태가 바뀌면 안 됩니다."
+        
+        # 08:00 전에 꺼졌다가 09:00에 다시 시작
+        restarted = RuleStateStore(path)
+        assert restarted.get("noon")["next_fire"] == "2025-04-24T12:00:00", "다음 실행 예정 시각이 저장되지 않았습니다."
+        missed = restarted.missed_rules(datetime.datetime(2025, 4, 24, 9, 0))
+        assert missed == [("morning", datetime.datetime(2025, 4, 24, 8, 0))], "놓친 예약만 찾아야 합니다."
+        
+        # 실행하면 예약 기록은 지워짐
+        scheduler = RuleScheduler(restarted)
+        scheduler.rebuild(rules, datetime.datetime(2025, 4, 24, 12, 0), None)
+        scheduler.pop_due(datetime.datetime(2025, 4, 24, 12, 0))
+        assert "next_fire" not in restarted.get("noon"), "실행한 규칙의 예약 기록은 지워져야 합니다."
+    
+    # 경과 시간 규칙: 꺼져 있는 동안 예약 시각이 지나도 재시작 후 바로 실행되므로 놓친 예약이 아님
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rule_state.json")
+        rules = compile_rules([
+            {"id": "idle", "active": True, "condition_tags": ["last_message_elapsed>1200"]},
+            {"id": "morning", "active": True, "condition_tags": ["time==08:00"]}
+        ])
+        tracker = ActivityTracker(default_channel="main")
+        tracker.record("main", "2025-04-24T07:40:00", "민수")
+        scheduler = RuleScheduler(RuleStateStore(path))
+        scheduler.rebuild(rules, datetime.datetime(2025, 4, 24, 7, 50), activity=tracker)
+        assert scheduler.state.get("idle")["next_fire"] == "2025-04-24T08:00:00", "경과 시간 규칙의 예약이 저장되어야 합니다."
+        scheduler.state.save()
+        
+        restart = datetime.datetime(2025, 4, 24, 9, 0)
+        scheduler = RuleScheduler(RuleStateStore(path))
+        assert {rule_id for rule_id, _ in scheduler.state.missed_rules(restart)} == {"idle", "morning"}, "저장된 예약은 모두 지나간 상태여야 합니다."
+        missed = scheduler.missed_rules(rules, restart, activity=tracker)
+        assert missed == [("morning", datetime.datetime(2025, 4, 24, 8, 0))], f"바로 실행될 경과 시간 규칙은 제외해야 합니다: {missed}"
+        
+        # 로그와 실제 동작이 일치: 제외된 경과 시간 규칙만 바로 실행
+        scheduler.rebuild(rules, restart, activity=tracker)
+        assert [rule.id for rule in scheduler.pop_due(restart)] == ["idle"], "경과 시간 규칙은 재시작 후 실행되어야 합니다."
+
+def test_record_fire_after_success():
+    """실행에 실패한 규칙은 기록을 남기지 않고 잠시 후 다시 예약되는지 테스트"""
+    rules = compile_rules([{"id": "idle", "active": True, "condition_tags": ["last_message_elapsed>1200"]}])
+    scheduler = RuleScheduler()
+    user_dt = datetime.datetime(2025, 4, 24, 10, 0)
+    now = user_dt + datetime.timedelta(minutes=30)
+    
+    scheduler.rebuild(rules, now, user_dt, user_dt)
+    due = scheduler.pop_due(now, record=False)
+    assert [rule.id for rule in due] == ["idle"], "경과 시간 규칙이 실행되어야 합니다."
+    assert scheduler.state.last_fired("idle") is None, "실행 결과 전에는 기록을 남기면 안 됩니다."
+    
+    # 전송 실패: 공백 구간 제한 없이 다시 시도 시각에 예약
+    retry_at = now + datetime.timedelta(seconds=60)
+    scheduler.defer(due[0], retry_at)
+    scheduler.rebuild(rules, now + datetime.timedelta(seconds=5), user_dt, user_dt)
+    assert scheduler.peek()[0] == retry_at, "실패한 규칙은 다시 시도 시각에 예약되어야 합니다."
+    
+    # 전송 성공: 이번 공백 구간에는 다시 예약되지 않음
+    due = scheduler.pop_due(retry_at, record=False)
+    scheduler.record_fire(due[0], retry_at)
+    scheduler.rebuild(rules, retry_at + datetime.timedelta(hours=1), user_dt, user_dt)
+    assert scheduler.peek() is None, "성공한 규칙은 같은 공백 구간에 다시 예약되면 안 됩니다."
+    assert scheduler.state.get("idle")["fire_count"] == 1, "성공한 실행만 기록되어야 합니다."
+
+def test_activity_seed_legacy_channel_names():
+    """채널 이름으로 저장된 예전 기록을 채널 ID로 바꿔서 복원하는지 테스트"""
+    tracker = ActivityTracker(default_channel="1355113753427054806")
+    records = [
+        {"role": "user", "name": "민수", "channel": "1355113753427054806", "time": "2025-04-24T10:00:00"},
+        {"role": "assistant", "name": "VINA", "channel": "vina-채팅", "time": "2025-04-24T10:05:00"},
+        {"role": "assistant", "name": "VINA", "channel": "없어진-채널", "time": "2025-04-24T10:06:00"},
+        {"role": "user", "name": "지연", "channel": 42, "time": "2025-04-24T10:07:00"}
+    ]
+    skipped = tracker.seed(records, {"vina-채팅": "1355113753427054806"})
+    
+    assert skipped == 1, "ID를 알 수 없는 기록만 건너뛰어야 합니다."
+    assert set(tracker.channels) == {"1355113753427054806", "42"}, f"채널 이름이 활동 키로 남으면 안 됩니다: {tracker.channels}"
+    assert tracker.last_message_time("1355113753427054806") == "2025-04-24T10:05:00", "예전 기록이 채널 ID 기준으로 반영되어야 합니다."
+    assert tracker.last_message_time("1355113753427054806", user_only=True) == "2025-04-24T10:00:00"
+    
+    # 메인 채널 규칙이 예전 기록의 활동을 기준으로 계산됨
+    rule = compile_rules([{"id": "idle", "active": True, "condition_tags": ["last_message_elapsed>1200"]}])[0]
+    assert tracker.resolve(rule)[0] == datetime.datetime(2025, 4, 24, 10, 5), "규칙이 예전 기록의 활동을 볼 수 있어야 합니다."
@@ -0,0 +1,258 @@
+"""
+VINA 프롬프트 토큰 예산 관리
+
+facts.md, contextual_rules.md, 최근 대화가 쌓여도 프롬프트 크기(입력 토큰, 응답 지연)가
+일정 한도를 넘지 않도록 구간별 토큰 예산을 적용합니다.
+
+- 마크다운 메모리 파일: 섹션 우선순위가 높은 것부터, 같은 섹션 안에서는 최근 항목부터 남김
+  (항목을 빼도 넘치면 우선순위가 낮은 섹션을 통째로 빼고, 그래도 넘치면 뒷부분을 잘라냄)
+- 최근 대화: 최신 메시지부터 예산이 허락하는 만큼 남김 (가장 최근 메시지도 넘치면 내용을 잘라냄)
+- 결과는 항상 예산 이하입니다.
+- 호출마다 구간별 예상 토큰 수를 기록합니다 (prompt_stats).
+
+토큰 수는 API를 부르지 않고 글자 수로 추정합니다
+(한글 등 비 ASCII 문자는 글자당 약 1토큰, ASCII 문자는 4글자당 약 1토큰).
+"""
+
+import os
+import functools
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# 구간별 토큰 예산 (0이면 제한 없음)
+PROMPT_BUDGETS = {
+    "facts": int(os.getenv("VINA_BUDGET_FACTS", "1500")),
+    "rules": int(os.getenv("VINA_BUDGET_RULES", "1000")),
+    "history": int(os.getenv("VINA_BUDGET_HISTORY", "1500")),
+}
+
+# 누적 프롬프트 크기 (label -> 합계)
+prompt_stats: Dict[str, Dict[str, int]] = {}
+
+def estimate_tokens(text: str) -> int:
+    """
+    텍스트의 토큰 수를 추정합니다.
+
+    Args:
+        text: 추정할 텍스트
+
+    Returns:
+        예상 토큰 수
+    """
+    if not text:
+        return 0
+    ascii_count = sum(1 for ch in text if ch.isascii())
+    return (len(text) - ascii_count) + (ascii_count + 3) // 4
+
+def _line_cost(line: str) -> int:
+    """줄 하나의 비용 (줄바꿈 포함)"""
+    return estimate_tokens(line) + 1
+
+def truncate_to_budget(text: str, budget: int) -> Tuple[str, int]:
+    """
+    텍스트를 앞에서부터 예산이 허락하는 만큼만 남깁니다 (줄 단위, 첫 줄이 넘치면 글자 단위).
+
+    Args:
+        text: 줄일 텍스트
+        budget: 토큰 예산 (0 이하면 제한 없음)
+
+    Returns:
+        (줄인 텍스트, 제외되거나 잘린 줄 수) 튜플
+    """
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return text, 0
+
+    lines = text.splitlines()
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        cost = _line_cost(line)
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    dropped = len(lines) - len(kept)
+
+    if not kept and lines:
+        # 첫 줄만으로 예산을 넘으면 글자 단위로 자름
+        head = ""
+        for ch in lines[0]:
+            if estimate_tokens(head + ch) > budget:
+                break
+            head += ch
+        if head:
+            kept.append(head)
+    return "\n".join(kept), dropped
+
+def _drop_sections(text: str, budget: int, section_priority: Tuple[str, ...]) -> Tuple[str, int]:
+    """
+    우선순위가 낮은 섹션부터 통째로 빼서 예산에 맞춥니다.
+
+    우선순위 목록에 없는 섹션은 파일 뒤쪽부터, 그다음 우선순위가 낮은 섹션 순서로 빼며
+    가장 중요한 섹션 하나와 첫 제목 앞부분은 남깁니다 (그래도 넘치면 호출한 쪽에서 잘라냄).
+    """
+    blocks: List[List[str]] = [[]]
+    names = [""]
+    for line in text.splitlines():
+        if line.startswith("## "):
+            blocks.append([])
+            names.append(line[3:].strip())
+        blocks[-1].append(line)
+
+    order = [idx for idx in range(len(blocks) - 1, 0, -1) if names[idx] not in section_priority]
+    order += sorted((idx for idx in range(1, len(blocks)) if names[idx] in section_priority),
+                    key=lambda idx: -section_priority.index(names[idx]))
+
+    kept = list(range(len(blocks)))
+    dropped = 0
+    for idx in order[:-1]:
+        if estimate_tokens("\n".join(line for i in kept for line in blocks[i])) <= budget:
+            break
+        kept.remove(idx)
+        dropped += sum(1 for line in blocks[idx] if line.strip() and not line.startswith("## "))
+    return "\n".join(line for i in kept for line in blocks[i]), dropped
+
+@functools.lru_cache(maxsize=16)
+def trim_markdown(text: str, budget: int, section_priority: Tuple[str, ...] = ()) -> Tuple[str, int]:
+    """
+    '## 섹션'과 '- 항목'으로 이루어진 메모리 파일을 예산에 맞게 줄입니다.
+
+    우선순위 목록에 있는 섹션을 먼저, 나머지는 파일 순서대로 채우며
+    같은 섹션 안에서는 나중에 추가된(아래쪽) 항목을 먼저 남깁니다.
+    남긴 항목은 원래 순서대로 출력하므로 같은 파일이면 항상 같은 결과가 나옵니다
+    (프롬프트 캐시 적중 유지).
+    항목('- ')이 아닌 줄만으로도 예산을 넘으면 우선순위가 낮은 섹션을 통째로 빼고,
+    그래도 넘치면 뒷부분을 잘라내서 결과는 항상 예산 이하입니다.
+
+    Args:
+        text: 마크다운 파일 내용
+        budget: 토큰 예산 (0 이하면 제한 없음)
+        section_priority: 먼저 남길 섹션 이름 목록
+
+    Returns:
+        (줄인 내용, 제외된 항목/줄 수) 튜플
+    """
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return text, 0
+
+    # 줄 단위로 섹션 분류 (항목이 아닌 줄은 항상 유지, 비용은 줄바꿈 포함 줄 단위로 넉넉히 계산)
+    lines = text.splitlines()
+    sections: Dict[str, List[int]] = {}
+    section_order: List[str] = []
+    headers: Dict[int, str] = {}
+    current_section = ""
+    used = 0
+    for idx, line in enumerate(lines):
+        if line.startswith("- "):
+            if current_section not in sections:
+                sections[current_section] = []
+                section_order.append(current_section)
+            sections[current_section].append(idx)
+        else:
+            if line.startswith("## "):
+                current_section = line[3:].strip()
+                headers[idx] = current_section
+            used += estimate_tokens(line) + 1
+
+    ranked = [name for name in section_priority if name in sections]
+    ranked += [name for name in section_order if name not in ranked]
+
+    keep = set()
+    dropped = 0
+    for name in ranked:
+        for idx in reversed(sections[name]):
+            cost = estimate_tokens(lines[idx]) + 1
+            if used + cost <= budget:
+                keep.add(idx)
+                used += cost
+            else:
+                dropped += 1
+
+    # 항목이 모두 빠진 섹션은 제목도 제외
+    emptied = {name for name, indices in sections.items() if not keep.intersection(indices)}
+    result = []
+    for idx, line in enumerate(lines):
+        if line.startswith("- ") and idx not in keep:
+            continue
+        if headers.get(idx) in emptied:
+            continue
+        result.append(line)
+    trimmed = "\n".join(result)
+
+    # 제목이나 설명문처럼 항목이 아닌 줄만으로도 넘치는 경우
+    if estimate_tokens(trimmed) > budget:
+        trimmed, dropped_lines = _drop_sections(trimmed, budget, section_priority)
+        dropped += dropped_lines
+    if estimate_tokens(trimmed) > budget:
+        trimmed, dropped_lines = truncate_to_budget(trimmed, budget)
+        dropped += dropped_lines
+    return trimmed, dropped
+
+def trim_history(messages: Sequence[Dict[str, Any]], budget: int,
+                 formatter: Callable[[List[Dict[str, Any]]], str]) -> List[Dict[str, Any]]:
+    """
+    최근 대화를 최신 메시지부터 예산이 허락하는 만큼만 남깁니다.
+
+    Args:
+        messages: 시간 순서의 메시지 목록
+        budget: 토큰 예산 (0 이하면 제한 없음)
+        formatter: 메시지 목록을 프롬프트 텍스트로 바꾸는 함수
+
+    Returns:
+        남긴 메시지 목록 (시간 순서, 가장 최근 메시지만으로 예산을 넘으면 내용을 자른 사본)
+    """
+    messages = list(messages)
+    if budget <= 0:
+        return messages
+
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for msg in reversed(messages):
+        cost = estimate_tokens(formatter([msg])) + 1
+        if used + cost > budget:
+            if not kept:
+                # 가장 최근 메시지만으로 넘치면 이름/형식을 뺀 나머지 예산만큼 내용을 자름
+                overhead = estimate_tokens(formatter([{**msg, "content": ""}])) + 1
+                content, _ = truncate_to_budget(str(msg.get("content", "")), budget - overhead - 1)
+                if budget - overhead - 1 > 0 and content:
+                    kept.append({**msg, "content": content + "…"})
+            break
+        kept.append(msg)
+        used += cost
+    kept.reverse()
+    return kept
+
+def record_prompt(label: str, sections: Dict[str, str]) -> Dict[str, int]:
+    """
+    조립한 프롬프트의 구간별 예상 토큰 수를 누적하고 출력합니다.
+
+    Args:
+        label: 호출 종류 (예: "chat", "rule")
+        sections: 구간 이름 -> 텍스트 ("total"은 전체 프롬프트)
+
+    Returns:
+        이번 호출의 구간별 예상 토큰 수
+    """
+    current = {name: estimate_tokens(text) for name, text in sections.items()}
+
+    totals = prompt_stats.setdefault(label, {"calls": 0, "max_total": 0})
+    totals["calls"] += 1
+    for name, tokens in current.items():
+        totals[name] = totals.get(name, 0) + tokens
+    totals["max_total"] = max(totals["max_total"], current.get("total", 0))
+
+    details = ", ".join(f"{name} {tokens}" + (f"/{PROMPT_BUDGETS[name]}" if PROMPT_BUDGETS.get(name) else "")
+                        for name, tokens in current.items())
+    print(f"🧮 [{label}] 프롬프트 예상 토큰: {details}")
+    return current
+
+def format_prompt_stats() -> str:
+    """호출 종류별 평균/최대 프롬프트 크기 요약 (진단용)"""
+    if not prompt_stats:
+        return "기록 없음"
+    lines = []
+    for label, totals in prompt_stats.items():
+        calls = totals["calls"]
+        averages = ", ".join(f"{name} {totals[name] // calls}" for name in totals
+                             if name not in ("calls", "max_total"))
+        lines.append(f"{label}: {calls}회, 평균 {averages}, 최대 전체 {totals['max_total']}")
+    return "\n".join(lines)
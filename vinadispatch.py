@@ -0,0 +1,451 @@
+"""
+VINA 메시지 처리 순서 관리
+
+MessageCoalescer는 한 채널에 짧은 메시지가 연달아 들어올 때 마지막 메시지 이후
+잠시(window초) 조용해질 때까지 기다렸다가 모인 메시지를 한 번에 처리기에 넘깁니다.
+같은 채널의 처리기 호출은 순서대로 하나씩 실행되므로 응답이 뒤섞이지 않습니다.
+
+ChannelDispatcher는 활성 채널마다 작업 큐와 작업자를 두어
+- 같은 채널의 작업은 들어온 순서대로 하나씩 처리하고
+- 여러 채널의 작업은 최대 max_concurrency개까지 동시에 처리하며
+- idle_timeout초 동안 작업이 없는 채널의 작업자는 정리합니다.
+
+OutboundSender는 디스코드로 나가는 메시지를 채널별 큐로 보내며
+- 길이 제한을 넘는 내용은 문단/코드 블록 경계에서 나눠 여러 메시지로 보내고
+- 같은 메시지에 대한 연속 수정은 마지막 내용 한 번으로 합치고
+- 채널별/전체 속도 제한 버킷을 지키며
+- 내용을 만드는 쪽(명령 처리, 응답 생성)은 전송을 기다리지 않아도 됩니다 (post).
+"""
+
+import re
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from vinallm import TokenBucket
+
+# 디스코드 길이 제한
+MESSAGE_LIMIT = 2000
+EMBED_DESCRIPTION_LIMIT = 4096
+
+# 코드 블록 시작/끝 (``` 또는 ~~~)
+FENCE_PATTERN = re.compile(r"^\s*(`{3,}|~{3,})")
+
+class MessageCoalescer:
+    """채널별로 연달아 들어온 메시지를 모아 한 번에 처리"""
+
+    def __init__(self, window: float, handler: Callable[[str, List[Any]], Awaitable[None]]):
+        """
+        Args:
+            window: 마지막 메시지 이후 기다릴 시간 (초)
+            handler: 모인 메시지를 처리할 코루틴 함수 (채널 키, 메시지 목록)
+        """
+        self.window = window
+        self.handler = handler
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        # 채널별 처리 순서 잠금 (사용 중인 묶음이 없고 대기 묶음도 없으면 정리)
+        self.locks: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"messages": 0, "batches": 0}
+
+    def add(self, key: str, item: Any) -> None:
+        """
+        메시지를 채널의 대기 묶음에 추가하고 조용해질 때까지의 대기 시간을 다시 시작합니다.
+
+        Args:
+            key: 채널 키
+            item: 메시지
+        """
+        loop = asyncio.get_running_loop()
+        self.stats["messages"] += 1
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = {"items": []}
+            entry["task"] = asyncio.create_task(self._flush_when_quiet(key, entry))
+        entry["items"].append(item)
+        entry["deadline"] = loop.time() + self.window
+
+    async def _flush_when_quiet(self, key: str, entry: Dict[str, Any]) -> None:
+        """마지막 메시지 이후 window초가 지나면 묶음을 처리기에 넘김"""
+        loop = asyncio.get_running_loop()
+        while (delay := entry["deadline"] - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+        # 처리 중에 들어오는 메시지는 새 묶음으로 모음
+        self.pending.pop(key, None)
+        items = entry["items"]
+        self.stats["batches"] += 1
+
+        holder = self.locks.setdefault(key, {"lock": asyncio.Lock(), "users": 0})
+        holder["users"] += 1
+        try:
+            async with holder["lock"]:
+                await self.handler(key, items)
+        except Exception as e:
+            print(f"❌ 채널 {key} 메시지 처리 중 오류: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            holder["users"] -= 1
+            if holder["users"] == 0 and key not in self.pending:
+                self.locks.pop(key, None)
+
+    def pending_count(self, key: Optional[str] = None) -> int:
+        """처리를 기다리는 메시지 수 (key가 없으면 전체)"""
+        if key is not None:
+            return len(self.pending.get(key, {}).get("items", []))
+        return sum(len(entry["items"]) for entry in self.pending.values())
+
+    def format_stats(self) -> str:
+        """합쳐진 메시지 수 요약 (진단용)"""
+        saved = self.stats["messages"] - self.stats["batches"] - self.pending_count()
+        return (f"메시지 {self.stats['messages']}개 → 응답 {self.stats['batches']}회 "
+                f"(절약 {max(0, saved)}회, 대기 {self.pending_count()}개, 대기 시간 {self.window:.1f}초)")
+
+class ChannelDispatcher:
+    """채널별 순서 보장 작업 큐 (채널 간에는 제한된 수만큼 동시 처리)"""
+
+    def __init__(self, max_concurrency: int = 4, idle_timeout: float = 300.0):
+        """
+        Args:
+            max_concurrency: 동시에 처리할 수 있는 채널 작업 수
+            idle_timeout: 작업이 없을 때 채널 작업자를 유지할 시간 (초)
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.idle_timeout = idle_timeout
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        self.workers: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"jobs": 0, "started": 0, "done": 0, "failed": 0, "reaped": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+    def submit(self, key: str, func: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        """
+        채널 큐에 작업을 추가합니다 (작업자가 없으면 새로 시작).
+
+        Args:
+            key: 채널 키
+            func: 실행할 코루틴 함수
+            *args: func에 전달할 인자
+        """
+        worker = self.workers.get(key)
+        if worker is None:
+            queue: asyncio.Queue = asyncio.Queue()
+            worker = self.workers[key] = {"queue": queue, "running": False}
+            worker["task"] = asyncio.create_task(self._run_worker(key, worker))
+        self.stats["jobs"] += 1
+        worker["queue"].put_nowait((time.monotonic(), func, args))
+
+    async def _run_worker(self, key: str, worker: Dict[str, Any]) -> None:
+        """채널 큐의 작업을 순서대로 처리하고, 오래 비어 있으면 종료"""
+        queue = worker["queue"]
+        while True:
+            try:
+                enqueued, func, args = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    self.workers.pop(key, None)
+                    self.stats["reaped"] += 1
+                    return
+                continue
+
+            try:
+                async with self.slots:
+                    wait = time.monotonic() - enqueued
+                    self.stats["started"] += 1
+                    self.stats["total_wait"] += wait
+                    self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+                    worker["running"] = True
+                    await func(*args)
+                self.stats["done"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"❌ 채널 {key} 작업 처리 중 오류: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                worker["running"] = False
+                queue.task_done()
+
+    def queue_depths(self) -> Dict[str, int]:
+        """채널별 대기 중인 작업 수 (실행 중인 작업 제외)"""
+        return {key: worker["queue"].qsize() for key, worker in self.workers.items()}
+
+    def format_stats(self) -> str:
+        """활성 채널, 대기 작업, 대기 시간 요약 (진단용)"""
+        started = self.stats["started"]
+        average_wait = self.stats["total_wait"] / started if started else 0.0
+        lines = [f"활성 채널 {len(self.workers)}개 (동시 처리 최대 {self.max_concurrency}), "
+                 f"완료 {self.stats['done']}, 실패 {self.stats['failed']}, 정리된 작업자 {self.stats['reaped']}",
+                 f"대기 시간: 평균 {average_wait:.2f}초, 최대 {self.stats['max_wait']:.2f}초"]
+        for key, depth in self.queue_depths().items():
+            running = " (처리 중)" if self.workers[key]["running"] else ""
+            lines.append(f"- 채널 {key}: 대기 {depth}개{running}")
+        return "\n".join(lines)
+
+# ───── 긴 메시지 나누기 ─────
+def _pack_lines(lines: List[str], limit: int) -> List[str]:
+    """줄들을 limit 이하 조각으로 묶음 (한 줄이 limit보다 길면 잘라서 나눔)"""
+    pieces: List[str] = []
+    current = None
+    for line in lines:
+        while len(line) > limit:
+            if current is not None:
+                pieces.append(current)
+                current = None
+            pieces.append(line[:limit])
+            line = line[limit:]
+        if current is not None and len(current) + 1 + len(line) <= limit:
+            current += "\n" + line
+        else:
+            if current is not None:
+                pieces.append(current)
+            current = line
+    if current is not None:
+        pieces.append(current)
+    return pieces
+
+def _split_blocks(text: str) -> List[Tuple[str, str, str]]:
+    """
+    텍스트를 문단(빈 줄 기준)과 코드 블록 단위로 나눕니다.
+
+    Returns:
+        (종류 "text"/"code", 내용, 앞 블록과의 구분자) 목록
+    """
+    blocks: List[Tuple[str, str, str]] = []
+    current: List[str] = []
+    fence = None
+    separator = ""
+    blank_lines = 0
+
+    def flush(kind: str) -> None:
+        nonlocal current, separator, blank_lines
+        if current:
+            blocks.append((kind, "\n".join(current), separator))
+            current = []
+            blank_lines = 0
+        separator = "\n" * (blank_lines + 1)
+
+    for line in text.split("\n"):
+        if fence is not None:
+            current.append(line)
+            # 닫는 표시가 내용 끝에 붙어 있는 경우(내용```)도 코드 블록의 끝으로 봄
+            if len(current) > 1 and line.rstrip().endswith(fence):
+                flush("code")
+                fence = None
+            continue
+
+        match = FENCE_PATTERN.match(line)
+        if match:
+            flush("text")
+            fence = match.group(1)
+            current = [line]
+        elif not line.strip():
+            if current:
+                flush("text")
+            blank_lines += 1
+            separator = "\n" * (blank_lines + 1)
+        else:
+            current.append(line)
+    flush("code" if fence is not None else "text")
+    return blocks
+
+def _split_code_block(body: str, limit: int) -> List[str]:
+    """긴 코드 블록을 각 조각이 닫힌 코드 블록이 되도록 나눔"""
+    lines = body.split("\n")
+    header = lines[0]
+    fence = FENCE_PATTERN.match(header).group(1)
+    inner = lines[1:]
+    if inner and inner[-1].rstrip().endswith(fence):
+        last = inner[-1].rstrip()[:-len(fence)]
+        inner = inner[:-1] + ([last] if last else [])
+    budget = max(1, limit - len(header) - len(fence) - 2)
+    return [f"{header}\n{piece}\n{fence}" for piece in _pack_lines(inner, budget)]
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    긴 텍스트를 limit 이하의 메시지들로 나눕니다.
+
+    문단 경계를 우선으로 나누고, 코드 블록은 가능한 한 한 메시지에 담으며
+    한 메시지에 담을 수 없는 코드 블록은 조각마다 코드 블록을 닫고 다시 엽니다.
+
+    Args:
+        text: 보낼 텍스트
+        limit: 메시지당 최대 글자 수
+
+    Returns:
+        메시지 목록 (빈 텍스트면 빈 목록)
+    """
+    if len(text) <= limit:
+        return [text] if text.strip() else []
+
+    chunks: List[str] = []
+    current = ""
+    for kind, body, separator in _split_blocks(text):
+        if len(body) <= limit:
+            pieces = [body]
+        elif kind == "code":
+            pieces = _split_code_block(body, limit)
+        else:
+            pieces = _pack_lines(body.split("\n"), limit)
+
+        for index, piece in enumerate(pieces):
+            joiner = separator if index == 0 else "\n"
+            if current and len(current) + len(joiner) + len(piece) <= limit:
+                current += joiner + piece
+            else:
+                if current:
+                    chunks.append(current)
+                current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def split_embed(embed: discord.Embed, limit: int = EMBED_DESCRIPTION_LIMIT) -> List[discord.Embed]:
+    """설명이 긴 임베드를 여러 임베드로 나눔 (제목 등은 첫 임베드에만 유지)"""
+    description = embed.description or ""
+    if len(description) <= limit:
+        return [embed]
+    chunks = split_message(description, limit)
+    first = embed.copy()
+    first.description = chunks[0]
+    return [first] + [discord.Embed(description=chunk, color=embed.color) for chunk in chunks[1:]]
+
+# ───── 디스코드 전송 ─────
+def _consume_exception(future: asyncio.Future) -> None:
+    """기다리는 쪽이 없는 전송 실패가 경고로 남지 않게 처리 (오류는 작업자가 이미 출력함)"""
+    if not future.cancelled():
+        future.exception()
+
+class OutboundSender:
+    """채널별 큐와 속도 제한 버킷을 거쳐 디스코드로 메시지를 보내는 전송기"""
+
+    def __init__(self, message_limit: int = MESSAGE_LIMIT, channel_rate: float = 60, channel_burst: float = 5,
+                 global_rate: float = 3000, global_burst: float = 50, idle_timeout: float = 300.0):
+        """
+        Args:
+            message_limit: 메시지당 최대 글자 수
+            channel_rate, channel_burst: 채널별 분당 전송 수와 순간 허용량 (디스코드 기본: 5초에 5개)
+            global_rate, global_burst: 전체 분당 전송 수와 순간 허용량 (디스코드 기본: 초당 50개)
+            idle_timeout: 전송이 없을 때 채널 작업자를 유지할 시간 (초)
+        """
+        self.message_limit = message_limit
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.idle_timeout = idle_timeout
+        self.channels: Dict[Any, Dict[str, Any]] = {}
+        self.pending_edits: Dict[int, Dict[str, Any]] = {}
+        self.stats = {"sent": 0, "edited": 0, "merged_edits": 0, "split": 0, "failed": 0}
+
+    def _channel_key(self, channel) -> Any:
+        return getattr(channel, "id", None) or id(channel)
+
+    def _enqueue(self, channel, operation: Dict[str, Any]) -> asyncio.Future:
+        """채널 큐에 전송 작업을 추가하고 결과 Future 반환"""
+        key = self._channel_key(channel)
+        state = self.channels.get(key)
+        if state is None:
+            state = self.channels[key] = {"queue": asyncio.Queue(), "bucket": TokenBucket(self.channel_rate, self.channel_burst)}
+            asyncio.create_task(self._run_worker(key, state))
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        operation["future"] = future
+        state["queue"].put_nowait(operation)
+        return future
+
+    def post(self, channel, content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> asyncio.Future:
+        """
+        메시지 전송을 예약하고 바로 반환합니다 (긴 내용과 임베드는 나눠서 전송).
+
+        Args:
+            channel: 보낼 채널
+            content: 텍스트 내용
+            embed: 임베드
+
+        Returns:
+            보낸 메시지 목록으로 완료되는 Future (기다리지 않아도 됨)
+        """
+        contents = split_message(content, self.message_limit) if content else []
+        embeds = split_embed(embed) if embed is not None else []
+        if len(contents) + len(embeds) > 1:
+            self.stats["split"] += 1
+        return self._enqueue(channel, {"kind": "send", "channel": channel, "contents": contents, "embeds": embeds})
+
+    async def send(self, channel, content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> List[Any]:
+        """post와 같지만 전송이 끝날 때까지 기다려 보낸 메시지 목록을 반환"""
+        return await self.post(channel, content, embed=embed)
+
+    def edit(self, message, content: str) -> asyncio.Future:
+        """
+        메시지 수정을 예약합니다. 아직 실행되지 않은 같은 메시지의 수정이 있으면
+        내용만 바꿔서 한 번의 수정으로 합칩니다.
+
+        Args:
+            message: 수정할 메시지
+            content: 새 내용 (길이 제한을 넘는 부분은 잘림)
+
+        Returns:
+            수정된 메시지로 완료되는 Future
+        """
+        content = content[:self.message_limit]
+        pending = self.pending_edits.get(id(message))
+        if pending is not None:
+            pending["content"] = content
+            self.stats["merged_edits"] += 1
+            return pending["future"]
+
+        operation = {"kind": "edit", "message": message, "content": content}
+        self.pending_edits[id(message)] = operation
+        return self._enqueue(message.channel, operation)
+
+    async def _run_worker(self, key: Any, state: Dict[str, Any]) -> None:
+        """채널의 전송 작업을 순서대로, 속도 제한을 지키며 실행"""
+        queue = state["queue"]
+        while True:
+            try:
+                operation = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    self.channels.pop(key, None)
+                    return
+                continue
+
+            future = operation["future"]
+            try:
+                if operation["kind"] == "edit":
+                    # 실행 직전까지 들어온 수정 내용을 반영
+                    self.pending_edits.pop(id(operation["message"]), None)
+                    await self._take(state)
+                    result = await operation["message"].edit(content=operation["content"])
+                    self.stats["edited"] += 1
+                else:
+                    result = []
+                    channel = operation["channel"]
+                    for chunk in operation["contents"]:
+                        await self._take(state)
+                        result.append(await channel.send(chunk))
+                        self.stats["sent"] += 1
+                    for embed in operation["embeds"]:
+                        await self._take(state)
+                        result.append(await channel.send(embed=embed))
+                        self.stats["sent"] += 1
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"❌ 디스코드 전송 실패 (채널 {key}): {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                queue.task_done()
+
+    async def _take(self, state: Dict[str, Any]) -> None:
+        """채널별, 전체 속도 제한 버킷에서 전송 1회분을 얻음"""
+        await state["bucket"].take()
+        await self.global_bucket.take()
+
+    def format_stats(self) -> str:
+        """전송/수정/나눔 횟수와 대기 중인 전송 수 요약 (진단용)"""
+        waiting = sum(state["queue"].qsize() for state in self.channels.values())
+        return (f"전송 {self.stats['sent']}, 수정 {self.stats['edited']} (합친 수정 {self.stats['merged_edits']}), "
+                f"나눠 보냄 {self.stats['split']}, 실패 {self.stats['failed']}, 대기 {waiting}")
@@ -0,0 +1,409 @@
+"""
+VINA LLM 호출 계층
+
+bot.py와 vinareport.py의 모든 Claude 호출이 이 모듈을 거칩니다.
+AsyncAnthropic 클라이언트를 사용하므로 응답을 기다리는 동안에도
+디스코드 이벤트 루프(하트비트, 다른 채널, 규칙 스케줄러)가 멈추지 않습니다.
+
+프롬프트 캐싱:
+- cached_text_block()으로 만든 블록에는 cache_control이 붙어
+  시스템 프롬프트, 사용자 정보, 행동 규칙처럼 자주 바뀌지 않는 앞부분을
+  Claude 쪽에서 캐시합니다 (VINA_PROMPT_CACHE=0이면 사용 안 함).
+- 호출마다 입력/캐시 생성/캐시 읽기/출력 토큰 수를 기록합니다 (usage_stats).
+
+스트리밍:
+- stream_text()는 응답 텍스트를 생성되는 대로 조각씩 반환합니다.
+- none_reply_state()는 지금까지 받은 텍스트만으로 '/None' 응답인지
+  판단할 수 있는지 알려줘서, 확실해지기 전까지 전송을 미룰 수 있게 합니다.
+
+호출 게이트웨이 (LLMGateway):
+- 동시 호출 수 제한 (VINA_LLM_CONCURRENCY) - 빈자리는 우선순위 순서로 배정
+  (사용자 응답 > 규칙 트리거 > 메모리 분석 > 리포트)
+- 토큰 버킷 방식의 분당 호출 수 제한 (VINA_LLM_RATE)
+- 호출별 시간 제한 (VINA_LLM_TIMEOUT)
+- 429/529/5xx/연결 오류 시 지터가 있는 지수 백오프로 재시도 (VINA_LLM_MAX_RETRIES)
+
+백엔드 선택 (VINA_LLM_BACKEND):
+- "anthropic" (기본값): 실제 Claude API
+- "mock": 네트워크 없이 동작하는 모의 백엔드 (vinamock.py, 벤치마크/테스트용)
+"""
+
+import os
+import time
+import heapq
+import random
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import anthropic
+
+DEFAULT_MODEL = "claude-3-5-haiku-20241022"
+
+# LLM 백엔드 ("anthropic" 또는 "mock")
+LLM_BACKEND = os.getenv("VINA_LLM_BACKEND", "anthropic")
+
+# 프롬프트 캐싱 사용 여부 (베타 헤더 필요)
+PROMPT_CACHE_ENABLED = os.getenv("VINA_PROMPT_CACHE", "1") != "0"
+PROMPT_CACHE_BETA = "prompt-caching-2024-07-31"
+
+# 메시지를 보내지 않아야 할 때 모델이 응답하는 특수 명령어
+NONE_REPLY = "/None"
+
+USAGE_FIELDS = ["input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens"]
+
+# 호출 종류별 우선순위 (작을수록 먼저 실행)
+LABEL_PRIORITIES = {"chat": 0, "rule": 1, "memory": 2, "report": 3}
+DEFAULT_PRIORITY = 1
+
+# 게이트웨이 설정
+LLM_CONCURRENCY = int(os.getenv("VINA_LLM_CONCURRENCY", "4"))
+LLM_RATE_PER_MINUTE = float(os.getenv("VINA_LLM_RATE", "50"))
+LLM_TIMEOUT = float(os.getenv("VINA_LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("VINA_LLM_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# 재시도할 HTTP 상태 코드 (5xx는 모두 재시도, 529 = 과부하)
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+_async_client: Optional[anthropic.AsyncAnthropic] = None
+
+# 누적 토큰 사용량 (label -> 필드별 합계)
+usage_stats: Dict[str, Dict[str, int]] = {}
+
+def get_async_client() -> anthropic.AsyncAnthropic:
+    """
+    비동기 Claude 클라이언트를 반환합니다 (처음 호출 시 생성).
+
+    .env가 로드된 뒤에 API 키를 읽도록 모듈 import 시점이 아니라
+    첫 호출 시점에 클라이언트를 만듭니다.
+    """
+    global _async_client
+    if _async_client is None:
+        if LLM_BACKEND == "mock":
+            import vinamock
+            _async_client = vinamock.MockAsyncClient.from_env()
+            print("🧪 모의 LLM 백엔드 사용 중 (VINA_LLM_BACKEND=mock)")
+        else:
+            # 재시도는 게이트웨이가 담당하므로 SDK 자체 재시도는 끔
+            _async_client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
+    return _async_client
+
+# ───── 호출 게이트웨이 ─────
+class PrioritySemaphore:
+    """빈자리를 우선순위(작은 값 먼저), 같은 우선순위는 도착 순서로 배정하는 세마포어"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int) -> None:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 자리를 배정받은 직후 취소되면 자리를 돌려줌
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        while self._waiters and self.active < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.active += 1
+            future.set_result(None)
+
+class TokenBucket:
+    """분당 호출 수 제한 (순간적으로는 capacity개까지 허용)"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, min(rate_per_minute, 10.0))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self) -> None:
+        """토큰 하나를 쓸 수 있을 때까지 기다린 뒤 사용 (rate가 0 이하면 제한 없음)"""
+        if self.rate <= 0:
+            return
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def is_retryable_error(error: BaseException) -> bool:
+    """재시도하면 성공할 수 있는 오류인지 여부 (시간 초과, 연결 오류, 429/529/5xx)"""
+    if isinstance(error, (asyncio.TimeoutError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+def retry_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """
+    재시도 전 대기 시간 (지터가 있는 지수 백오프, retry-after 헤더가 있으면 그 이상 대기)
+
+    Args:
+        attempt: 0부터 시작하는 재시도 횟수
+        error: 직전 오류
+    """
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("retry-after", 0)))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+class LLMGateway:
+    """모든 Claude 호출이 거치는 동시성/속도 제한, 재시도 관문"""
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, rate_per_minute: float = LLM_RATE_PER_MINUTE,
+                 timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES):
+        self.slots = PrioritySemaphore(concurrency)
+        self.bucket = TokenBucket(rate_per_minute)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "timeouts": 0}
+
+    async def acquire(self, label: str) -> None:
+        """호출 종류의 우선순위에 따라 실행 자리와 속도 제한 토큰을 얻음"""
+        await self.slots.acquire(LABEL_PRIORITIES.get(label, DEFAULT_PRIORITY))
+        try:
+            await self.bucket.take()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self) -> None:
+        self.slots.release()
+
+    async def backoff(self, label: str, attempt: int, error: BaseException) -> bool:
+        """
+        오류를 기록하고 재시도할 수 있으면 백오프만큼 기다립니다.
+
+        Returns:
+            재시도 여부 (False면 호출한 쪽에서 오류를 다시 발생시킴)
+        """
+        if isinstance(error, asyncio.TimeoutError):
+            self.stats["timeouts"] += 1
+        if attempt >= self.max_retries or not is_retryable_error(error):
+            self.stats["failures"] += 1
+            return False
+
+        delay = retry_delay(attempt, error)
+        self.stats["retries"] += 1
+        print(f"⏳ [{label}] Claude 호출 실패, {delay:.1f}초 후 재시도 ({attempt + 1}/{self.max_retries}): {type(error).__name__} {error}")
+        await asyncio.sleep(delay)
+        return True
+
+    async def call(self, label: str, func, *args: Any, **kwargs: Any):
+        """
+        실행 자리를 얻어 func(*args, **kwargs)를 시간 제한과 재시도를 적용해 호출합니다.
+
+        Args:
+            label: 호출 종류 (우선순위 결정)
+            func: 코루틴 함수
+        """
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            await self.acquire(label)
+            try:
+                return await asyncio.wait_for(func(*args, **kwargs), timeout=self.timeout)
+            except Exception as e:
+                error = e
+            finally:
+                self.release()
+
+            # 대기하는 동안 다른 호출이 자리를 쓸 수 있도록 자리를 놓고 백오프
+            if not await self.backoff(label, attempt, error):
+                raise error
+            attempt += 1
+
+    def format_stats(self) -> str:
+        """실행/대기 중인 호출과 재시도/실패 횟수 요약 (진단용)"""
+        return (f"실행 {self.slots.active}/{self.slots.limit}, 대기 {self.slots.waiting}, "
+                f"호출 {self.stats['calls']}, 재시도 {self.stats['retries']}, "
+                f"시간 초과 {self.stats['timeouts']}, 실패 {self.stats['failures']}")
+
+gateway = LLMGateway()
+
+def text_block(text: str) -> Dict[str, Any]:
+    """일반 텍스트 블록"""
+    return {"type": "text", "text": text}
+
+def cached_text_block(text: str) -> Dict[str, Any]:
+    """
+    캐시 지점이 표시된 텍스트 블록을 만듭니다.
+
+    이 블록까지의 프롬프트 앞부분이 Claude 쪽에 캐시되므로, 내용이
+    바이트 단위로 같아야 캐시가 적중합니다 (메모리 파일이 바뀌면 자연히 새로 캐시됨).
+    """
+    block = text_block(text)
+    if PROMPT_CACHE_ENABLED:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+def cached_system(text: str) -> List[Dict[str, Any]]:
+    """캐시 지점이 표시된 시스템 프롬프트"""
+    return [cached_text_block(text)]
+
+def record_usage(label: str, response) -> Dict[str, int]:
+    """
+    응답의 토큰 사용량을 누적하고 출력합니다.
+
+    Args:
+        label: 호출 종류 (예: "chat", "rule", "memory", "report")
+        response: Claude 응답 객체
+
+    Returns:
+        이번 호출의 필드별 토큰 수
+    """
+    usage = getattr(response, "usage", None)
+    current = {field: int(getattr(usage, field, 0) or 0) for field in USAGE_FIELDS}
+
+    totals = usage_stats.setdefault(label, {"calls": 0, **{field: 0 for field in USAGE_FIELDS}})
+    totals["calls"] += 1
+    for field in USAGE_FIELDS:
+        totals[field] += current[field]
+
+    print(f"📊 [{label}] 토큰: 입력 {current['input_tokens']}, 캐시 생성 {current['cache_creation_input_tokens']}, "
+          f"캐시 읽기 {current['cache_read_input_tokens']}, 출력 {current['output_tokens']}")
+    return current
+
+def format_usage_stats() -> str:
+    """누적 토큰 사용량 요약 (진단용)"""
+    if not usage_stats:
+        return "기록 없음"
+    lines = []
+    for label, totals in usage_stats.items():
+        cacheable = totals["cache_creation_input_tokens"] + totals["cache_read_input_tokens"]
+        hit_rate = totals["cache_read_input_tokens"] / cacheable * 100 if cacheable else 0.0
+        lines.append(f"{label}: {totals['calls']}회, 입력 {totals['input_tokens']}, 캐시 생성 {totals['cache_creation_input_tokens']}, "
+                     f"캐시 읽기 {totals['cache_read_input_tokens']} (적중률 {hit_rate:.0f}%), 출력 {totals['output_tokens']}")
+    return "\n".join(lines)
+
+def _prepare_request(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """기본 모델과 프롬프트 캐시 헤더를 채운 요청 인자 반환"""
+    kwargs.setdefault("model", DEFAULT_MODEL)
+    if PROMPT_CACHE_ENABLED:
+        headers = dict(kwargs.pop("extra_headers", None) or {})
+        headers.setdefault("anthropic-beta", PROMPT_CACHE_BETA)
+        kwargs["extra_headers"] = headers
+    return kwargs
+
+async def create_message(label: str = "llm", **kwargs: Any):
+    """
+    Claude messages API를 비동기로 호출합니다.
+
+    Args:
+        label: 토큰 사용량 집계용 호출 종류
+        **kwargs: messages.create에 그대로 전달할 인자 (model, max_tokens, system, messages 등)
+
+    Returns:
+        Claude 응답 객체
+    """
+    request = _prepare_request(kwargs)
+    response = await gateway.call(label, get_async_client().messages.create, **request)
+    record_usage(label, response)
+    return response
+
+async def stream_text(label: str = "llm", **kwargs: Any) -> AsyncIterator[str]:
+    """
+    Claude 응답을 스트리밍으로 받아 텍스트 조각을 차례로 반환합니다.
+    스트림이 끝나면 최종 메시지의 토큰 사용량을 기록합니다.
+    첫 조각을 받기 전의 오류만 재시도하며, 시간 제한은 조각 사이 대기 시간에 적용됩니다.
+
+    Args:
+        label: 토큰 사용량 집계용 호출 종류
+        **kwargs: messages.stream에 그대로 전달할 인자
+
+    Yields:
+        텍스트 조각
+    """
+    request = _prepare_request(kwargs)
+    gateway.stats["calls"] += 1
+    attempt = 0
+    while True:
+        yielded = False
+        await gateway.acquire(label)
+        try:
+            async with get_async_client().messages.stream(**request) as stream:
+                chunks = stream.text_stream.__aiter__()
+                while True:
+                    try:
+                        text = await asyncio.wait_for(chunks.__anext__(), timeout=gateway.timeout)
+                    except StopAsyncIteration:
+                        break
+                    yielded = True
+                    yield text
+                final_message = await asyncio.wait_for(stream.get_final_message(), timeout=gateway.timeout)
+            break
+        except Exception as e:
+            error = e
+        finally:
+            gateway.release()
+
+        # 이미 일부를 보낸 뒤의 오류는 재시도하면 내용이 중복되므로 그대로 실패 처리
+        if yielded:
+            gateway.stats["failures"] += 1
+            raise error
+        if not await gateway.backoff(label, attempt, error):
+            raise error
+        attempt += 1
+    record_usage(label, final_message)
+
+# ───── '/None' 응답 판별 ─────
+def is_none_reply(answer: str) -> bool:
+    """완성된 응답이 '/None'(메시지 전송 안 함)인지 여부"""
+    answer = answer.strip()
+    return answer == NONE_REPLY or answer.startswith(NONE_REPLY + " ")
+
+def none_reply_state(partial: str) -> str:
+    """
+    스트리밍 중인 응답의 앞부분만으로 '/None' 여부를 판단합니다.
+
+    Args:
+        partial: 지금까지 받은 응답 텍스트
+
+    Returns:
+        "send" (보내도 되는 일반 응답), "suppress" (확실히 '/None'),
+        "undecided" (아직 판단할 수 없음 - 전송을 미뤄야 함)
+    """
+    text = partial.lstrip()
+    if NONE_REPLY.startswith(text):
+        return "undecided"
+    if not text.startswith(NONE_REPLY):
+        return "send"
+
+    rest = text[len(NONE_REPLY):]
+    if rest[0] == " ":
+        return "suppress"
+    if rest[0].isspace():
+        # '/None' 뒤에 줄바꿈 등만 있으면 끝까지 봐야 알 수 있음
+        return "undecided" if not rest.strip() else "send"
+    return "send"
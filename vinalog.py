@@ -0,0 +1,980 @@
+"""
+VINA 대화 기록(jsonl) 저장소 유틸리티
+
+bot.py와 vinareport.py가 함께 사용하는 대화 기록 읽기 함수 모음
+- 파일 끝에서부터 블록 단위로 거꾸로 읽는 tail 리더
+- 채널별 최근 K개 기록 로드
+- 마지막 메시지 시간 로드
+- 날짜별 바이트 범위 인덱스 (리포트가 해당 날짜의 바이트만 읽도록)
+- 대화 기록 저장소 인터페이스 (jsonl 기본 / SQLite 선택)
+- 기록을 모아서 한 번에 쓰는 비동기 로그 기록기 (group commit)
+- 날짜/크기 기준 로그 회전 및 압축 보관 (읽기 함수는 보관된 구간도 함께 읽음)
+
+저장소 선택: 환경 변수 VINA_HISTORY_BACKEND=jsonl(기본값) 또는 sqlite
+기록 내구성: 환경 변수 VINA_HISTORY_DURABILITY=none, flush(기본값), fsync
+로그 회전: 환경 변수 VINA_HISTORY_ROTATE=none(기본값), daily, size
+
+사용 예:
+    python vinalog.py --build-index   # 기존 로그의 날짜 인덱스 생성 (마이그레이션)
+    python vinalog.py --import-jsonl  # jsonl 로그를 SQLite DB로 가져오기
+    python vinalog.py --export-jsonl vina_history_export.jsonl  # SQLite DB를 jsonl로 내보내기
+    python vinalog.py --rotate        # 현재 로그를 압축 보관하고 새 로그 시작
+"""
+
+import os
+import re
+import sys
+import gzip
+import lzma
+import json
+import sqlite3
+import datetime
+import asyncio
+import argparse
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+# 역방향 읽기 블록 크기 (바이트)
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# 채널별 최근 기록을 찾을 때 파일 끝에서부터 읽을 최대 바이트 수
+TAIL_MAX_BYTES = 8 * 1024 * 1024
+
+JSONL_LOG_PATH = "vina_memory/logs/vina_history.jsonl"
+SQLITE_DB_PATH = "vina_memory/logs/vina_history.db"
+
+# 대화 기록 저장소 종류 (jsonl 또는 sqlite)
+HISTORY_BACKEND = os.getenv("VINA_HISTORY_BACKEND", "jsonl")
+
+# 기록 내구성 수준
+# - none: 쓰기 버퍼에만 기록 (가장 빠름, 프로세스 비정상 종료 시 유실 가능)
+# - flush: 배치마다 OS로 flush (프로세스 비정상 종료에도 보존)
+# - fsync: 배치마다 디스크까지 fsync (전원 차단에도 보존)
+HISTORY_DURABILITY = os.getenv("VINA_HISTORY_DURABILITY", "flush")
+DURABILITY_MODES = ["none", "flush", "fsync"]
+
+# 로그 기록기 배치 기준 (기록 수 / 초)
+HISTORY_FLUSH_BATCH = int(os.getenv("VINA_HISTORY_FLUSH_BATCH", "32"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("VINA_HISTORY_FLUSH_INTERVAL", "1.0"))
+
+# 기록 필드 순서 (jsonl 한 줄과 같은 순서)
+RECORD_FIELDS = ["role", "name", "channel", "content", "time"]
+
+# 날짜 인덱스 형식 버전
+DAY_INDEX_VERSION = 1
+
+# 로그 회전 기준 (none, daily, size) 및 크기 기준 회전 시 최대 크기
+HISTORY_ROTATE = os.getenv("VINA_HISTORY_ROTATE", "none")
+HISTORY_ROTATE_MAX_BYTES = int(os.getenv("VINA_HISTORY_ROTATE_MAX_BYTES", str(16 * 1024 * 1024)))
+ROTATE_MODES = ["none", "daily", "size"]
+
+# 보관 구간 압축 방식 (gzip, lzma, none)
+HISTORY_COMPRESSION = os.getenv("VINA_HISTORY_COMPRESSION", "gzip")
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "lzma": ".xz", "none": ""}
+
+
+def channel_key(channel: Any) -> Optional[str]:
+    """
+    채널 키를 문자열로 통일합니다.
+
+    예전 기록에는 채널 ID가 숫자로 저장된 경우가 있고 SQLite는 문자열로 돌려주므로,
+    저장소와 상관없이 같은 키로 조회되도록 쓰기와 읽기 모두 이 함수를 거칩니다.
+
+    Args:
+        channel: 채널 ID 또는 이름 (None 가능)
+
+    Returns:
+        문자열 채널 키 (없으면 None)
+    """
+    return None if channel is None else str(channel)
+
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """채널 키가 문자열이 아닌 기록은 문자열 키를 가진 사본으로 변환"""
+    channel = record.get("channel")
+    if channel is None or isinstance(channel, str):
+        return record
+    return {**record, "channel": channel_key(channel)}
+
+
+def _decode_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """jsonl 한 줄을 딕셔너리로 변환 (깨진 줄은 None, 채널 키는 문자열로 통일)"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line.decode("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return normalize_record(record) if isinstance(record, dict) else None
+
+
+def iter_jsonl_reverse(path: str, block_size: int = TAIL_BLOCK_SIZE,
+                       max_bytes: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    jsonl 파일을 끝에서부터 블록 단위로 거꾸로 읽어 최신 기록부터 반환합니다.
+
+    Args:
+        path: jsonl 파일 경로
+        block_size: 한 번에 읽을 블록 크기 (바이트)
+        max_bytes: 끝에서부터 읽을 최대 바이트 수 (None이면 파일 전체)
+
+    Yields:
+        최신 순서의 기록 딕셔너리
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        read_bytes = 0
+
+        while position > 0:
+            if max_bytes is not None and read_bytes >= max_bytes:
+                # 읽기 한도 도달: 잘린 첫 줄(remainder)은 버림
+                return
+
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            chunk = f.read(size) + remainder
+            read_bytes += size
+
+            # 첫 조각은 앞 블록과 이어질 수 있으므로 다음 반복으로 넘김
+            lines = chunk.split(b"\n")
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                record = _decode_line(line)
+                if record is not None:
+                    yield record
+
+        record = _decode_line(remainder)
+        if record is not None:
+            yield record
+
+
+def iter_history_reverse(path: str, max_bytes: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    현재 로그 파일과 보관된 구간을 최신 기록부터 거꾸로 읽습니다.
+
+    현재 로그에서 필요한 기록을 모두 찾으면 보관된 구간은 열지 않습니다.
+
+    Args:
+        path: 현재 jsonl 파일 경로
+        max_bytes: 읽을 최대 바이트 수 (보관 구간은 압축 해제 후 크기 기준)
+
+    Yields:
+        최신 순서의 기록 딕셔너리
+    """
+    read_bytes = 0
+    if os.path.exists(path):
+        yield from iter_jsonl_reverse(path, max_bytes=max_bytes)
+        read_bytes = os.path.getsize(path)
+
+    for segment in reversed(list_archive_segments(path)):
+        if max_bytes is not None and read_bytes >= max_bytes:
+            return
+        # 압축된 구간은 거꾸로 탐색할 수 없으므로 구간 전체를 읽은 뒤 뒤집음
+        with open_segment(segment["path"]) as f:
+            lines = f.readlines()
+        for line in reversed(lines):
+            read_bytes += len(line)
+            record = _decode_line(line)
+            if record is not None:
+                yield record
+            if max_bytes is not None and read_bytes >= max_bytes:
+                return
+
+
+def load_last_message_time(path: str) -> Optional[str]:
+    """
+    대화 기록 파일의 마지막 메시지 시간을 반환합니다.
+
+    기록은 시간 순서로 추가되므로 파일 끝에서 처음 만나는 시간 값이 가장 최신입니다.
+    현재 로그가 비어 있으면 가장 최근에 보관된 구간을 확인합니다.
+
+    Args:
+        path: jsonl 파일 경로
+
+    Returns:
+        ISO 형식의 마지막 메시지 시간 (없으면 None)
+    """
+    for record in iter_history_reverse(path):
+        time_str = record.get("time")
+        if time_str:
+            return time_str
+    return None
+
+
+def load_tail_records(path: str, per_channel: int, roles: Optional[List[str]] = None,
+                      max_bytes: Optional[int] = TAIL_MAX_BYTES) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    파일 끝부분만 읽어 채널별 최근 기록을 최대 per_channel개씩 반환합니다.
+
+    Args:
+        path: jsonl 파일 경로
+        per_channel: 채널당 반환할 최대 기록 수
+        roles: 포함할 role 목록 (None이면 모든 기록)
+        max_bytes: 끝에서부터 읽을 최대 바이트 수 (오래 조용했던 채널은 제외될 수 있음)
+
+    Returns:
+        채널 -> 시간 순서 기록 리스트 딕셔너리
+    """
+    channels: Dict[Any, List[Dict[str, Any]]] = {}
+
+    for record in iter_history_reverse(path, max_bytes=max_bytes):
+        if roles is not None and record.get("role") not in roles:
+            continue
+
+        records = channels.setdefault(record.get("channel"), [])
+        if len(records) < per_channel:
+            records.append(record)
+
+    for records in channels.values():
+        records.reverse()
+
+    return channels
+
+
+# ───── 날짜별 바이트 범위 인덱스 ─────
+def get_day_index_path(path: str) -> str:
+    """로그 파일에 대응하는 날짜 인덱스 파일 경로 (예: vina_history.idx.json)"""
+    return os.path.splitext(path)[0] + ".idx.json"
+
+
+def get_record_date(record: Dict[str, Any]) -> Optional[str]:
+    """기록의 time 필드에서 YYYY-MM-DD 날짜를 추출 (없거나 잘못되면 None)"""
+    time_str = record.get("time")
+    if not time_str or not isinstance(time_str, str):
+        return None
+
+    # 일반적인 ISO 형식(YYYY-MM-DDTHH:MM:SS)은 파싱 없이 앞 10자리 사용
+    if len(time_str) >= 10 and time_str[4] == "-" and time_str[7] == "-" and time_str[:4].isdigit():
+        return time_str[:10]
+
+    try:
+        return datetime.datetime.fromisoformat(time_str).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _empty_day_index() -> Dict[str, Any]:
+    return {"version": DAY_INDEX_VERSION, "indexed_size": 0, "days": {}}
+
+
+def _load_day_index(index_path: str) -> Dict[str, Any]:
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == DAY_INDEX_VERSION and isinstance(index.get("days"), dict):
+            return index
+    except (OSError, json.JSONDecodeError, AttributeError):
+        pass
+    return _empty_day_index()
+
+
+def _save_day_index(index_path: str, index: Dict[str, Any]):
+    # 임시 파일에 쓴 뒤 교체하여 읽는 쪽이 반쯤 쓰인 인덱스를 보지 않도록 함
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def update_day_index(path: str, rebuild: bool = False) -> Dict[str, Any]:
+    """
+    날짜 인덱스를 로그 파일의 현재 끝까지 갱신합니다.
+
+    인덱스는 날짜 -> [[시작 바이트, 끝 바이트], ...] 형식이며,
+    마지막으로 인덱싱한 위치 이후에 추가된 바이트만 읽습니다.
+
+    Args:
+        path: jsonl 파일 경로
+        rebuild: True이면 기존 인덱스를 버리고 처음부터 다시 생성
+
+    Returns:
+        갱신된 인덱스 딕셔너리
+    """
+    index_path = get_day_index_path(path)
+    index = _empty_day_index() if rebuild else _load_day_index(index_path)
+
+    if not os.path.exists(path):
+        return _empty_day_index()
+
+    file_size = os.path.getsize(path)
+    if file_size < index["indexed_size"]:
+        # 파일이 교체되었거나 잘린 경우 처음부터 다시 생성
+        index = _empty_day_index()
+    elif file_size == index["indexed_size"] and not rebuild:
+        return index
+
+    days = index["days"]
+    position = index["indexed_size"]
+
+    with open(path, "rb") as f:
+        f.seek(position)
+        while True:
+            line = f.readline()
+            if not line or not line.endswith(b"\n"):
+                # 기록 중인 마지막 줄은 다음 갱신 때 인덱싱
+                break
+
+            start, position = position, position + len(line)
+            record = _decode_line(line)
+            date_str = get_record_date(record) if record else None
+            if not date_str:
+                continue
+
+            ranges = days.setdefault(date_str, [])
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = position
+            else:
+                ranges.append([start, position])
+
+    index["indexed_size"] = position
+    _save_day_index(index_path, index)
+    return index
+
+
+def iter_day_records(path: str, date_str: str) -> Iterator[Dict[str, Any]]:
+    """
+    날짜 인덱스를 이용해 지정된 날짜의 바이트 범위만 읽어 기록을 반환합니다.
+
+    Args:
+        path: jsonl 파일 경로
+        date_str: YYYY-MM-DD 형식의 날짜 문자열
+
+    Yields:
+        해당 날짜의 기록 딕셔너리 (파일 순서)
+    """
+    # 해당 날짜를 포함하는 보관 구간은 압축을 풀면서 스트리밍으로 읽음
+    for segment in list_archive_segments(path):
+        if segment["first_date"] <= date_str <= segment["last_date"]:
+            with open_segment(segment["path"]) as f:
+                for line in f:
+                    record = _decode_line(line)
+                    if record is not None and get_record_date(record) == date_str:
+                        yield record
+
+    if not os.path.exists(path):
+        return
+
+    index = update_day_index(path)
+    ranges = index["days"].get(date_str, [])
+
+    with open(path, "rb") as f:
+        for start, end in ranges:
+            f.seek(start)
+            while f.tell() < end:
+                record = _decode_line(f.readline())
+                if record is not None and get_record_date(record) == date_str:
+                    yield record
+
+
+def load_day_records(path: str, date_str: str) -> List[Dict[str, Any]]:
+    """iter_day_records의 리스트 버전"""
+    return list(iter_day_records(path, date_str))
+
+
+# ───── 로그 회전 및 보관 구간 ─────
+def get_archive_dir(path: str) -> str:
+    """보관 구간을 저장하는 디렉토리 (예: vina_memory/logs/archive)"""
+    return os.path.join(os.path.dirname(path) or ".", "archive")
+
+
+def _segment_pattern(path: str):
+    base = re.escape(os.path.splitext(os.path.basename(path))[0])
+    return re.compile(base + r"\.(\d{4}-\d{2}-\d{2})_(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.jsonl(\.gz|\.xz)?$")
+
+
+def list_archive_segments(path: str) -> List[Dict[str, Any]]:
+    """
+    보관된 로그 구간 목록을 오래된 순서로 반환합니다.
+
+    구간 파일 이름은 "<로그 이름>.<첫 날짜>_<마지막 날짜>[.<번호>].jsonl[.gz|.xz]" 형식입니다.
+
+    Returns:
+        {"path", "first_date", "last_date"} 딕셔너리 리스트
+    """
+    archive_dir = get_archive_dir(path)
+    if not os.path.isdir(archive_dir):
+        return []
+
+    pattern = _segment_pattern(path)
+    segments = []
+    for filename in os.listdir(archive_dir):
+        match = pattern.match(filename)
+        if match:
+            first_date, last_date, seq, _ = match.groups()
+            segments.append({
+                "path": os.path.join(archive_dir, filename),
+                "first_date": first_date,
+                "last_date": last_date,
+                "seq": int(seq or 0)
+            })
+
+    segments.sort(key=lambda seg: (seg["first_date"], seg["last_date"], seg["seq"]))
+    return segments
+
+
+def open_segment(path: str):
+    """압축 여부에 맞게 로그 구간을 바이너리 읽기 모드로 엶"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+def _read_first_record_date(path: str) -> Optional[str]:
+    with open(path, "rb") as f:
+        for line in f:
+            record = _decode_line(line)
+            date_str = get_record_date(record) if record else None
+            if date_str:
+                return date_str
+    return None
+
+
+def archive_log_file(path: str, compression: str = HISTORY_COMPRESSION) -> Optional[str]:
+    """
+    현재 로그 파일을 보관 디렉토리로 옮기고 압축합니다.
+
+    호출하는 쪽은 로그 파일에 대한 쓰기 핸들을 먼저 닫아야 합니다.
+
+    Args:
+        path: 현재 jsonl 파일 경로
+        compression: "gzip", "lzma", "none"
+
+    Returns:
+        보관된 구간 파일 경로 (보관할 내용이 없으면 None)
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+
+    today = datetime.date.today().isoformat()
+    first_date = _read_first_record_date(path) or today
+    last_date = None
+    for record in iter_jsonl_reverse(path):
+        last_date = get_record_date(record)
+        if last_date:
+            break
+    last_date = last_date or first_date
+
+    archive_dir = get_archive_dir(path)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    base = os.path.splitext(os.path.basename(path))[0]
+    suffix = COMPRESSION_SUFFIXES.get(compression, ".gz")
+    seq = 0
+    while True:
+        seq_part = f".{seq}" if seq else ""
+        name = f"{base}.{first_date}_{last_date}{seq_part}.jsonl"
+        if not any(os.path.exists(os.path.join(archive_dir, name + ext)) for ext in COMPRESSION_SUFFIXES.values()):
+            break
+        seq += 1
+
+    plain_path = os.path.join(archive_dir, name)
+    os.replace(path, plain_path)
+
+    # 날짜 인덱스의 바이트 위치는 새 로그 파일에서 의미가 없으므로 삭제
+    index_path = get_day_index_path(path)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    if not suffix:
+        return plain_path
+
+    archive_path = plain_path + suffix
+    opener = gzip.open if suffix == ".gz" else lzma.open
+    with open(plain_path, "rb") as src, opener(archive_path + ".tmp", "wb") as dst:
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            dst.write(chunk)
+    os.replace(archive_path + ".tmp", archive_path)
+    os.remove(plain_path)
+    return archive_path
+
+
+# ───── 대화 기록 저장소 ─────
+class JsonlHistoryStore:
+    """jsonl 파일 기반 대화 기록 저장소 (기본값)"""
+
+    backend = "jsonl"
+
+    def __init__(self, path: str = JSONL_LOG_PATH, durability: str = "flush",
+                 rotate: str = "none", rotate_max_bytes: int = HISTORY_ROTATE_MAX_BYTES,
+                 compression: str = HISTORY_COMPRESSION):
+        self.path = path
+        self.durability = durability
+        self.rotate_mode = rotate
+        self.rotate_max_bytes = rotate_max_bytes
+        self.compression = compression
+        # 추가 쓰기용 파일 핸들은 열어 둔 채로 재사용
+        self._lock = threading.Lock()
+        self._file = None
+        # 현재 로그의 마지막 기록 날짜 (날짜 기준 회전용, 처음 쓸 때 확인)
+        self._active_date = None
+        self._active_date_loaded = False
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def append(self, record: Dict[str, Any]):
+        """기록 한 개를 파일 끝에 추가"""
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict[str, Any]]):
+        """여러 기록을 한 번의 쓰기로 파일 끝에 추가 (내구성 수준에 따라 flush/fsync)"""
+        if not records:
+            return
+        records = [normalize_record(record) for record in records]
+        with self._lock:
+            if self.rotate_mode == "size" and self._current_size() >= self.rotate_max_bytes:
+                self._rotate()
+
+            chunk = []
+            for record in records:
+                date_str = get_record_date(record)
+                active_date = self._get_active_date() if self.rotate_mode == "daily" else None
+                if active_date and date_str and date_str != active_date:
+                    # 날짜가 바뀌면 지금까지의 기록을 쓰고 회전
+                    self._write_chunk(chunk)
+                    chunk = []
+                    self._rotate()
+                if date_str:
+                    self._active_date = date_str
+                    self._active_date_loaded = True
+                chunk.append(record)
+            self._write_chunk(chunk)
+
+            if self._file is not None:
+                if self.durability in ["flush", "fsync"]:
+                    self._file.flush()
+                if self.durability == "fsync":
+                    os.fsync(self._file.fileno())
+
+    def _write_chunk(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+    def _current_size(self) -> int:
+        if self._file is not None:
+            self._file.flush()
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _get_active_date(self) -> Optional[str]:
+        if not self._active_date_loaded:
+            self._active_date_loaded = True
+            for record in iter_jsonl_reverse(self.path):
+                self._active_date = get_record_date(record)
+                if self._active_date:
+                    break
+        # 현재 로그가 비어 있으면 None (회전할 필요 없음)
+        return self._active_date
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        archive_path = archive_log_file(self.path, self.compression)
+        self._active_date = None
+        self._active_date_loaded = True
+        if archive_path:
+            print(f"🗜️ 대화 기록 보관: {archive_path}")
+
+    def rotate(self) -> None:
+        """현재 로그를 즉시 압축 보관하고 새 로그 파일을 시작"""
+        with self._lock:
+            self._rotate()
+
+    def load_recent(self, channel: Any, user_name: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
+        """채널의 최근 대화를 시간 순서로 최대 limit개 반환 (파일 끝부분만 읽음)"""
+        channel = channel_key(channel)
+        messages = []
+        for record in iter_history_reverse(self.path, max_bytes=TAIL_MAX_BYTES):
+            if record.get("channel") != channel or record.get("role") not in ["user", "assistant"]:
+                continue
+            if user_name is None or record["role"] == "assistant" or record.get("name") == user_name:
+                messages.append(record)
+                if len(messages) >= limit:
+                    break
+        messages.reverse()
+        return messages
+
+    def load_last_message_time(self) -> Optional[str]:
+        return load_last_message_time(self.path)
+
+    def load_tail(self, per_channel: int, roles: Optional[List[str]] = None) -> Dict[Any, List[Dict[str, Any]]]:
+        return load_tail_records(self.path, per_channel, roles=roles)
+
+    def iter_day(self, date_str: str) -> Iterator[Dict[str, Any]]:
+        return iter_day_records(self.path, date_str)
+
+    def load_day(self, date_str: str) -> List[Dict[str, Any]]:
+        return list(self.iter_day(date_str))
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        """보관된 구간을 포함한 모든 기록을 오래된 순서로 반환"""
+        paths = [segment["path"] for segment in list_archive_segments(self.path)]
+        if self.exists():
+            paths.append(self.path)
+        for path in paths:
+            with open_segment(path) as f:
+                for line in f:
+                    record = _decode_line(line)
+                    if record is not None:
+                        yield record
+
+    def flush(self):
+        """쓰기 버퍼의 내용을 OS로 flush"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SqliteHistoryStore:
+    """
+    SQLite 기반 대화 기록 저장소
+
+    (channel, time), (name), (time) 인덱스를 두어 최근 대화 조회, 날짜 필터,
+    마지막 메시지 시간 조회를 파일 전체 스캔 없이 처리합니다.
+    """
+
+    backend = "sqlite"
+
+    # 내구성 수준별 SQLite synchronous 설정
+    SYNCHRONOUS_MODES = {"none": "OFF", "flush": "NORMAL", "fsync": "FULL"}
+
+    def __init__(self, path: str = SQLITE_DB_PATH, durability: str = "flush"):
+        self.path = path
+        self.durability = durability
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 로그 기록 스레드에서도 사용할 수 있도록 잠금으로 보호
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={self.SYNCHRONOUS_MODES.get(durability, 'NORMAL')}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                role TEXT,
+                name TEXT,
+                channel TEXT,
+                content TEXT,
+                time TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_channel_time ON messages (channel, time);
+            CREATE INDEX IF NOT EXISTS idx_messages_name ON messages (name);
+            CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (time);
+        """)
+        self._conn.commit()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _query(self, sql: str, params=()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(RECORD_FIELDS, row)) for row in rows]
+
+    def append(self, record: Dict[str, Any]):
+        """기록 한 개 추가"""
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict[str, Any]]):
+        """여러 기록을 하나의 트랜잭션으로 추가"""
+        if not records:
+            return
+        rows = [tuple(normalize_record(record).get(field) for field in RECORD_FIELDS) for record in records]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO messages (role, name, channel, content, time) VALUES (?, ?, ?, ?, ?)", rows
+                )
+
+    def load_recent(self, channel: Any, user_name: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
+        """채널의 최근 대화를 시간 순서로 최대 limit개 반환"""
+        rows = self._query(
+            """SELECT role, name, channel, content, time FROM messages
+               WHERE channel = ? AND role IN ('user', 'assistant')
+                 AND (? IS NULL OR role = 'assistant' OR name = ?)
+               ORDER BY time DESC, id DESC LIMIT ?""",
+            (channel_key(channel), user_name, user_name, limit)
+        )
+        rows.reverse()
+        return rows
+
+    def load_last_message_time(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(time) FROM messages").fetchone()
+        return row[0] if row else None
+
+    def load_tail(self, per_channel: int, roles: Optional[List[str]] = None) -> Dict[Any, List[Dict[str, Any]]]:
+        with self._lock:
+            channels = [row[0] for row in self._conn.execute("SELECT DISTINCT channel FROM messages").fetchall()]
+
+        role_filter = ""
+        if roles is not None:
+            role_filter = "AND role IN (%s)" % ", ".join("?" for _ in roles)
+
+        tail = {}
+        for channel in channels:
+            rows = self._query(
+                f"""SELECT role, name, channel, content, time FROM messages
+                    WHERE channel = ? {role_filter}
+                    ORDER BY time DESC, id DESC LIMIT ?""",
+                (channel, *(roles or []), per_channel)
+            )
+            if rows:
+                rows.reverse()
+                tail[channel] = rows
+        return tail
+
+    def iter_day(self, date_str: str) -> Iterator[Dict[str, Any]]:
+        # ISO 형식 시간 문자열은 사전순 비교가 시간순 비교와 같음
+        next_date = (datetime.date.fromisoformat(date_str) + datetime.timedelta(days=1)).isoformat()
+        return iter(self._query(
+            """SELECT role, name, channel, content, time FROM messages
+               WHERE time >= ? AND time < ? ORDER BY id""",
+            (date_str, next_date)
+        ))
+
+    def load_day(self, date_str: str) -> List[Dict[str, Any]]:
+        return list(self.iter_day(date_str))
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        """모든 기록을 추가된 순서로 반환"""
+        return iter(self._query("SELECT role, name, channel, content, time FROM messages ORDER BY id"))
+
+    def import_jsonl(self, path: str) -> int:
+        """jsonl 로그의 기록을 DB로 가져오기 (가져온 기록 수 반환)"""
+        records = list(JsonlHistoryStore(path).iter_all())
+        self.append_many(records)
+        return len(records)
+
+    def export_jsonl(self, path: str) -> int:
+        """DB의 모든 기록을 기존 jsonl 형식으로 내보내기 (내보낸 기록 수 반환)"""
+        records = list(self.iter_all())
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return len(records)
+
+    def flush(self):
+        # 트랜잭션마다 커밋하므로 별도로 비울 버퍼가 없음
+        pass
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_history_store(backend: Optional[str] = None, durability: Optional[str] = None):
+    """
+    설정된 종류의 대화 기록 저장소를 생성합니다.
+
+    Args:
+        backend: "jsonl" 또는 "sqlite" (None이면 VINA_HISTORY_BACKEND 환경 변수 사용)
+        durability: "none", "flush", "fsync" (None이면 VINA_HISTORY_DURABILITY 환경 변수 사용)
+
+    Returns:
+        JsonlHistoryStore 또는 SqliteHistoryStore
+    """
+    backend = (backend or HISTORY_BACKEND).lower()
+    durability = (durability or HISTORY_DURABILITY).lower()
+    if durability not in DURABILITY_MODES:
+        print(f"⚠️ 알 수 없는 기록 내구성 수준 '{durability}', flush를 사용합니다.")
+        durability = "flush"
+
+    if backend == "sqlite":
+        return SqliteHistoryStore(SQLITE_DB_PATH, durability)
+    if backend != "jsonl":
+        print(f"⚠️ 알 수 없는 대화 기록 저장소 '{backend}', jsonl을 사용합니다.")
+
+    rotate = HISTORY_ROTATE.lower()
+    if rotate not in ROTATE_MODES:
+        print(f"⚠️ 알 수 없는 로그 회전 기준 '{rotate}', 회전하지 않습니다.")
+        rotate = "none"
+    compression = HISTORY_COMPRESSION.lower()
+    if compression not in COMPRESSION_SUFFIXES:
+        print(f"⚠️ 알 수 없는 압축 방식 '{compression}', gzip을 사용합니다.")
+        compression = "gzip"
+    return JsonlHistoryStore(JSONL_LOG_PATH, durability, rotate=rotate, compression=compression)
+
+
+# ───── 비동기 로그 기록기 ─────
+class BufferedHistoryWriter:
+    """
+    기록을 큐에 모아 두었다가 배치 단위로 저장소에 쓰는 로그 기록기
+
+    - 기록 수가 max_batch에 도달하거나 flush_interval초가 지나면 한 번에 기록
+    - 디스크 쓰기는 실행기 스레드에서 수행하여 이벤트 루프를 막지 않음
+    - start() 전이나 루프가 없을 때는 즉시 동기적으로 기록
+    - close()로 종료 시 남은 기록을 모두 기록
+    """
+
+    def __init__(self, store, max_batch: int = HISTORY_FLUSH_BATCH,
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL):
+        self.store = store
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self.flush_count = 0
+        self.written_count = 0
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        """현재 이벤트 루프에서 배치 기록 작업 시작 (이미 실행 중이면 무시)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, record: Dict[str, Any]):
+        """기록을 큐에 추가 (루프가 실행 중이 아니면 즉시 기록)"""
+        if self._task is None or self._task.done():
+            with self._write_lock:
+                self._write([record])
+            return
+
+        with self._pending_lock:
+            self._pending.append(record)
+            batch_full = len(self._pending) >= self.max_batch
+
+        if batch_full:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if self._pending:
+                await self._loop.run_in_executor(None, self.flush)
+
+    def flush(self):
+        """큐에 쌓인 기록을 모두 저장소에 기록 (스레드 안전)"""
+        # 큐를 꺼내는 순서와 쓰는 순서가 같도록 쓰기 잠금 안에서 꺼냄
+        with self._write_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        try:
+            self.store.append_many(batch)
+            self.flush_count += 1
+            self.written_count += len(batch)
+        except Exception as e:
+            print(f"❌ 대화 기록 저장 중 오류: {e}")
+            # 다음 배치 때 다시 시도하도록 큐 앞에 되돌려 둠
+            with self._pending_lock:
+                self._pending = batch + self._pending
+
+    def close(self):
+        """배치 작업을 멈추고 남은 기록을 모두 기록한 뒤 저장소를 닫음"""
+        if self._task is not None and not self._task.done() and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._task = None
+        self.flush()
+        self.store.flush()
+        self.store.close()
+
+
+def parse_arguments():
+    """커맨드 라인 인자 파싱"""
+    parser = argparse.ArgumentParser(description="VINA 대화 기록 관리 도구")
+    parser.add_argument("--log", type=str, default=JSONL_LOG_PATH, help="대화 기록 파일 경로")
+    parser.add_argument("--db", type=str, default=SQLITE_DB_PATH, help="SQLite DB 파일 경로")
+    parser.add_argument("--build-index", action="store_true", help="기존 로그의 날짜 인덱스를 처음부터 다시 생성")
+    parser.add_argument("--import-jsonl", action="store_true", help="jsonl 로그를 SQLite DB로 가져오기")
+    parser.add_argument("--export-jsonl", type=str, metavar="PATH", help="SQLite DB를 jsonl 파일로 내보내기")
+    parser.add_argument("--rotate", action="store_true", help="현재 로그를 압축 보관하고 새 로그 시작")
+    parser.add_argument("--compression", type=str, default=HISTORY_COMPRESSION, choices=list(COMPRESSION_SUFFIXES.keys()),
+                        help="보관 구간 압축 방식")
+    return parser.parse_args()
+
+
+def main():
+    """메인 실행 함수"""
+    args = parse_arguments()
+
+    if args.build_index:
+        if not os.path.exists(args.log):
+            print(f"❌ 로그 파일이 존재하지 않습니다: {args.log}")
+            sys.exit(1)
+
+        print(f"🗂️ 날짜 인덱스 생성 중: {args.log}")
+        index = update_day_index(args.log, rebuild=True)
+        print(f"✅ {len(index['days'])}개 날짜 인덱싱 완료: {get_day_index_path(args.log)}")
+        return
+
+    if args.import_jsonl:
+        if not os.path.exists(args.log):
+            print(f"❌ 로그 파일이 존재하지 않습니다: {args.log}")
+            sys.exit(1)
+
+        store = SqliteHistoryStore(args.db)
+        if store.load_last_message_time():
+            print(f"❌ DB에 이미 기록이 있습니다: {args.db} (중복 방지를 위해 빈 DB에만 가져올 수 있습니다)")
+            sys.exit(1)
+
+        print(f"📥 jsonl 로그를 SQLite DB로 가져오는 중: {args.log} → {args.db}")
+        count = store.import_jsonl(args.log)
+        store.close()
+        print(f"✅ {count}개 기록 가져오기 완료")
+        return
+
+    if args.export_jsonl:
+        store = SqliteHistoryStore(args.db)
+        print(f"📤 SQLite DB를 jsonl로 내보내는 중: {args.db} → {args.export_jsonl}")
+        count = store.export_jsonl(args.export_jsonl)
+        store.close()
+        print(f"✅ {count}개 기록 내보내기 완료")
+        return
+
+    if args.rotate:
+        if not os.path.exists(args.log):
+            print(f"❌ 로그 파일이 존재하지 않습니다: {args.log}")
+            sys.exit(1)
+
+        print(f"🗜️ 로그 보관 중: {args.log}")
+        archive_path = archive_log_file(args.log, args.compression)
+        print(f"✅ 보관 완료: {archive_path}" if archive_path else "ℹ️ 보관할 기록이 없습니다.")
+        return
+
+    print("ℹ️ 실행할 작업을 지정하세요. (--help 참고)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+VINA 메모리 분석 보조 도구
+
+Claude 메모리 분석(analyze_message_for_memory)을 부르기 전에
+메시지가 기억할 정보를 담고 있을 가능성이 있는지 로컬에서 빠르게 판단합니다.
+"ㅋㅋ", "응", 이모지처럼 사실 정보, 맥락적 규칙, 규칙 추가/삭제 요청이
+들어 있을 수 없는 메시지는 LLM 호출 없이 건너뜁니다.
+
+MemoryBatcher는 사용자 메시지를 대화가 잠잠해질 때까지(또는 N개가 모일 때까지)
+모았다가 한 번의 분석 호출로 넘길 수 있게 묶어 줍니다.
+"""
+
+import re
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# 기억/규칙 관련 요청을 나타내는 단어 (하나라도 있으면 분석)
+MEMORY_KEYWORDS = (
+    "기억", "잊지", "규칙", "매일", "매주", "매달", "평일", "주말", "요일",
+    "삭제", "지워", "없애", "취소", "그만", "알림", "깨워", "챙겨",
+    "앞으로", "항상", "절대", "하지마", "하지 마", "말아줘", "불러줘", "불러",
+    "좋아해", "좋아하", "싫어", "선호", "취향", "생일", "이름", "일정", "약속",
+    "계획", "습관", "루틴", "시험", "출근", "퇴근", "수업", "알레르기",
+)
+
+# 맞장구, 인사 등 짧은 반응 (문장 부호 제거 후 비교)
+TRIVIAL_REPLIES = {
+    "응", "웅", "엉", "어", "ㅇ", "ㅇㅇ", "ㅇㅋ", "ㅇㅋㅇㅋ", "오키", "오케이", "ok", "okay",
+    "네", "넵", "넹", "예", "그래", "그래그래", "그치", "맞아", "ㄹㅇ", "인정",
+    "아하", "아하하", "오", "오오", "와", "우와", "헐", "대박", "굿", "good", "nice",
+    "고마워", "ㄱㅅ", "ㄳ", "땡큐", "thx", "안녕", "하이", "ㅎㅇ", "잘자", "굿밤", "바이", "ㅂㅂ",
+}
+
+# 자모, 문장 부호, 이모지만으로 이루어진 메시지 (ㅋㅋ, ㅠㅠ, 😂, ... 등)
+NOISE_PATTERN = re.compile(r"[ㄱ-ㅎㅏ-ㅣ\W_]+")
+
+# 시각 표현 (예: 8시, 7시 30분, 08:00) - 명시적 규칙의 단서
+TIME_EXPRESSION_PATTERN = re.compile(r"\d{1,2}\s*시|\d{1,2}\s*분|\d{1,2}:\d{2}")
+
+# 자기 자신에 대한 이야기 (나는, 내가, 난, 저는, 제 ...)
+FIRST_PERSON_PATTERN = re.compile(r"(?:^|\s)(?:나|내|저|제)(?:는|가|도|를|랑|한테|의)?(?=\s|$|[,.!?~])|(?:^|\s)(?:난|전)(?=\s)")
+
+# 질문 표현
+QUESTION_PATTERN = re.compile(r"\?$|뭐|뭘|어때|언제|왜|어떻게|어디|누구|몇")
+
+MIN_MESSAGE_LENGTH = 4
+LONG_MESSAGE_LENGTH = 30
+
+def classify_memory_candidate(text: str) -> Tuple[bool, str]:
+    """
+    메시지를 메모리 분석에 보낼지 판단합니다.
+
+    Args:
+        text: 사용자 메시지
+
+    Returns:
+        (분석 필요 여부, 판단 이유) 튜플
+    """
+    stripped = text.strip()
+    compact = re.sub(r"\s+", "", stripped)
+
+    if not compact:
+        return False, "빈 메시지"
+    if any(keyword in stripped for keyword in MEMORY_KEYWORDS):
+        return True, "기억/규칙 키워드"
+    if TIME_EXPRESSION_PATTERN.search(stripped):
+        return True, "시각 표현"
+    if NOISE_PATTERN.fullmatch(compact):
+        return False, "감탄사/이모지"
+    if re.sub(r"[\W_]+", "", compact).lower() in TRIVIAL_REPLIES:
+        return False, "짧은 맞장구"
+    if len(compact) < MIN_MESSAGE_LENGTH:
+        return False, "너무 짧음"
+
+    has_first_person = bool(FIRST_PERSON_PATTERN.search(stripped))
+    if QUESTION_PATTERN.search(stripped) and not has_first_person:
+        return False, "단순 질문"
+    if has_first_person:
+        return True, "자기 이야기"
+    if len(compact) >= LONG_MESSAGE_LENGTH:
+        return True, "긴 메시지"
+    return False, "정보 단서 없음"
+
+class MemoryPrefilter:
+    """메모리 분석 사전 필터 (판단 결과와 건너뛴 비율 집계)"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.checked = 0
+        self.skipped = 0
+        self.reasons: Dict[str, int] = {}
+
+    def should_analyze(self, text: str) -> bool:
+        """
+        메시지를 메모리 분석에 보낼지 판단하고 결과를 집계합니다.
+
+        Args:
+            text: 사용자 메시지
+
+        Returns:
+            분석 필요 여부 (필터가 꺼져 있으면 항상 True)
+        """
+        if not self.enabled:
+            return True
+
+        analyze, reason = classify_memory_candidate(text)
+        self.checked += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if not analyze:
+            self.skipped += 1
+            print(f"⏭️ 메모리 분석 건너뜀 ({reason}): '{text[:30]}'")
+        return analyze
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped / self.checked * 100 if self.checked else 0.0
+
+    def format_stats(self) -> str:
+        """건너뛴 비율과 이유별 건수 요약 (진단용)"""
+        if not self.enabled:
+            return "꺼짐"
+        summary = f"{self.skipped}/{self.checked}개 건너뜀 ({self.skip_rate:.0f}%)"
+        if self.reasons:
+            details = ", ".join(f"{reason} {count}" for reason, count in sorted(self.reasons.items(), key=lambda item: -item[1]))
+            summary += f" - {details}"
+        return summary
+
+# ───── 메모리 분석 묶음 처리 ─────
+def format_batch_for_analysis(messages: List[Dict[str, Any]]) -> str:
+    """
+    묶음 분석용으로 메시지 목록을 번호와 시각이 붙은 텍스트로 변환합니다.
+
+    Args:
+        messages: {"content": 내용, "time": ISO 시간} 목록 (시간 순서)
+
+    Returns:
+        분석 프롬프트에 넣을 메시지 텍스트
+    """
+    lines = []
+    for idx, msg in enumerate(messages, start=1):
+        time_str = ""
+        try:
+            time_str = datetime.datetime.fromisoformat(msg.get("time", "")).strftime("%H:%M")
+        except ValueError:
+            pass
+        lines.append(f'{idx}. [{time_str}] "{msg.get("content", "")}"')
+    return "\n".join(lines)
+
+class MemoryBatcher:
+    """
+    사용자별로 메시지를 모아 묶음 분석 단위로 내보내는 버퍼
+
+    - max_messages개가 모이면 바로 묶음을 내보냄
+    - 마지막 메시지 이후 idle_seconds초 동안 새 메시지가 없으면 묶음을 내보냄
+    """
+
+    def __init__(self, max_messages: int = 10, idle_seconds: float = 120.0):
+        self.max_messages = max(1, max_messages)
+        self.idle_seconds = idle_seconds
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def pending_count(self) -> int:
+        """묶음 대기 중인 메시지 수"""
+        return sum(len(batch["messages"]) for batch in self.batches.values())
+
+    def add(self, user_name: str, user_msg: str, channel_id: str,
+            now: datetime.datetime) -> Optional[Dict[str, Any]]:
+        """
+        메시지를 묶음에 추가합니다.
+
+        Args:
+            user_name: 사용자 이름
+            user_msg: 메시지 내용
+            channel_id: 채널 ID
+            now: 메시지 시각
+
+        Returns:
+            max_messages개가 모였으면 내보낼 묶음, 아니면 None
+            (묶음 형식: {"user_name", "channel_id", "messages", "last_time"})
+        """
+        batch = self.batches.setdefault(user_name, {"user_name": user_name, "messages": []})
+        batch["channel_id"] = channel_id
+        batch["last_time"] = now
+        batch["messages"].append({"content": user_msg, "time": now.isoformat(timespec="seconds")})
+
+        if len(batch["messages"]) >= self.max_messages:
+            return self.batches.pop(user_name)
+        return None
+
+    def pop_due(self, now: datetime.datetime) -> List[Dict[str, Any]]:
+        """대화가 idle_seconds초 이상 멈춘 사용자의 묶음을 꺼냄"""
+        due = [user_name for user_name, batch in self.batches.items()
+               if (now - batch["last_time"]).total_seconds() >= self.idle_seconds]
+        return [self.batches.pop(user_name) for user_name in due]
+
+    def pop_all(self) -> List[Dict[str, Any]]:
+        """대기 중인 모든 묶음을 꺼냄"""
+        batches = list(self.batches.values())
+        self.batches = {}
+        return batches
+
+    def seconds_until_due(self, now: datetime.datetime) -> Optional[float]:
+        """가장 먼저 내보낼 묶음까지 남은 초 (대기 중인 묶음이 없으면 None)"""
+        if not self.batches:
+            return None
+        earliest = min(batch["last_time"] for batch in self.batches.values())
+        return max(0.0, self.idle_seconds - (now - earliest).total_seconds())
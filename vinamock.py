@@ -0,0 +1,278 @@
+"""
+VINA 오프라인 모의 LLM 백엔드
+
+VINA_LLM_BACKEND=mock이면 vinallm이 실제 Claude API 대신 이 모듈의 MockAsyncClient를
+사용하므로, 네트워크와 API 키 없이 응답 생성, 규칙 트리거, 메모리 분석, 리포트 경로를
+실행하고 벤치마크할 수 있습니다.
+
+- messages.create / messages.stream 인터페이스를 흉내 냄 (스트리밍 포함)
+- 응답 지연 분포 설정 (VINA_MOCK_LATENCY: "0.5", "uniform:0.2,0.8", "normal:0.6,0.2", "lognormal:-0.7,0.4")
+- 요청 종류별 정해진 응답: 메모리 분석은 JSON, 리포트는 리포트 형식, 대화/규칙은 짧은 문장
+- 일정 비율로 '/None' 응답 (VINA_MOCK_NONE_RATE)과 API 오류 (VINA_MOCK_ERROR_RATE, VINA_MOCK_ERROR_STATUS)
+- 프롬프트 캐시 블록을 기억해 캐시 생성/읽기 토큰도 흉내 냄
+- 같은 시드(VINA_MOCK_SEED)면 같은 순서의 지연/응답/오류가 나옴
+
+벤치마크: python vinamock.py --calls 50
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import types
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import anthropic
+
+import vinabudget
+
+# 메모리 분석 요청에 돌려줄 기본 JSON (VINA_MOCK_MEMORY_JSON 파일로 바꿀 수 있음)
+DEFAULT_MEMORY_ANALYSIS = {
+    "facts": [],
+    "contextual_rules": [],
+    "explicit_rules": [],
+    "rules_to_delete": [],
+    "analysis": "모의 분석: 저장할 정보 없음",
+    "has_valuable_info": False
+}
+
+STREAM_CHUNK_SIZE = 8
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    지연 분포 설정 문자열을 초 단위 지연을 뽑는 함수로 변환합니다.
+
+    Args:
+        spec: "0.5" (고정), "fixed:0.5", "uniform:최소,최대", "normal:평균,표준편차", "lognormal:mu,sigma"
+
+    Returns:
+        random.Random을 받아 지연(초, 0 이상)을 반환하는 함수
+    """
+    kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(v) for v in params.split(",") if v.strip()]
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: max(0.0, values[0])
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: max(0.0, rng.uniform(values[0], values[1]))
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"지원하지 않는 지연 분포: {spec}")
+
+def make_api_error(status_code: int) -> anthropic.APIStatusError:
+    """실제 API와 같은 종류의 상태 코드 오류 생성 (게이트웨이 재시도 확인용)"""
+    request = httpx.Request("POST", "https://mock.invalid/v1/messages")
+    response = httpx.Response(status_code, request=request)
+    if status_code == 429:
+        error_class = anthropic.RateLimitError
+    elif status_code >= 500:
+        error_class = anthropic.InternalServerError
+    else:
+        error_class = anthropic.APIStatusError
+    return error_class(f"모의 오류 {status_code}", response=response, body=None)
+
+def request_text(blocks: Any) -> List[Dict[str, Any]]:
+    """system/content 값을 텍스트 블록 목록으로 정규화"""
+    if not blocks:
+        return []
+    if isinstance(blocks, str):
+        return [{"type": "text", "text": blocks}]
+    return [block for block in blocks if block.get("type") == "text"]
+
+def make_message(text: str, usage: Dict[str, int]):
+    """Claude 응답 객체와 같은 모양(content[0].text, usage)의 응답"""
+    return types.SimpleNamespace(
+        content=[types.SimpleNamespace(type="text", text=text)],
+        usage=types.SimpleNamespace(**usage),
+        stop_reason="end_turn"
+    )
+
+class MockMessages:
+    """messages.create / messages.stream을 흉내 내는 모의 API"""
+
+    def __init__(self, latency: str = "0.5", chunk_delay: float = 0.05, none_rate: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 529, seed: Optional[int] = 0,
+                 memory_analysis: Optional[Dict[str, Any]] = None):
+        self.sample_latency = parse_latency(latency)
+        self.chunk_delay = chunk_delay
+        self.none_rate = none_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.memory_analysis = memory_analysis or DEFAULT_MEMORY_ANALYSIS
+        self.cached_prefixes = set()
+        self.stats = {"calls": 0, "errors": 0, "none": 0}
+
+    def classify(self, text: str) -> str:
+        """프롬프트 내용으로 요청 종류 판별"""
+        if '"has_valuable_info"' in text:
+            return "memory"
+        if "핵심 키워드" in text and "리포트" in text:
+            return "report"
+        if "현재 트리거된 규칙" in text:
+            return "rule"
+        return "chat"
+
+    def reply_text(self, kind: str, text: str) -> str:
+        """요청 종류별 정해진 응답"""
+        if kind == "memory":
+            return json.dumps(self.memory_analysis, ensure_ascii=False, indent=2)
+        if kind == "report":
+            title = next((line for line in text.splitlines() if line.startswith("# ") and "리포트" in line), "# 리포트")
+            return (f"{title}\n\n모의 리포트: 하루 동안 평범한 대화를 나눴다.\n\n---\n\n"
+                    "**🧠 핵심 키워드**: 모의, 테스트, 대화, 벤치마크\n"
+                    "**💬 메시지 수**: 0개\n**🕒 총 대화 시간**: 0시간\n"
+                    "**🌟 오늘의 문장**: \"모의 응답입니다.\"\n")
+        if self.random.random() < self.none_rate:
+            self.stats["none"] += 1
+            return "/None"
+        if kind == "rule":
+            return "모의 응답: 규칙에 따라 먼저 말을 걸어요!"
+        request = text.split("# 5. 현재 요청", 1)[-1].split("# 응답 가이드", 1)[0].strip()
+        return f"모의 응답: '{request[:50]}'에 대한 답이에요."
+
+    def count_usage(self, kwargs: Dict[str, Any], output: str) -> Dict[str, int]:
+        """cache_control이 붙은 블록까지를 캐시 대상으로 보고 토큰 사용량을 계산"""
+        blocks = request_text(kwargs.get("system"))
+        for message in kwargs.get("messages", []):
+            blocks += request_text(message.get("content"))
+
+        usage = {"input_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0,
+                 "output_tokens": vinabudget.estimate_tokens(output)}
+        prefix = hashlib.blake2b(digest_size=16)
+        pending = 0
+        for block in blocks:
+            prefix.update(block["text"].encode("utf-8"))
+            pending += vinabudget.estimate_tokens(block["text"])
+            if block.get("cache_control"):
+                key = prefix.hexdigest()
+                field = "cache_read_input_tokens" if key in self.cached_prefixes else "cache_creation_input_tokens"
+                self.cached_prefixes.add(key)
+                usage[field] += pending
+                pending = 0
+        usage["input_tokens"] = pending
+        return usage
+
+    async def respond(self, kwargs: Dict[str, Any]):
+        """지연과 오류를 적용하고 응답 객체 생성"""
+        self.stats["calls"] += 1
+        await asyncio.sleep(self.sample_latency(self.random))
+        if self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            raise make_api_error(self.error_status)
+
+        text = "\n".join(block["text"] for message in kwargs.get("messages", [])
+                         for block in request_text(message.get("content")))
+        output = self.reply_text(self.classify(text), text)
+        return make_message(output, self.count_usage(kwargs, output))
+
+    async def create(self, **kwargs: Any):
+        return await self.respond(kwargs)
+
+    def stream(self, **kwargs: Any) -> "MockStream":
+        return MockStream(self, kwargs)
+
+class MockStream:
+    """messages.stream 컨텍스트 매니저 (첫 조각 전 지연 후 조각 단위로 반환)"""
+
+    def __init__(self, messages: MockMessages, kwargs: Dict[str, Any]):
+        self.messages = messages
+        self.kwargs = kwargs
+        self.message = None
+
+    async def __aenter__(self) -> "MockStream":
+        self.message = await self.messages.respond(self.kwargs)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+    @property
+    async def text_stream(self):
+        text = self.message.content[0].text
+        for start in range(0, len(text), STREAM_CHUNK_SIZE):
+            if start:
+                await asyncio.sleep(self.messages.chunk_delay)
+            yield text[start:start + STREAM_CHUNK_SIZE]
+
+    async def get_final_message(self):
+        return self.message
+
+class MockAsyncClient:
+    """anthropic.AsyncAnthropic 대신 쓰는 모의 클라이언트"""
+
+    def __init__(self, **options: Any):
+        self.messages = MockMessages(**options)
+
+    @classmethod
+    def from_env(cls) -> "MockAsyncClient":
+        """VINA_MOCK_* 환경 변수로 설정한 모의 클라이언트"""
+        memory_analysis = None
+        memory_json_path = os.getenv("VINA_MOCK_MEMORY_JSON")
+        if memory_json_path:
+            with open(memory_json_path, "r", encoding="utf-8") as f:
+                memory_analysis = json.load(f)
+
+        seed = os.getenv("VINA_MOCK_SEED", "0")
+        return cls(
+            latency=os.getenv("VINA_MOCK_LATENCY", "uniform:0.3,0.8"),
+            chunk_delay=float(os.getenv("VINA_MOCK_CHUNK_DELAY", "0.05")),
+            none_rate=float(os.getenv("VINA_MOCK_NONE_RATE", "0")),
+            error_rate=float(os.getenv("VINA_MOCK_ERROR_RATE", "0")),
+            error_status=int(os.getenv("VINA_MOCK_ERROR_STATUS", "529")),
+            seed=int(seed) if seed else None,
+            memory_analysis=memory_analysis
+        )
+
+# ───── 벤치마크 ─────
+async def run_benchmark(calls: int, stream: bool) -> List[float]:
+    """모의 백엔드로 vinallm 호출 경로(게이트웨이 포함)를 동시에 calls번 실행하고 지연 시간 목록 반환"""
+    import vinallm
+
+    prompt = [vinallm.cached_text_block("# 1. 사용자 기억 정보\n- 벤치마크 사용자\n"),
+              vinallm.text_block("# 5. 현재 요청\n안녕\n# 응답 가이드\n")]
+    request = dict(max_tokens=500, messages=[{"role": "user", "content": prompt}])
+
+    async def one_call() -> float:
+        start = time.perf_counter()
+        try:
+            if stream:
+                async for _ in vinallm.stream_text(label="chat", **request):
+                    pass
+            else:
+                await vinallm.create_message(label="chat", **request)
+        except Exception as e:
+            print(f"❌ 호출 실패: {type(e).__name__} {e}")
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*(one_call() for _ in range(calls)))
+
+def main():
+    parser = argparse.ArgumentParser(description="VINA 모의 LLM 백엔드 벤치마크")
+    parser.add_argument("--calls", type=int, default=20, help="동시에 보낼 호출 수")
+    parser.add_argument("--stream", action="store_true", help="스트리밍 호출로 측정")
+    args = parser.parse_args()
+
+    os.environ["VINA_LLM_BACKEND"] = "mock"
+    import vinallm
+
+    print(f"🧪 모의 백엔드 벤치마크: {args.calls}회 {'스트리밍 ' if args.stream else ''}호출")
+    start = time.perf_counter()
+    latencies = sorted(asyncio.run(run_benchmark(args.calls, args.stream)))
+    elapsed = time.perf_counter() - start
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    print(f"⏱️ 전체 {elapsed:.2f}초, p50 {percentile(0.5):.2f}초, p95 {percentile(0.95):.2f}초, 최대 {latencies[-1]:.2f}초")
+    print(f"🚦 {vinallm.gateway.format_stats()}")
+    print(f"📊 {vinallm.format_usage_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ VINA의 대화 기록을 기반으로 일간 리포트를 생성하는 자동화
 2. 날짜 필터링 (예: 2025-04-24)
 3. 불용 메시지 제거 + 정제
 4. 문서 변환
+   (1~4단계는 제너레이터로 연결되어 메시지를 하나씩 흘려보내므로
+    하루 대화가 아무리 길어도 메모리 사용량이 일정하게 유지됨)
 5. Claude Haiku 프롬프트 생성
 6. LLM 응답 수신 (일기 리포트)
 7. Markdown 저장 + 메타 저장
@@ -21,15 +23,18 @@ sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 import json
 import os
 import re
+import hashlib
 import datetime
 import argparse
-from typing import List, Dict, Any, Tuple
-import anthropic
+from typing import List, Dict, Any, Tuple, Iterable, Iterator
 from dotenv import load_dotenv
 import discord
 from discord import Webhook
 import aiohttp
 import asyncio
+import vinalog
+import vinallm
+import vinadispatch
 
 # 환경 변수 로드
 load_dotenv()
@@ -39,8 +44,8 @@ JSONL_LOG_PATH = "vina_memory/logs/vina_history.jsonl"
 REPORTS_DIR = "vina_reports"
 DISCORD_WEBHOOK_URL = os.getenv("DISCORD_REPORT_WEBHOOK_URL")
 
-# Claude API 클라이언트 설정
-claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# 대화 기록 저장소 (VINA_HISTORY_BACKEND 환경 변수로 jsonl/sqlite 선택)
+history_store = vinalog.get_history_store()
 
 # 디스코드 클라이언트 설정
 DISCORD_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -48,6 +53,9 @@ intents = discord.Intents.default()
 intents.message_content = True
 discord_client = discord.Client(intents=intents)
 
+# 디스코드 전송기 (긴 리포트는 임베드 설명 길이 제한에 맞춰 나눠 보냄)
+outbound = vinadispatch.OutboundSender()
+
 # LlamaIndex 대체를 위한 단순 Document 클래스
 class Document:
     """LlamaIndex Document를 대체하는 간단한 문서 클래스"""
@@ -69,66 +77,57 @@ def parse_arguments():
         
     return parser.parse_args()
 
-def load_conversation_data(date_str: str) -> List[Dict[str, Any]]:
+# ───── 스트리밍 파이프라인 단계 ─────
+def iter_conversation_data(date_str: str) -> Iterator[Dict[str, Any]]:
     """
-    지정된 날짜의 대화 데이터를 로드하고 필터링합니다.
+    지정된 날짜의 대화 메시지를 저장소에서 하나씩 읽어 반환합니다.
     
     Args:
         date_str: YYYY-MM-DD 형식의 날짜 문자열
     
-    Returns:
-        해당 날짜의 대화 메시지 리스트
+    Yields:
+        해당 날짜의 대화 메시지
     """
-    print(f"🔍 {date_str} 날짜의 대화 데이터 로딩 중...")
+    if not history_store.exists():
+        print(f"❌ 로그 파일이 존재하지 않습니다: {history_store.path}")
+        return
     
-    if not os.path.exists(JSONL_LOG_PATH):
-        print(f"❌ 로그 파일이 존재하지 않습니다: {JSONL_LOG_PATH}")
-        return []
+    # 날짜 인덱스(또는 DB 시간 인덱스)로 해당 날짜의 기록만 읽음
+    yield from history_store.iter_day(date_str)
+
+def iter_counted(messages: Iterable[Dict[str, Any]], counts: Dict[str, int], key: str) -> Iterator[Dict[str, Any]]:
+    """
+    메시지를 그대로 흘려보내면서 counts[key]에 지나간 개수를 셉니다.
     
-    messages = []
-    try:
-        with open(JSONL_LOG_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    message = json.loads(line)
-                    # 날짜 비교를 위해 시간 파싱
-                    if "time" in message and message["time"]:
-                        msg_time = datetime.datetime.fromisoformat(message["time"])
-                        msg_date = msg_time.strftime("%Y-%m-%d")
-                        
-                        # 지정된 날짜와 일치하는 메시지만 필터링
-                        if msg_date == date_str:
-                            messages.append(message)
-                except json.JSONDecodeError:
-                    continue
-                except ValueError:
-                    # 잘못된 날짜 형식 처리
-                    continue
-        
-        print(f"✅ {len(messages)}개의 메시지를 로드했습니다.")
-        return messages
-    except Exception as e:
-        print(f"❌ 대화 데이터 로드 중 오류 발생: {e}")
-        return []
+    Args:
+        messages: 메시지 스트림
+        counts: 개수를 기록할 딕셔너리
+        key: 개수를 기록할 키
+    
+    Yields:
+        입력과 같은 메시지
+    """
+    counts.setdefault(key, 0)
+    for msg in messages:
+        counts[key] += 1
+        yield msg
 
-def clean_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def iter_clean_messages(messages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
     """
-    대화 메시지를 정제합니다:
+    메시지 스트림을 정제합니다:
     - 시스템 메시지 제거
     - 빈 메시지 제거
     - 특수 명령어 제거 ('/None' 등)
     - 중복 메시지 정리
     
     Args:
-        messages: 원본 메시지 리스트
+        messages: 원본 메시지 스트림
     
-    Returns:
-        정제된 메시지 리스트
+    Yields:
+        정제된 메시지
     """
-    print("🧹 불필요한 메시지 정제 중...")
-    
-    filtered_messages = []
-    seen_contents = set()
+    # 중복 확인용으로 내용 대신 고정 길이 해시만 보관
+    seen_digests = set()
     
     for msg in messages:
         # 필수 필드가 없는 메시지 건너뛰기
@@ -145,58 +144,148 @@ def clean_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             continue
         
         # 이미 본 내용 중복 제거 (정확히 같은 내용)
-        if content in seen_contents:
+        digest = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+        if digest in seen_digests:
             continue
             
-        seen_contents.add(content)
-        filtered_messages.append(msg)
+        seen_digests.add(digest)
+        yield msg
+
+def format_message_line(msg: Dict[str, Any]) -> str:
+    """메시지 하나를 '[시간] 화자: 내용' 형식의 문서 줄로 변환"""
+    speaker = msg.get("name", "Unknown") if msg.get("role") == "user" else "VINA"
+    content = msg.get("content", "")
+    time_str = ""
     
-    print(f"✅ {len(filtered_messages)}개의 메시지로 정제되었습니다.")
-    return filtered_messages
+    if "time" in msg and msg["time"]:
+        try:
+            msg_time = datetime.datetime.fromisoformat(msg["time"])
+            time_str = msg_time.strftime("%H:%M")
+        except ValueError:
+            time_str = ""
+    
+    return f"[{time_str}] {speaker}: {content}\n\n"
 
-def convert_to_document(messages: List[Dict[str, Any]]) -> Document:
+def build_document(messages: Iterable[Dict[str, Any]]) -> Document:
     """
-    정제된 메시지를 Document 형식으로 변환합니다.
+    메시지 스트림을 하나씩 받아 Document를 만듭니다.
     
     Args:
-        messages: 정제된 메시지 리스트
+        messages: 정제된 메시지 스트림
     
     Returns:
-        Document 객체
+        Document 객체 (metadata에 메시지 수, 날짜, 첫/마지막 메시지 시간 포함)
     """
-    print("📄 메시지를 Document로 변환 중...")
-    
-    # 대화 내용을 하나의 문자열로 조합
-    conversation_text = ""
+    # 문자열 += 대신 버퍼에 이어 쓰기
+    buffer = io.StringIO()
+    message_count = 0
+    first_time = None
+    last_time = None
+    date = ""
     
     for msg in messages:
-        speaker = msg.get("name", "Unknown") if msg.get("role") == "user" else "VINA"
-        content = msg.get("content", "")
-        time_str = ""
+        buffer.write(format_message_line(msg))
+        
+        if message_count == 0:
+            date = msg.get("time", "").split("T")[0]
+        message_count += 1
         
         if "time" in msg and msg["time"]:
             try:
                 msg_time = datetime.datetime.fromisoformat(msg["time"])
-                time_str = msg_time.strftime("%H:%M")
             except ValueError:
-                time_str = ""
-        
-        # 형식: [시간] 화자: 내용
-        formatted_msg = f"[{time_str}] {speaker}: {content}\n\n"
-        conversation_text += formatted_msg
+                continue
+            if first_time is None or msg_time < first_time:
+                first_time = msg_time
+            if last_time is None or msg_time > last_time:
+                last_time = msg_time
     
-    # Document 객체 생성
     metadata = {
-        "source": JSONL_LOG_PATH,
-        "date": messages[0].get("time", "").split("T")[0] if messages else "",
-        "message_count": len(messages)
+        "source": history_store.path,
+        "date": date,
+        "message_count": message_count,
+        "first_time": first_time.isoformat() if first_time else None,
+        "last_time": last_time.isoformat() if last_time else None
     }
     
-    document = Document(text=conversation_text, metadata=metadata)
+    return Document(text=buffer.getvalue(), metadata=metadata)
+
+# ───── 리스트 기반 단계 (스트리밍 단계의 래퍼) ─────
+def load_conversation_data(date_str: str) -> List[Dict[str, Any]]:
+    """
+    지정된 날짜의 대화 데이터를 로드하고 필터링합니다.
+    
+    Args:
+        date_str: YYYY-MM-DD 형식의 날짜 문자열
+    
+    Returns:
+        해당 날짜의 대화 메시지 리스트
+    """
+    print(f"🔍 {date_str} 날짜의 대화 데이터 로딩 중...")
+    
+    try:
+        messages = list(iter_conversation_data(date_str))
+        
+        print(f"✅ {len(messages)}개의 메시지를 로드했습니다.")
+        return messages
+    except Exception as e:
+        print(f"❌ 대화 데이터 로드 중 오류 발생: {e}")
+        return []
+
+def clean_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    대화 메시지를 정제합니다 (iter_clean_messages 참고).
+    
+    Args:
+        messages: 원본 메시지 리스트
+    
+    Returns:
+        정제된 메시지 리스트
+    """
+    print("🧹 불필요한 메시지 정제 중...")
+    
+    filtered_messages = list(iter_clean_messages(messages))
+    
+    print(f"✅ {len(filtered_messages)}개의 메시지로 정제되었습니다.")
+    return filtered_messages
+
+def convert_to_document(messages: List[Dict[str, Any]]) -> Document:
+    """
+    정제된 메시지를 Document 형식으로 변환합니다.
+    
+    Args:
+        messages: 정제된 메시지 리스트
+    
+    Returns:
+        Document 객체
+    """
+    print("📄 메시지를 Document로 변환 중...")
+    
+    document = build_document(messages)
     print(f"✅ {len(messages)}개 메시지가 Document로 변환되었습니다.")
     
     return document
 
+def load_report_document(date_str: str) -> Tuple[Document, Dict[str, int]]:
+    """
+    로드 → 정제 → 문서 변환을 스트리밍으로 한 번에 수행합니다.
+    
+    Args:
+        date_str: YYYY-MM-DD 형식의 날짜 문자열
+    
+    Returns:
+        (Document, {"loaded": 로드된 메시지 수, "cleaned": 정제 후 메시지 수}) 튜플
+    """
+    print(f"🔍 {date_str} 날짜의 대화 데이터를 스트리밍으로 로드, 정제, 변환 중...")
+    
+    counts = {}
+    messages = iter_counted(iter_conversation_data(date_str), counts, "loaded")
+    document = build_document(iter_clean_messages(messages))
+    counts["cleaned"] = document.metadata["message_count"]
+    
+    print(f"✅ {counts['loaded']}개 메시지 로드 → {counts['cleaned']}개 메시지로 정제되어 Document로 변환되었습니다.")
+    return document, counts
+
 def generate_report_prompt(document: Document, date_str: str) -> str:
     """
     Claude에 전달할 리포트 생성 프롬프트를 작성합니다.
@@ -245,7 +334,7 @@ def generate_report_prompt(document: Document, date_str: str) -> str:
 """
     return prompt
 
-def create_report_with_claude(prompt: str) -> str:
+async def create_report_with_claude(prompt: str) -> str:
     """
     Claude API를 사용하여 리포트를 생성합니다.
     
@@ -258,7 +347,8 @@ def create_report_with_claude(prompt: str) -> str:
     print("🤖 Claude API로 리포트 생성 중...")
     
     try:
-        response = claude_client.messages.create(
+        response = await vinallm.create_message(
+            label="report",
             model="claude-3-haiku-20240307",
             max_tokens=1500,
             messages=[
@@ -307,51 +397,82 @@ def save_report(report_text: str, stats: Dict[str, Any], date_str: str) -> Tuple
     print(f"✅ 리포트가 다음 위치에 저장되었습니다: {report_path}")
     return report_path, stats_path
 
-def extract_stats_from_report(report_text: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _add_report_fields(stats: Dict[str, Any], report_text: str):
+    """리포트 본문에서 키워드와 오늘의 문장을 추출하여 stats에 추가"""
+    # 정규식으로 키워드 추출
+    keywords_match = re.search(r'\*\*🧠 핵심 키워드\*\*:\s*(.*?)(?:\n|$)', report_text)
+    if keywords_match:
+        keywords_str = keywords_match.group(1).strip()
+        stats["keywords"] = [k.strip() for k in keywords_str.split(',')]
+    
+    # 오늘의 문장 추출
+    todays_quote_match = re.search(r'\*\*🌟 오늘의 문장\*\*:\s*"?(.*?)"?(?:\n|$)', report_text)
+    if todays_quote_match:
+        stats["todays_quote"] = todays_quote_match.group(1).strip()
+
+def _add_time_stats(stats: Dict[str, Any], first_time: datetime.datetime, last_time: datetime.datetime):
+    duration = last_time - first_time
+    stats["first_message_time"] = first_time.strftime("%H:%M:%S")
+    stats["last_message_time"] = last_time.strftime("%H:%M:%S")
+    stats["duration_minutes"] = int(duration.total_seconds() / 60)
+
+def extract_stats_from_report(report_text: str, messages: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
     """
     리포트 내용에서 통계 정보를 추출합니다.
     
     Args:
         report_text: 생성된 리포트 내용
-        messages: 날짜별 필터링된 메시지 리스트
+        messages: 날짜별 필터링된 메시지 리스트 (또는 스트림)
     
     Returns:
         통계 정보가 담긴 딕셔너리
     """
     stats = {}
     
-    # 메시지 수
-    stats["message_count"] = len(messages)
-    
-    # 첫 메시지와 마지막 메시지 시간
-    time_stamps = []
+    # 메시지 수와 첫 메시지/마지막 메시지 시간을 한 번에 계산
+    message_count = 0
+    first_time = None
+    last_time = None
     for msg in messages:
+        message_count += 1
         if "time" in msg and msg["time"]:
             try:
                 msg_time = datetime.datetime.fromisoformat(msg["time"])
-                time_stamps.append(msg_time)
             except ValueError:
                 continue
+            if first_time is None or msg_time < first_time:
+                first_time = msg_time
+            if last_time is None or msg_time > last_time:
+                last_time = msg_time
     
-    if time_stamps:
-        first_time = min(time_stamps)
-        last_time = max(time_stamps)
-        duration = last_time - first_time
-        
-        stats["first_message_time"] = first_time.strftime("%H:%M:%S")
-        stats["last_message_time"] = last_time.strftime("%H:%M:%S")
-        stats["duration_minutes"] = int(duration.total_seconds() / 60)
+    stats["message_count"] = message_count
     
-    # 정규식으로 키워드 추출
-    keywords_match = re.search(r'\*\*🧠 핵심 키워드\*\*:\s*(.*?)(?:\n|$)', report_text)
-    if keywords_match:
-        keywords_str = keywords_match.group(1).strip()
-        stats["keywords"] = [k.strip() for k in keywords_str.split(',')]
+    if first_time is not None:
+        _add_time_stats(stats, first_time, last_time)
     
-    # 오늘의 문장 추출
-    todays_quote_match = re.search(r'\*\*🌟 오늘의 문장\*\*:\s*"?(.*?)"?(?:\n|$)', report_text)
-    if todays_quote_match:
-        stats["todays_quote"] = todays_quote_match.group(1).strip()
+    _add_report_fields(stats, report_text)
+    
+    return stats
+
+def extract_stats_from_document(report_text: str, document: Document) -> Dict[str, Any]:
+    """
+    build_document가 기록한 메타데이터와 리포트 내용으로 통계 정보를 추출합니다.
+    
+    Args:
+        report_text: 생성된 리포트 내용
+        document: build_document로 만든 Document
+    
+    Returns:
+        통계 정보가 담긴 딕셔너리
+    """
+    stats = {"message_count": document.metadata.get("message_count", 0)}
+    
+    first_time = document.metadata.get("first_time")
+    last_time = document.metadata.get("last_time")
+    if first_time and last_time:
+        _add_time_stats(stats, datetime.datetime.fromisoformat(first_time), datetime.datetime.fromisoformat(last_time))
+    
+    _add_report_fields(stats, report_text)
     
     return stats
 
@@ -402,7 +523,7 @@ async def send_to_discord(report_path: str, date_str: str) -> bool:
                 break
         
         if report_channel:
-            await report_channel.send(embed=embed)
+            await outbound.send(report_channel, embed=embed)
             print(f"✅ '{report_channel.name}' 채널로 리포트 전송 완료!")
             return True
         else:
@@ -450,7 +571,8 @@ async def send_to_discord_webhook(report_path: str, date_str: str) -> bool:
         # 웹훅으로 메시지 전송
         async with aiohttp.ClientSession() as session:
             webhook = Webhook.from_url(DISCORD_WEBHOOK_URL, session=session)
-            await webhook.send(embed=embed, username="VINA 리포트 봇")
+            for part in vinadispatch.split_embed(embed):
+                await webhook.send(embed=part, username="VINA 리포트 봇")
         
         print("✅ Discord 웹훅으로 리포트 전송 완료!")
         return True
@@ -481,31 +603,25 @@ async def main():
         print(f"⚠️ {date_str} 날짜의 리포트가 이미 존재합니다. --force 옵션을 사용하여 재생성할 수 있습니다.")
         sys.exit(0)
     
-    # 1. 날짜별 대화 데이터 로드
-    messages = load_conversation_data(date_str)
+    # 1~3. 날짜별 대화 데이터 로드 → 메시지 정제 → Document 변환 (스트리밍)
+    document, counts = load_report_document(date_str)
     
-    if not messages:
+    if not counts["loaded"]:
         print(f"⚠️ {date_str} 날짜의 대화 데이터가 없습니다.")
         sys.exit(1)
     
-    # 2. 메시지 정제
-    cleaned_messages = clean_messages(messages)
-    
-    if not cleaned_messages:
+    if not counts["cleaned"]:
         print(f"⚠️ 정제 후 남은 메시지가 없습니다.")
         sys.exit(1)
     
-    # 3. Document 변환
-    document = convert_to_document(cleaned_messages)
-    
     # 4. 리포트 프롬프트 생성
     prompt = generate_report_prompt(document, date_str)
     
     # 5. Claude로 리포트 생성
-    report_text = create_report_with_claude(prompt)
+    report_text = await create_report_with_claude(prompt)
     
     # 6. 통계 정보 추출
-    stats = extract_stats_from_report(report_text, cleaned_messages)
+    stats = extract_stats_from_document(report_text, document)
     
     # 7. 리포트 저장
     report_path, stats_path = save_report(report_text, stats, date_str)
@@ -652,23 +768,17 @@ async def on_message(message):
             report_path = os.path.join(report_dir, "report.md")
             force = True  # 기존 리포트 덮어쓰기
             
-            # 1. 날짜별 대화 데이터 로드
-            messages = load_conversation_data(date_str)
+            # 1~3. 날짜별 대화 데이터 로드 → 메시지 정제 → Document 변환 (스트리밍)
+            document, counts = load_report_document(date_str)
             
-            if not messages:
+            if not counts["loaded"]:
                 await progress_msg.edit(content=f"⚠️ {date_str} 날짜의 대화 데이터가 없습니다.")
                 return
             
-            # 2. 메시지 정제
-            cleaned_messages = clean_messages(messages)
-            
-            if not cleaned_messages:
+            if not counts["cleaned"]:
                 await progress_msg.edit(content=f"⚠️ {date_str} 날짜의 정제된 메시지가 없습니다.")
                 return
             
-            # 3. Document 변환
-            document = convert_to_document(cleaned_messages)
-            
             # 4. 리포트 프롬프트 생성
             prompt = generate_report_prompt(document, date_str)
             
@@ -676,10 +786,10 @@ async def on_message(message):
             await progress_msg.edit(content=f"🤖 {date_str} 날짜의 리포트를 생성 중입니다... Claude API 호출 중")
             
             # 5. Claude로 리포트 생성
-            report_text = create_report_with_claude(prompt)
+            report_text = await create_report_with_claude(prompt)
             
             # 6. 통계 정보 추출
-            stats = extract_stats_from_report(report_text, cleaned_messages)
+            stats = extract_stats_from_document(report_text, document)
             
             # 7. 리포트 저장
             os.makedirs(report_dir, exist_ok=True)
@@ -708,7 +818,7 @@ async def on_message(message):
             )
             
             # 리포트 전송
-            await message.channel.send(embed=embed)
+            await outbound.send(message.channel, embed=embed)
             
             # 진행 상황 메시지 삭제
             await progress_msg.delete()
@@ -736,7 +846,7 @@ async def on_message(message):
             inline=False
         )
         
-        await message.channel.send(embed=help_embed)
+        await outbound.send(message.channel, embed=help_embed)
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == '--discord-bot':
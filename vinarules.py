@@ -0,0 +1,650 @@
+"""
+VINA 명시적 규칙 엔진
+
+explicit_rules.json의 condition_tags 문자열을 한 번만 해석해서
+조건 객체(시간, 경과 시간, 요일)로 컴파일합니다.
+규칙 점검 시에는 정규식이나 문자열 파싱 없이 컴파일된 조건만 평가합니다.
+
+RuleScheduler는 컴파일된 규칙마다 다음 실행 가능 시각을 계산해서
+힙에 넣고, 가장 이른 시각까지 잠들었다가 정확히 그 시각에 규칙을 실행하게 합니다.
+RuleStateStore는 규칙별 마지막 실행 시각과 다음 실행 예정 시각을 파일에 저장하고,
+쿨다운과 "대화가 멈춘 구간마다 한 번" 실행 제한을 적용합니다.
+재시작 후에는 저장된 상태로 이미 실행한 규칙을 다시 실행하지 않고,
+꺼져 있는 동안 놓친 예약을 확인할 수 있습니다.
+ActivityTracker는 채널별/사용자별 마지막 메시지 시각을 보관하고 파일에 저장해서
+경과 시간 조건을 규칙이 보는 채널(또는 사용자) 기준으로 평가하게 합니다.
+
+규칙 실행 제한 (explicit_rules.json의 선택 필드):
+- cooldown        마지막 실행 후 다시 실행되기까지 최소 대기 시간 (초)
+- once_per_idle   마지막 사용자 메시지 이후 한 번만 실행
+                  (last_message_elapsed 조건이 있는 규칙은 기본값 true)
+- channel         규칙 메시지를 보낼 채널 ID (없으면 메인 채널)
+- scope           경과 시간 기준 범위
+                  "channel"(기본값, 대상 채널), "global"(모든 채널), "user:이름"(특정 사용자)
+
+지원하는 조건 태그:
+- time==HH:MM              특정 시각 (분 단위)
+- last_message_elapsed>N   마지막 메시지 이후 N초 경과
+- weekday==N-M             요일 범위 (1=월요일 ~ 7=일요일)
+"""
+
+import os
+import re
+import json
+import heapq
+import datetime
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+TIME_PATTERN = re.compile(r"time==(\d{2}):(\d{2})")
+ELAPSED_PATTERN = re.compile(r"last_message_elapsed>(\d+)")
+WEEKDAY_PATTERN = re.compile(r"weekday==(\d)-(\d)")
+
+# 다음 실행 시각 계산 시 조건을 번갈아 맞춰보는 최대 횟수
+MAX_SCHEDULE_STEPS = 32
+
+def minute_start(value: datetime.datetime) -> datetime.datetime:
+    """해당 시각이 속한 분의 시작 시각"""
+    return value.replace(second=0, microsecond=0)
+
+# ───── 조건 객체 ─────
+class TimeCondition:
+    """time==HH:MM 조건"""
+    kind = "time"
+
+    def __init__(self, tag: str, hour: int, minute: int):
+        self.tag = tag
+        self.hour = hour
+        self.minute = minute
+
+    def evaluate(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> bool:
+        return now.hour == self.hour and now.minute == self.minute
+
+    def describe(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> str:
+        return f"⏰ 현재={now.hour:02d}:{now.minute:02d}, 목표={self.hour:02d}:{self.minute:02d}"
+
+    def next_start(self, after: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        """after 이후 조건이 충족되는 가장 이른 시각"""
+        candidate = after.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if candidate + datetime.timedelta(minutes=1) <= after:
+            candidate += datetime.timedelta(days=1)
+        return max(candidate, after)
+
+class ElapsedCondition:
+    """last_message_elapsed>N 조건"""
+    kind = "elapsed"
+
+    def __init__(self, tag: str, seconds: int):
+        self.tag = tag
+        self.seconds = seconds
+
+    def evaluate(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> bool:
+        if last_message_dt is None:
+            return False
+        return (now - last_message_dt).total_seconds() > self.seconds
+
+    def describe(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> str:
+        if last_message_dt is None:
+            return f"⏱️ 마지막 메시지 시간 없음, 목표 > {self.seconds}초"
+        elapsed = (now - last_message_dt).total_seconds()
+        return f"⏱️ 경과={elapsed:.1f}초 ({elapsed/60:.1f}분), 목표 > {self.seconds}초"
+
+    def next_start(self, after: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        """after 이후 조건이 충족되는 가장 이른 시각 (마지막 메시지가 없으면 None)"""
+        if last_message_dt is None:
+            return None
+        threshold = last_message_dt + datetime.timedelta(seconds=self.seconds, microseconds=1)
+        return max(threshold, after)
+
+class WeekdayCondition:
+    """weekday==N-M 조건 (1=월요일 ~ 7=일요일)"""
+    kind = "weekday"
+
+    def __init__(self, tag: str, start_day: int, end_day: int):
+        self.tag = tag
+        self.start_day = start_day
+        self.end_day = end_day
+
+    def evaluate(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> bool:
+        return self.start_day <= now.isoweekday() <= self.end_day
+
+    def describe(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> str:
+        return f"📅 현재={now.isoweekday()}, 범위={self.start_day}-{self.end_day}"
+
+    def next_start(self, after: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        """after 이후 조건이 충족되는 가장 이른 시각 (범위에 해당하는 요일이 없으면 None)"""
+        if self.evaluate(after, last_message_dt):
+            return after
+        midnight = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        for days in range(1, 8):
+            candidate = midnight + datetime.timedelta(days=days)
+            if self.evaluate(candidate, last_message_dt):
+                return candidate
+        return None
+
+class UnknownCondition:
+    """해석할 수 없는 조건 태그 (항상 불충족)"""
+    kind = "unknown"
+
+    def __init__(self, tag: str):
+        self.tag = tag
+
+    def evaluate(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> bool:
+        return False
+
+    def describe(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> str:
+        return "❗ 알 수 없는 조건 태그"
+
+    def next_start(self, after: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        return None
+
+@lru_cache(maxsize=256)
+def compile_condition(tag: str):
+    """
+    조건 태그 문자열을 조건 객체로 변환합니다.
+
+    Args:
+        tag: 조건 태그 (예: "time==08:00")
+
+    Returns:
+        TimeCondition, ElapsedCondition, WeekdayCondition 또는 UnknownCondition
+    """
+    time_match = TIME_PATTERN.match(tag)
+    if time_match:
+        hour, minute = map(int, time_match.groups())
+        return TimeCondition(tag, hour, minute)
+
+    elapsed_match = ELAPSED_PATTERN.match(tag)
+    if elapsed_match:
+        return ElapsedCondition(tag, int(elapsed_match.group(1)))
+
+    weekday_match = WEEKDAY_PATTERN.match(tag)
+    if weekday_match:
+        start_day, end_day = map(int, weekday_match.groups())
+        return WeekdayCondition(tag, start_day, end_day)
+
+    return UnknownCondition(tag)
+
+# ───── 컴파일된 규칙 ─────
+class CompiledRule:
+    """조건 태그가 조건 객체로 컴파일된 명시적 규칙"""
+
+    def __init__(self, rule: Dict[str, Any]):
+        self.rule = rule
+        self.id = rule.get("id", "알 수 없음")
+        self.active = bool(rule.get("active", False))
+        self.conditions = [compile_condition(tag) for tag in rule.get("condition_tags", [])]
+        self.cooldown = max(0, int(rule.get("cooldown", 0) or 0))
+        self.once_per_idle = bool(rule.get("once_per_idle", any(c.kind == "elapsed" for c in self.conditions)))
+        self.channel_id = str(rule["channel"]) if rule.get("channel") else None
+        self.scope = str(rule.get("scope") or "channel")
+
+    @property
+    def unknown_tags(self) -> List[str]:
+        return [c.tag for c in self.conditions if c.kind == "unknown"]
+
+    def evaluate(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> bool:
+        """모든 조건이 충족되는지 평가 (비활성 규칙은 항상 False)"""
+        if not self.active:
+            return False
+        return all(c.evaluate(now, last_message_dt) for c in self.conditions)
+
+    def evaluate_conditions(self, now: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> List[Tuple[Any, bool]]:
+        """조건별 평가 결과 목록 반환 (진단용)"""
+        return [(c, c.evaluate(now, last_message_dt)) for c in self.conditions]
+
+    def next_fire_time(self, after: datetime.datetime, last_message_dt: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        """
+        after 이후 모든 조건이 동시에 충족되는 가장 이른 시각을 계산합니다.
+
+        Args:
+            after: 탐색 시작 시각
+            last_message_dt: 마지막 메시지 시간 (없으면 None)
+
+        Returns:
+            다음 실행 가능 시각 (새 메시지나 규칙 변경 없이는 실행될 수 없으면 None)
+        """
+        if not self.active:
+            return None
+
+        candidate = after
+        for _ in range(MAX_SCHEDULE_STEPS):
+            # 각 조건이 충족되기 시작하는 시각 중 가장 늦은 시각으로 이동
+            starts = [c.next_start(candidate, last_message_dt) for c in self.conditions]
+            if any(start is None for start in starts):
+                return None
+            latest = max(starts, default=candidate)
+            if latest == candidate:
+                return candidate
+            candidate = latest
+        return None
+
+def compile_rules(rules: List[Dict[str, Any]]) -> List[CompiledRule]:
+    """
+    명시적 규칙 목록을 컴파일합니다.
+
+    Args:
+        rules: explicit_rules.json에서 읽은 규칙 목록
+
+    Returns:
+        CompiledRule 목록 (규칙 형식이 아닌 항목은 제외)
+    """
+    return [CompiledRule(rule) for rule in rules if isinstance(rule, dict)]
+
+def parse_message_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    """ISO 형식 메시지 시간 문자열을 datetime으로 변환 (없거나 잘못되면 None)"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+# ───── 채널별/사용자별 마지막 활동 ─────
+class ActivityTracker:
+    """
+    채널별/사용자별 마지막 메시지 시각 저장소
+
+    상태 형식: {"channels": {채널 ID: {"last_message": ISO 시간, "last_user_message": ISO 시간}},
+                "users": {사용자 이름: {"last_message": ISO 시간, "channel": 채널 ID}}}
+    """
+
+    def __init__(self, path: Optional[str] = None, default_channel: Optional[str] = None):
+        self.path = path
+        self.default_channel = str(default_channel) if default_channel else None
+        self.channels: Dict[str, Dict[str, str]] = {}
+        self.users: Dict[str, Dict[str, str]] = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        """파일에서 활동 기록 로드 (파일이 깨졌으면 빈 상태로 시작)"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if not isinstance(state, dict):
+                state = {}
+            self.channels = state.get("channels") if isinstance(state.get("channels"), dict) else {}
+            self.users = state.get("users") if isinstance(state.get("users"), dict) else {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ 활동 기록 로드 실패, 빈 상태로 시작: {self.path} - {e}")
+            self.channels = {}
+            self.users = {}
+
+    def save(self):
+        """활동 기록을 파일에 저장 (바뀐 내용이 있을 때만, 임시 파일에 쓴 뒤 교체)"""
+        if not self.path or not self.dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"channels": self.channels, "users": self.users}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    @staticmethod
+    def _advance(state: Dict[str, str], key: str, value: str) -> bool:
+        """기록된 시각보다 새로운 경우에만 갱신 (시작 시 오래된 기록으로 덮어쓰지 않도록)"""
+        if state.get(key) and state[key] >= value:
+            return False
+        state[key] = value
+        return True
+
+    def record(self, channel_id: str, message_time: str, user_name: Optional[str] = None):
+        """
+        메시지 활동을 기록합니다.
+
+        Args:
+            channel_id: 채널 ID
+            message_time: ISO 형식 메시지 시간
+            user_name: 사용자 이름 (VINA 메시지면 None)
+        """
+        channel_state = self.channels.setdefault(str(channel_id), {})
+        changed = self._advance(channel_state, "last_message", message_time)
+        if user_name:
+            changed = self._advance(channel_state, "last_user_message", message_time) or changed
+            user_state = self.users.setdefault(user_name, {})
+            if self._advance(user_state, "last_message", message_time):
+                user_state["channel"] = str(channel_id)
+                changed = True
+        self.dirty = self.dirty or changed
+
+    def seed(self, records: List[Dict[str, Any]], channel_names: Optional[Dict[str, str]] = None) -> int:
+        """
+        대화 기록으로 활동 시각을 복원합니다.
+
+        예전 기록 중에는 채널 ID 대신 채널 이름이 저장된 것이 있어서,
+        이름은 channel_names로 ID로 바꾸고 바꿀 수 없는 기록은 건너뜁니다
+        (어떤 규칙도 보지 않는 키로 활동이 쌓이지 않도록).
+
+        Args:
+            records: 대화 기록 목록 ({"role", "name", "channel", "time"})
+            channel_names: 채널 이름 -> 채널 ID
+
+        Returns:
+            채널 ID를 알 수 없어 건너뛴 기록 수
+        """
+        skipped = 0
+        for record in records:
+            channel, message_time = record.get("channel"), record.get("time")
+            if channel is None or not message_time:
+                continue
+            channel = str(channel)
+            if not channel.isdigit():
+                channel = (channel_names or {}).get(channel)
+                if channel is None:
+                    skipped += 1
+                    continue
+            self.record(channel, message_time, record.get("name") if record.get("role") == "user" else None)
+        return skipped
+
+    def last_message_time(self, channel_id: Optional[str] = None, user_only: bool = False) -> Optional[str]:
+        """
+        마지막 메시지 시간 문자열을 반환합니다.
+
+        Args:
+            channel_id: 채널 ID (None이면 모든 채널 중 가장 최근)
+            user_only: True면 사용자 메시지만 기준
+
+        Returns:
+            ISO 형식 시간 (기록이 없으면 None)
+        """
+        key = "last_user_message" if user_only else "last_message"
+        if channel_id is None:
+            times = [state[key] for state in self.channels.values() if state.get(key)]
+            return max(times) if times else None
+        return self.channels.get(str(channel_id), {}).get(key)
+
+    def last_message(self, channel_id: Optional[str] = None, user_only: bool = False) -> Optional[datetime.datetime]:
+        """last_message_time의 datetime 버전"""
+        return parse_message_time(self.last_message_time(channel_id, user_only))
+
+    def user_last_message(self, user_name: str) -> Optional[datetime.datetime]:
+        """사용자의 마지막 메시지 시각 (모든 채널 기준)"""
+        return parse_message_time(self.users.get(user_name, {}).get("last_message"))
+
+    def rule_channel(self, rule: CompiledRule) -> Optional[str]:
+        """규칙이 메시지를 보낼 채널 ID (지정하지 않았으면 기본 채널)"""
+        return rule.channel_id or self.default_channel
+
+    def resolve(self, rule: CompiledRule) -> Tuple[Optional[datetime.datetime], Optional[datetime.datetime]]:
+        """
+        규칙의 범위에 맞는 활동 시각을 계산합니다.
+
+        Args:
+            rule: 컴파일된 규칙
+
+        Returns:
+            (경과 시간 기준 마지막 메시지 시각, 공백 구간 기준 마지막 사용자 메시지 시각) 튜플
+        """
+        if rule.scope == "global":
+            return self.last_message(None), self.last_message(None, user_only=True)
+        if rule.scope.startswith("user:"):
+            user_dt = self.user_last_message(rule.scope[len("user:"):])
+            return user_dt, user_dt
+        channel_id = self.rule_channel(rule)
+        return self.last_message(channel_id), self.last_message(channel_id, user_only=True)
+
+# ───── 규칙 실행 상태 ─────
+class RuleStateStore:
+    """
+    규칙별 실행 상태 저장소
+
+    상태 형식: {규칙 ID: {"last_fired": ISO 시간, "fire_count": 실행 횟수,
+                          "idle_anchor": 실행 당시 마지막 사용자 메시지 시간,
+                          "next_fire": 다음 실행 예정 시간}}
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        """파일에서 상태 로드 (파일이 깨졌으면 빈 상태로 시작)"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                states = json.load(f)
+            self.states = states if isinstance(states, dict) else {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ 규칙 실행 상태 로드 실패, 빈 상태로 시작: {self.path} - {e}")
+            self.states = {}
+
+    def save(self):
+        """상태를 파일에 저장 (임시 파일에 쓴 뒤 교체)"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.states, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def get(self, rule_id: str) -> Dict[str, Any]:
+        return self.states.get(rule_id, {})
+
+    def last_fired(self, rule_id: str) -> Optional[datetime.datetime]:
+        return parse_message_time(self.get(rule_id).get("last_fired"))
+
+    def record_fire(self, rule_id: str, now: datetime.datetime, idle_anchor: Optional[datetime.datetime]):
+        """
+        규칙 실행을 기록합니다.
+
+        Args:
+            rule_id: 규칙 ID
+            now: 실행 시각
+            idle_anchor: 실행 당시 마지막 사용자 메시지 시간 (없으면 None)
+        """
+        state = self.states.setdefault(rule_id, {})
+        state["last_fired"] = now.isoformat(timespec="seconds")
+        state["fire_count"] = state.get("fire_count", 0) + 1
+        state["idle_anchor"] = idle_anchor.isoformat(timespec="seconds") if idle_anchor else None
+        state.pop("next_fire", None)
+        self.dirty = True
+
+    def update_next_fire(self, next_fire: Dict[str, datetime.datetime]):
+        """
+        규칙별 다음 실행 예정 시각을 기록합니다 (예약이 없는 규칙은 기록 삭제).
+
+        Args:
+            next_fire: 규칙 ID -> 다음 실행 예정 시각
+        """
+        for rule_id in set(self.states) | set(next_fire):
+            fire_time = next_fire.get(rule_id)
+            value = fire_time.isoformat(timespec="seconds") if fire_time else None
+            state = self.states.get(rule_id, {})
+            if state.get("next_fire") == value:
+                continue
+            if value:
+                self.states.setdefault(rule_id, {})["next_fire"] = value
+            else:
+                state.pop("next_fire", None)
+            self.dirty = True
+
+    def missed_rules(self, now: datetime.datetime, grace_seconds: float = 60) -> List[Tuple[str, datetime.datetime]]:
+        """
+        저장된 예약 시각이 지났는데 실행 기록이 없는 규칙 (꺼져 있는 동안 지나간 예약)
+
+        지나간 예약 중에도 경과 시간 규칙처럼 지금 다시 계산하면 바로 실행되는 규칙이 있으므로,
+        실제로 건너뛰는 예약만 알려면 RuleScheduler.missed_rules를 사용합니다.
+
+        Args:
+            now: 현재 시각
+            grace_seconds: 예약 시각 이후 아직 실행 중일 수 있는 여유 시간 (초)
+
+        Returns:
+            (규칙 ID, 놓친 예약 시각) 목록
+        """
+        missed = []
+        for rule_id, state in self.states.items():
+            fire_time = parse_message_time(state.get("next_fire"))
+            if fire_time and (now - fire_time).total_seconds() > grace_seconds:
+                missed.append((rule_id, fire_time))
+        return sorted(missed, key=lambda item: item[1])
+
+    def waiting_for_message(self, rule: CompiledRule, idle_anchor: Optional[datetime.datetime]) -> bool:
+        """이번 대화 공백 구간에 이미 실행되어 새 사용자 메시지를 기다리는 중인지 여부"""
+        if not rule.once_per_idle or rule.id not in self.states:
+            return False
+        anchor = idle_anchor.isoformat(timespec="seconds") if idle_anchor else None
+        return self.get(rule.id).get("idle_anchor") == anchor
+
+    def earliest_allowed(self, rule: CompiledRule, now: datetime.datetime,
+                         idle_anchor: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+        """
+        실행 제한을 고려해서 규칙이 다시 실행될 수 있는 가장 이른 시각을 계산합니다.
+
+        Args:
+            rule: 컴파일된 규칙
+            now: 현재 시각
+            idle_anchor: 마지막 사용자 메시지 시간 (없으면 None)
+
+        Returns:
+            실행 가능 시각 (새 사용자 메시지를 기다려야 하면 None)
+        """
+        last_fired = self.last_fired(rule.id)
+        if last_fired is None:
+            return now
+        if self.waiting_for_message(rule, idle_anchor):
+            return None
+
+        # 같은 분 안에서는 다시 실행하지 않음 + 쿨다운
+        allowed = minute_start(last_fired) + datetime.timedelta(minutes=1)
+        allowed = max(allowed, last_fired + datetime.timedelta(seconds=rule.cooldown))
+        return max(now, allowed)
+
+# ───── 다음 실행 시각 스케줄러 ─────
+class RuleScheduler:
+    """
+    컴파일된 규칙의 다음 실행 시각을 힙으로 관리하는 스케줄러
+
+    실행 제한(같은 분 중복 방지, 쿨다운, 대화 공백 구간당 한 번)은
+    RuleStateStore에 기록된 실행 상태를 기준으로 적용합니다.
+    """
+
+    def __init__(self, state: Optional[RuleStateStore] = None):
+        self.heap = []
+        self.state = state or RuleStateStore()
+        self.next_fire: Dict[str, datetime.datetime] = {}
+        self.idle_anchors: Dict[str, Optional[datetime.datetime]] = {}
+        self.retry_after: Dict[str, datetime.datetime] = {}
+
+    def rebuild(self, compiled_rules: List[CompiledRule], now: datetime.datetime,
+                last_message_dt: Optional[datetime.datetime] = None, idle_anchor: Optional[datetime.datetime] = None,
+                activity: Optional[ActivityTracker] = None):
+        """
+        모든 규칙의 다음 실행 시각을 다시 계산합니다.
+
+        Args:
+            compiled_rules: 컴파일된 규칙 목록
+            now: 현재 시각
+            last_message_dt: 마지막 메시지 시간 (없으면 None, activity가 있으면 무시)
+            idle_anchor: 마지막 사용자 메시지 시간 (없으면 None, activity가 있으면 무시)
+            activity: 채널별 활동 기록 (있으면 규칙마다 대상 채널/사용자 기준 시각 사용)
+        """
+        self.heap = []
+        self.next_fire = {}
+        self.idle_anchors = {}
+        for order, rule in enumerate(compiled_rules):
+            rule_last_dt, rule_anchor = activity.resolve(rule) if activity else (last_message_dt, idle_anchor)
+            self.idle_anchors[rule.id] = rule_anchor
+            after = self.state.earliest_allowed(rule, now, rule_anchor)
+            if after is None:
+                continue
+            retry_at = self.retry_after.get(rule.id)
+            if retry_at and retry_at > after:
+                after = retry_at
+            fire_time = rule.next_fire_time(after, rule_last_dt)
+            if fire_time is not None:
+                self.heap.append((fire_time, order, rule))
+                self.next_fire[rule.id] = fire_time
+        heapq.heapify(self.heap)
+        self.state.update_next_fire(self.next_fire)
+
+    def next_time(self) -> Optional[datetime.datetime]:
+        """가장 이른 실행 예정 시각 (예약된 규칙이 없으면 None)"""
+        return self.heap[0][0] if self.heap else None
+
+    def peek(self) -> Optional[Tuple[datetime.datetime, CompiledRule]]:
+        """가장 이른 (실행 예정 시각, 규칙) 반환"""
+        if not self.heap:
+            return None
+        fire_time, _, rule = self.heap[0]
+        return fire_time, rule
+
+    def pop_due(self, now: datetime.datetime, idle_anchor: Optional[datetime.datetime] = None,
+                record: bool = True) -> List[CompiledRule]:
+        """
+        실행 시각이 된 규칙을 꺼냅니다.
+
+        Args:
+            now: 현재 시각
+            idle_anchor: 마지막 사용자 메시지 시간 (rebuild에서 규칙별로 계산한 값이 없을 때 사용)
+            record: True면 꺼내는 즉시 실행 상태에 기록
+                    (False면 실행 결과에 따라 record_fire 또는 defer를 호출해야 함)
+
+        Returns:
+            지금 실행해야 할 규칙 목록 (예약 순서대로)
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, rule = heapq.heappop(self.heap)
+            self.next_fire.pop(rule.id, None)
+            if record:
+                self.record_fire(rule, now, idle_anchor)
+            due.append(rule)
+        return due
+
+    def record_fire(self, rule: CompiledRule, now: datetime.datetime,
+                    idle_anchor: Optional[datetime.datetime] = None):
+        """규칙 실행 성공을 실행 상태에 기록 (쿨다운과 공백 구간 제한이 이 기록부터 적용됨)"""
+        self.retry_after.pop(rule.id, None)
+        self.state.record_fire(rule.id, now, self.idle_anchors.get(rule.id, idle_anchor))
+
+    def defer(self, rule: CompiledRule, retry_at: datetime.datetime):
+        """실행에 실패한 규칙을 retry_at 이후로 다시 예약 (실행 기록은 남기지 않음)"""
+        self.retry_after[rule.id] = retry_at
+
+    def missed_rules(self, compiled_rules: List[CompiledRule], now: datetime.datetime,
+                     activity: Optional[ActivityTracker] = None, grace_seconds: float = 60) -> List[Tuple[str, datetime.datetime]]:
+        """
+        꺼져 있는 동안 지나가서 실행되지 않고 건너뛰는 예약 목록 (재시작 시 확인용)
+
+        저장된 예약 시각이 지났더라도 지금 다시 계산해서 바로 실행되는 규칙
+        (예: 경과 시간 조건은 계속 충족된 상태)은 놓친 것이 아니므로 제외합니다.
+
+        Args:
+            compiled_rules: 컴파일된 규칙 목록
+            now: 현재 시각
+            activity: 채널별 활동 기록 (없으면 마지막 메시지 시간 없이 계산)
+            grace_seconds: 예약 시각 이후 아직 실행 중일 수 있는 여유 시간 (초)
+
+        Returns:
+            (규칙 ID, 지나간 예약 시각) 목록
+        """
+        rules = {rule.id: rule for rule in compiled_rules}
+        missed = []
+        for rule_id, fire_time in self.state.missed_rules(now, grace_seconds):
+            rule = rules.get(rule_id)
+            if rule is not None:
+                last_dt, idle_anchor = activity.resolve(rule) if activity else (None, None)
+                after = self.state.earliest_allowed(rule, now, idle_anchor)
+                if after is not None and rule.next_fire_time(after, last_dt) == now:
+                    continue
+            missed.append((rule_id, fire_time))
+        return missed
+
+    def seconds_until_next(self, now: datetime.datetime, max_sleep: float) -> float:
+        """다음 실행 시각까지 남은 초 (최대 max_sleep)"""
+        next_time = self.next_time()
+        if next_time is None:
+            return max_sleep
+        return min(max(0.0, (next_time - now).total_seconds()), max_sleep)